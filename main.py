@@ -1,101 +1,322 @@
-prompt_template = '''
-You are an expert in converting natural language descriptions of events into structured annotations using a predefined Hierarchical Event Descriptor (HED) vocabulary. Your task is to extract relevant concepts from the input description and represent them as a comma-separated list of HED tags, strictly adhering to the provided vocabulary.
-
-**Crucial Constraints:**
-* **Vocabulary Adherence:** You MUST ONLY use tags (single terms) found in the provided HED vocabulary schema. Do not introduce any new words, synonyms, or full hierarchical paths in the annotation. When a concept maps to a hierarchical tag, use only the **most specific (leaf) tag** from the hierarchy.
-* **Output Format:** Your output must be a comma-separated list of HED tags. Each tag or nested group of tags should be enclosed in parentheses `()`. For tags that take a value (indicated by `#` in the schema), replace `#` with the appropriate value from the description.
-* **Completeness:** Capture all relevant information from the input description using the vocabulary.
-* **Conciseness:** Avoid redundant tags.
-* **No Explanations:** Do not provide any conversational filler, explanations, or additional text beyond the annotations themselves, *except for the reasoning process requested below*.
-* **Handling Unmappable Concepts:** If a concept in the description cannot be mapped to any tag in the vocabulary, omit it. Do not invent tags or try to approximate.
-
-**Reasoning Process (Output this first, then the Annotation):**
-Before providing the final annotation, detail your thought process in the following steps:
-1.  **Breakdown:** Identify the key elements or phrases in the description that represent distinct concepts.
-2.  **Mapping:** For each key element, find the most specific corresponding tag in the provided HED vocabulary schema. If a concept cannot be mapped, note it as unmappable.
-3.  **Structuring:** Determine how the identified tags should be grouped or nested according to HED conventions (e.g., (Object, Action, Object) or (Main_Event, (Property, Value))).
-
-**HED Vocabulary Schema:**
-{{hed_vocab}}
-
-**Examples:**
-
-Description: The foreground view consists of a large number of ingestible objects, indicating a high quantity. The background view includes an adult human body, outdoors in a setting that includes furnishings, natural features such as the sky, and man-made objects in an urban environment
-
---- REASONING PROCESS START ---
-1.  **Breakdown**: The description includes elements about visual perspective (foreground/background), quantity, types of objects, human characteristics, environmental setting, and urban features.
-2.  **Mapping**:
-    * "foreground view": `Foreground-view`
-    * "large number": `Item-count`, `High`
-    * "ingestible objects": `Ingestible-object`
-    * "background view": `Background-view`
-    * "adult human body": `Human`, `Body`
-    * "outdoors": `Outdoors`
-    * "furnishings": `Furnishing`
-    * "natural features": `Natural-feature` (since "sky" isn't a leaf tag, use parent)
-    * "man-made objects": `Man-made-object`
-    * "urban environment": `Urban`
-3.  **Structuring**: Group related visual elements, quantify, specify human attributes, and categorize environmental aspects.
---- REASONING PROCESS END ---
-
---- ANNOTATION START ---
-(Foreground-view, (Item-count, High), Ingestible-object), (Background-view, (Human, Body, Outdoors, Furnishing, Natural-feature, Urban, Man-made-object)
---- ANNOTATION END ---
-
-Description from user:
-{{description}}
-
---- REASONING PROCESS START ---
---- REASONING PROCESS END ---
-
---- ANNOTATION START ---
---- ANNOTATION END ---
-'''
-
-from ollama import chat
-from ollama import ChatResponse
-from google import genai
-
-from jinja2 import Template
-from dotenv import load_dotenv
-load_dotenv()
-import os
-# load the HED vocabulary from HED_vocab_reformatted.xml into a string
-hed_vocab = ''
-with open('HED_vocab_reformatted.xml', 'r') as file:
-    hed_vocab = file.read()
-
-# render the jinja template from prompt_template variable
-template = Template(prompt_template)
-
-query = 'A participant is looking at a computer screen displaying an image of a red car.'
-
-prompt = template.render(hed_vocab=hed_vocab, description=query)
-
-# The client gets the API key from the environment variable `GEMINI_API_KEY`.
-client = genai.Client()
-
-model = 'qwen3:8b'
-# call the chat function with the model and the prompt
-response: ChatResponse = chat(model=model, messages=[
-  {
-    'role': 'user',
-    'content': prompt,
-  },
-])
-print(response['message']['content'])
-
-# save the prompt template and model response to a json file
+"""Command line entry point for running HED annotation experiments."""
+import argparse
 import json
-i = 0
-filename = 'prompt_experiments/experiment_'
-while os.path.exists(f'{filename}{i}.json'):
-    i += 1
-
-with open(f'{filename}{i}.json', 'w') as f:
-    json.dump({
-        'model': model,
-        'prompt_template': prompt_template,
-        'model_response': response['message']['content']
-    }, f)
+import sys
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+# The web app modules live next to app.py and import each other by name
+sys.path.insert(0, str(Path(__file__).parent / 'web'))
+load_dotenv(Path(__file__).parent / '.env')
+
+
+def read_lines(path):
+    """Read non-empty lines from a text file"""
+    with open(path, 'r') as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def read_templates(paths):
+    """Read prompt templates from files, falling back to the default template"""
+    import app
+
+    if not paths:
+        return [app.DEFAULT_PROMPT_TEMPLATE]
+    templates = []
+    for path in paths:
+        with open(path, 'r') as f:
+            templates.append(f.read())
+    return templates
+
+
+def cmd_batch(args):
+    """Run descriptions x models x templates and print results as they finish"""
+    import app
+    from batch_runner import BatchRunner, build_cells
+
+    descriptions = list(args.description or [])
+    if args.descriptions_file:
+        descriptions += read_lines(args.descriptions_file)
+    if not descriptions:
+        print('At least one description is required (--description or --descriptions-file)', file=sys.stderr)
+        return 1
+
+    backend_limits = {}
+    if args.ollama_concurrency:
+        backend_limits['ollama'] = args.ollama_concurrency
+    if args.gemini_concurrency:
+        backend_limits['gemini'] = args.gemini_concurrency
+
+    vocab_retrieval = {'top_k': args.top_k} if args.vocab_retrieval else None
+    self_consistency = {'samples': args.samples, 'quorum': args.quorum} if args.samples > 1 else None
+    structured_output = {'constrain_tags': args.constrain_tags} if args.structured or args.constrain_tags else None
+    cells = build_cells(descriptions, args.model or ['qwen3:8b'], read_templates(args.template))
+    runner = BatchRunner(
+        lambda cell: app.execute_experiment(cell['model'], cell['prompt_template'], cell['description'], args.name,
+                                            use_cache=args.cache, bypass_cache=args.bypass_cache,
+                                            vocab_retrieval=vocab_retrieval, self_consistency=self_consistency,
+                                            structured_output=structured_output, prefix_cache=args.prefix_cache),
+        max_workers=args.max_workers,
+        backend_limits=backend_limits
+    )
+
+    output = open(args.output, 'a') if args.output else None
+    failures = 0
+    try:
+        for completed, cell in enumerate(runner.run(cells), start=1):
+            cell.pop('prompt_template', None)
+            result = cell.get('result') or {}
+            result.pop('prompt', None)
+            if 'error' in cell:
+                failures += 1
+                status = f"error: {cell['error']}"
+            else:
+                status = (f"{result.get('filename')} issues={result.get('validation_issues')} "
+                          f"score={(result.get('quality_grade') or {}).get('score')} "
+                          f"time={result.get('inference_time', 0):.2f}s")
+            print(f"[{completed}/{len(cells)}] {cell['model']} template#{cell['template_index']}: {status}")
+            if output:
+                output.write(json.dumps(cell) + '\n')
+                output.flush()
+    finally:
+        if output:
+            output.close()
+    return 1 if failures else 0
+
+
+def cmd_migrate(args):
+    """Import legacy experiment_*.json files into the experiment store"""
+    from experiment_store import ExperimentStore, DEFAULT_DB_PATH, EXPERIMENTS_DIR, read_current_vocab
+
+    store = ExperimentStore(args.db or DEFAULT_DB_PATH)
+    hed_vocab = read_current_vocab()
+    imported, skipped, failed = store.migrate_json_dir(args.source or EXPERIMENTS_DIR, remove=args.remove,
+                                                       hed_vocab=hed_vocab)
+    compacted = store.compact(hed_vocab)
+    print(f"Imported {imported}, skipped {skipped} already present, {failed} failed -> {store.db_path}")
+    print(f"Moved prompts of {compacted} stored experiments into the blob store: {store.storage_stats()}")
+    return 1 if failed else 0
+
+
+def cmd_stats(args):
+    """Print per-group aggregates of stored experiments, or export the analytics columns"""
+    from analytics import get_columnar_cache
+
+    cache = get_columnar_cache()
+    if args.export:
+        with open(args.export, 'wb') as f:
+            f.write(cache.export())
+        print(f"Exported {cache.info()['experiments']} experiments to {args.export}")
+        return 0
+    filters = {key: getattr(args, key) for key in ('model', 'template', 'name', 'since', 'until') if getattr(args, key)}
+    try:
+        result = cache.stats(group_by=[g.strip() for g in args.group_by.split(',') if g.strip()], **filters)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+    print(json.dumps(result, indent=2))
+    return 0
+
+
+def cmd_gold(args):
+    """Import gold annotations from a JSON file, or print the stored ones"""
+    from experiment_store import get_store
+
+    store = get_store()
+    if not args.file:
+        print(json.dumps(store.list_gold_annotations(), indent=2))
+        return 0
+    with open(args.file, 'r') as f:
+        entries = json.load(f)
+    # Either [{"description": ..., "annotation": ...}] or {description: annotation}
+    if isinstance(entries, dict):
+        entries = [{'description': description, 'annotation': annotation} for description, annotation in entries.items()]
+    for entry in entries:
+        store.set_gold_annotation(entry['description'], entry.get('annotation'))
+    print(f"Stored {len(entries)} gold annotations ({len(store.gold_annotations())} in total)")
+    return 0
+
+
+def cmd_rescore(args):
+    """Re-validate and/or re-grade stored experiments, resuming from a checkpoint if asked"""
+    import app
+    from rescore import RescoreJob, select_filenames
+
+    store = app.get_store()
+    options = {'grader_model': args.grader_model or app.GRADER_MODEL, 'use_cache': args.cache,
+               'bypass_cache': args.bypass_cache, 'grading_batch_size': args.grading_batch_size,
+               'llm_grading': args.llm_grading}
+    workers = {}
+    if args.validation_workers:
+        workers['validation_workers'] = args.validation_workers
+    if args.grading_workers:
+        workers['grading_workers'] = args.grading_workers
+
+    if args.resume:
+        job = RescoreJob.resume(args.resume, store, **workers)
+        job.grade_fn = app.rescore_grade_fn(job.options)
+        job.grade_batch_fn = app.rescore_grade_batch_fn(job.options)
+    else:
+        if not args.validate and not args.grade:
+            print('Nothing to do: both --no-validate and --no-grade were given', file=sys.stderr)
+            return 1
+        filters = {'model': args.model, 'name': args.name, 'since': args.since, 'until': args.until}
+        filenames = select_filenames(store, args.filename, **filters)
+        job = RescoreJob(filenames, store, grade_fn=app.rescore_grade_fn(options),
+                         grade_batch_fn=app.rescore_grade_batch_fn(options), validate=args.validate,
+                         grade=args.grade, options=options, **workers)
+
+    print(f"Rescore job {job.job_id}: {len(job.filenames) - len(job.done)} of {len(job.filenames)} experiments to do")
+
+    def report(progress):
+        print(f"\r[{progress['done']}/{progress['total']}] failed={progress['failed']}", end='', flush=True)
+
+    try:
+        progress = job.run(on_progress=report)
+    except KeyboardInterrupt:
+        print(f"\nInterrupted; resume with: main.py rescore --resume {job.job_id}")
+        return 130
+    print(f"\n{progress['status']}: {progress['done']} done, {progress['skipped']} without annotation, "
+          f"{progress['failed']} failed -> {job.checkpoint_path}")
+    return 1 if progress['failed'] else 0
+
+
+def cmd_bench(args):
+    """Benchmark the pipeline against the mock LLM server and check it against a baseline"""
+    import tempfile
+    from benchmark import configure_environment, run_benchmark, compare_to_baseline, format_report, load_baseline
+    from mock_llm import MockLLMServer
+
+    mock_config = {'latency': args.latency, 'token_rate': args.token_rate, 'prefill_rate': args.prefill_rate,
+                   'parallel': args.parallel}
+    with tempfile.TemporaryDirectory(prefix='hed-bench-') as workdir, MockLLMServer(**mock_config) as server:
+        configure_environment(workdir, server.url)
+        # Imported only now so the app picks up the mock server and the throwaway stores
+        import app
+        from atomic_io import write_json_atomic
+
+        levels = [int(level) for level in args.concurrency.split(',')]
+        report = run_benchmark(app, levels, args.requests, args.model or ['qwen3:8b'],
+                               vocab_retrieval=args.vocab_retrieval, mock_config=mock_config)
+
+    print(format_report(report))
+    if args.output:
+        write_json_atomic(args.output, report)
+    if args.save_baseline:
+        write_json_atomic(args.baseline, report)
+        print(f"Saved baseline to {args.baseline}")
+        return 0
+    if not Path(args.baseline).exists():
+        print(f"No baseline at {args.baseline}; run with --save-baseline to record one")
+        return 0
+    regressions = compare_to_baseline(report, load_baseline(args.baseline), tolerance=args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION: {regression}")
+    if not regressions:
+        print(f"No regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+    return 1 if regressions else 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='HED annotation prompt experiments')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    batch = subparsers.add_parser('batch', help='Run a batch of experiments concurrently')
+    batch.add_argument('-d', '--description', action='append', help='Description to annotate (repeatable)')
+    batch.add_argument('-f', '--descriptions-file', help='File with one description per line')
+    batch.add_argument('-m', '--model', action='append', help='Model to run (repeatable, default qwen3:8b)')
+    batch.add_argument('-t', '--template', action='append', help='Prompt template file (repeatable, default built-in)')
+    batch.add_argument('-n', '--name', default='', help='Experiment name recorded on every run')
+    batch.add_argument('--max-workers', type=int, help='Total concurrent calls')
+    batch.add_argument('--ollama-concurrency', type=int, help='Concurrent calls to Ollama')
+    batch.add_argument('--gemini-concurrency', type=int, help='Concurrent calls to Gemini')
+    batch.add_argument('-o', '--output', help='Append results to this JSONL file')
+    batch.add_argument('--cache', action=argparse.BooleanOptionalAction, default=None,
+                       help='Serve repeated prompts from the response cache (default: RESPONSE_CACHE setting)')
+    batch.add_argument('--bypass-cache', action='store_true', help='Skip cache lookups but refresh cached responses')
+    batch.add_argument('--vocab-retrieval', action='store_true', help='Render only the vocab tags relevant to each description')
+    batch.add_argument('--top-k', type=int, default=40, help='Tags selected per description with --vocab-retrieval')
+    batch.add_argument('--samples', type=int, default=1,
+                       help='Samples per cell; above 1 the annotation a quorum of samples agrees on is kept')
+    batch.add_argument('--quorum', type=int, help='Agreeing samples needed to stop early (default majority)')
+    batch.add_argument('--structured', action='store_true',
+                       help='Have the model answer in JSON {reasoning, annotation} instead of marked sections')
+    batch.add_argument('--constrain-tags', action='store_true',
+                       help='With --structured, only allow tag names from the vocabulary (implies --structured)')
+    batch.add_argument('--prefix-cache', action=argparse.BooleanOptionalAction, default=None,
+                       help='Send the static vocab/instructions prefix separately so the model server reuses its '
+                            'prefill (default: PREFIX_CACHE setting)')
+    batch.set_defaults(func=cmd_batch)
+
+    migrate = subparsers.add_parser('migrate', help='Import experiment JSON files into the experiment store')
+    migrate.add_argument('--source', help='Directory of experiment JSON files (default prompt_experiments/)')
+    migrate.add_argument('--db', help='SQLite database path (default prompt_experiments/experiments.db)')
+    migrate.add_argument('--remove', action='store_true', help='Delete each JSON file once it is imported')
+    migrate.set_defaults(func=cmd_migrate)
+
+    stats = subparsers.add_parser('stats', help='Aggregate stored experiments per model x template')
+    stats.add_argument('--group-by', default='model,template', help='Comma-separated groups: model, template, name')
+    stats.add_argument('-m', '--model', help='Only experiments run with this model')
+    stats.add_argument('--template', help='Only experiments whose template hash starts with this')
+    stats.add_argument('-n', '--name', help='Only experiments whose name contains this text')
+    stats.add_argument('--since', help='Only experiments from this ISO timestamp on')
+    stats.add_argument('--until', help='Only experiments up to this ISO timestamp')
+    stats.add_argument('--export', metavar='PATH', help='Write the analytics columns to a NumPy .npz file instead')
+    stats.set_defaults(func=cmd_stats)
+
+    gold = subparsers.add_parser('gold', help='Import or list gold annotations used for reference scoring')
+    gold.add_argument('file', nargs='?',
+                      help='JSON list of {description, annotation} or {description: annotation} object to import')
+    gold.set_defaults(func=cmd_gold)
+
+    rescore = subparsers.add_parser('rescore', help='Re-validate and/or re-grade stored experiments')
+    rescore.add_argument('--filename', action='append', help='Experiment to rescore (repeatable, default all matching)')
+    rescore.add_argument('-m', '--model', help='Only experiments run with this model')
+    rescore.add_argument('-n', '--name', help='Only experiments whose name contains this text')
+    rescore.add_argument('--since', help='Only experiments from this ISO timestamp on')
+    rescore.add_argument('--until', help='Only experiments up to this ISO timestamp')
+    rescore.add_argument('--validate', action=argparse.BooleanOptionalAction, default=True,
+                         help='Re-run HED validation (default on)')
+    rescore.add_argument('--grade', action=argparse.BooleanOptionalAction, default=True,
+                         help='Re-run LLM grading (default on)')
+    rescore.add_argument('--grader-model', help='Model used for grading (default: GRADER_MODEL, mistral:latest)')
+    rescore.add_argument('--validation-workers', type=int, help='Validation threads')
+    rescore.add_argument('--grading-workers', type=int, help='Concurrent grading calls')
+    rescore.add_argument('--grading-batch-size', type=int, default=1,
+                         help='Experiments graded per structured grader call (default 1: one call each)')
+    rescore.add_argument('--cache', action=argparse.BooleanOptionalAction, default=None,
+                         help='Serve repeated grading prompts from the response cache')
+    rescore.add_argument('--bypass-cache', action='store_true', help='Skip cache lookups but refresh cached responses')
+    rescore.add_argument('--llm-grading', choices=['auto', 'always', 'never'],
+                         help='Ask the LLM grader only without a gold annotation (auto), also as a second opinion '
+                              '(always) or never (default: LLM_GRADING setting)')
+    rescore.add_argument('--resume', metavar='JOB_ID', help='Resume an interrupted job from its checkpoint')
+    rescore.set_defaults(func=cmd_rescore)
+
+    bench = subparsers.add_parser('bench', help='Benchmark the pipeline against a local mock LLM')
+    bench.add_argument('-c', '--concurrency', default='1,4,16', help='Comma-separated concurrency levels')
+    bench.add_argument('-r', '--requests', type=int, default=32, help='Requests per concurrency level')
+    bench.add_argument('-m', '--model', action='append', help='Model name to request (repeatable, default qwen3:8b)')
+    bench.add_argument('--latency', type=float, default=0.05, help='Mock time to first token in seconds')
+    bench.add_argument('--token-rate', type=float, default=200.0, help='Mock response tokens per second')
+    bench.add_argument('--prefill-rate', type=float, default=0.0, help='Mock prompt tokens per second (0: free)')
+    bench.add_argument('--parallel', type=int, default=4, help='Generations the mock server runs at once')
+    bench.add_argument('--vocab-retrieval', action='store_true', help='Render pruned vocabularies')
+    bench.add_argument('--baseline', default=str(Path(__file__).parent / 'benchmark_baseline.json'),
+                       help='Baseline report to compare against')
+    bench.add_argument('--save-baseline', action='store_true', help='Store this run as the baseline')
+    bench.add_argument('--tolerance', type=float, default=0.2, help='Allowed relative regression')
+    bench.add_argument('-o', '--output', help='Write the full JSON report here')
+    bench.set_defaults(func=cmd_bench)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
 
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,17 @@
+"""Point the app at a mock model server and throwaway stores before any module reads its settings."""
+import tempfile
+
+import pytest
+
+import benchmark
+from mock_llm import MockLLMServer
+
+mock_llm = MockLLMServer(token_rate=0, latency=0.001).start()
+benchmark.configure_environment(tempfile.mkdtemp(prefix='prompt-experiment-tests-'), mock_llm.url)
+
+
+@pytest.fixture(scope='session')
+def app_module():
+    """The app module, imported once against the mock server"""
+    import app
+    return app
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from analytics import ColumnarCache, grouped_summary
+from experiment_store import ExperimentStore
+
+
+def reference_summary(codes, values, group_count, percentiles):
+    """The same statistics computed group by group with plain NumPy"""
+    rows = []
+    for group in range(group_count):
+        group_values = values[(codes == group) & ~np.isnan(values)]
+        if not len(group_values):
+            rows.append(None)
+            continue
+        rows.append({'count': len(group_values), 'mean': group_values.mean(), 'min': group_values.min(),
+                     'max': group_values.max(),
+                     **{f'p{q:g}': np.percentile(group_values, q) for q in percentiles}})
+    return rows
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_grouped_summary_matches_numpy(seed):
+    rng = np.random.default_rng(seed)
+    group_count = 7
+    codes = rng.integers(0, group_count - 1, size=500)  # the last group stays empty
+    values = rng.normal(5, 3, size=500)
+    values[rng.random(500) < 0.1] = np.nan
+    percentiles = (0, 25, 50, 90, 95, 99.5, 100)
+
+    summary = grouped_summary(codes, values, group_count, percentiles)
+    for group, expected in enumerate(reference_summary(codes, values, group_count, percentiles)):
+        if expected is None:
+            assert summary['count'][group] == 0
+            assert all(np.isnan(summary[stat][group]) for stat in summary if stat != 'count')
+            continue
+        for stat, value in expected.items():
+            assert summary[stat][group] == pytest.approx(value), (group, stat)
+
+
+def test_grouped_summary_single_values_and_all_nan():
+    codes = np.array([0, 1, 1, 2])
+    values = np.array([4.0, np.nan, np.nan, 2.0])
+    summary = grouped_summary(codes, values, 3, (50, 90))
+    assert summary['count'].tolist() == [1, 0, 1]
+    assert summary['p90'][0] == 4.0 and summary['p50'][2] == 2.0
+    assert np.isnan(summary['mean'][1])
+
+    empty = grouped_summary(np.array([0, 1]), np.array([np.nan, np.nan]), 2, (50,))
+    assert empty['count'].tolist() == [0, 0]
+    assert np.isnan(empty['p50']).all()
+
+
+def test_unmeasured_validation_issues_are_skipped(tmp_path):
+    store = ExperimentStore(tmp_path / 'experiments.db')
+    for issues in (0, 2, -1):
+        store.save({'model': 'qwen3:8b', 'timestamp': '2025-01-01T12:00:00', 'inference_time': 1.0,
+                    'validation_issues': issues, 'annotation': 'Sensory-event', 'quality_grade': {'score': 5.0}})
+
+    stats = ColumnarCache(store).stats(group_by=('model',))
+    group, = stats['groups']
+    assert group['runs'] == 3
+    assert group['validation_issues']['count'] == 2
+    assert group['validation_issues']['mean'] == 1.0
+    assert group['validation_issues']['min'] == 0.0
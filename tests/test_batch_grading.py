@@ -0,0 +1,88 @@
+import json
+import re
+
+from batch_grading import BatchGrader, build_batch_prompt, parse_batch_scores, plan_batches
+
+
+def items(count):
+    return [(index, f'description {index}', f'Annotation-{index}') for index in range(count)]
+
+
+def prompt_ids(prompt):
+    return re.findall(r'^\[item (\S+)\]$', prompt, re.MULTILINE)
+
+
+def answer(ids, skip=()):
+    return json.dumps({'scores': [{'id': item_id, 'score': int(item_id) % 11, 'reason': f'reason {item_id}'}
+                                  for item_id in ids if item_id not in skip]})
+
+
+def test_full_batch_is_one_request():
+    prompts = []
+
+    def grade_prompt(prompt):
+        prompts.append(prompt)
+        return answer(prompt_ids(prompt)), False
+
+    grader = BatchGrader(grade_prompt, batch_size=8)
+    grades = grader.grade(items(8))
+    assert len(prompts) == 1
+    assert {item_id: grade['score'] for item_id, grade in grades.items()} == {str(i): i % 11 for i in range(8)}
+    assert all(grade['batch_size'] == 8 for grade in grades.values())
+    assert grader.stats() == {'requests': 1, 'splits': 0, 'fallbacks': 0}
+
+
+def test_unscored_items_are_split_and_retried():
+    def grade_prompt(prompt):
+        ids = prompt_ids(prompt)
+        # Like a truncated prompt: a large batch loses its last items
+        return answer(ids, skip=ids[3:] if len(ids) > 3 else ()), False
+
+    grader = BatchGrader(grade_prompt, batch_size=8)
+    grades = grader.grade(items(8))
+    assert sorted(grades, key=int) == [str(i) for i in range(8)]
+    assert all(grade['score'] == int(item_id) % 11 for item_id, grade in grades.items())
+    assert grader.stats()['splits'] >= 1
+    assert grader.stats()['fallbacks'] == 0
+
+
+def test_single_item_falls_back_to_free_text_grader():
+    singles = []
+
+    def grade_prompt(prompt):
+        ids = prompt_ids(prompt)
+        return answer(ids, skip={'5'}), False
+
+    def grade_single(description, annotation):
+        singles.append(description)
+        return {'score': 7.0, 'full_response': '7/10', 'cache_hit': False}
+
+    grader = BatchGrader(grade_prompt, grade_single, batch_size=8)
+    grades = grader.grade(items(8))
+    assert singles == ['description 5']
+    assert grades['5'] == {'score': 7.0, 'full_response': '7/10', 'cache_hit': False, 'batch_size': 1}
+    assert grader.stats()['fallbacks'] == 1
+
+
+def test_failed_requests_without_fallback_are_errors():
+    def grade_prompt(prompt):
+        raise ConnectionError('grader down')
+
+    grades = BatchGrader(grade_prompt, batch_size=4).grade(items(4))
+    assert all(grade['score'] is None and grade['full_response'] == 'Error: grader down' for grade in grades.values())
+
+
+def test_plan_batches_respects_size_and_context():
+    assert [len(batch) for batch in plan_batches(items(10), batch_size=4, context_tokens=100000)] == [4, 4, 2]
+    long_items = [(i, 'word ' * 300, 'Tag') for i in range(6)]
+    batches = plan_batches(long_items, batch_size=6, context_tokens=1024)
+    assert all(len(batch) < 6 for batch in batches)
+    assert sum(len(batch) for batch in batches) == 6
+
+
+def test_parse_batch_scores_drops_invalid_entries():
+    text = json.dumps({'scores': [{'id': 'item 1', 'score': 8, 'reason': 'ok'}, {'id': '1', 'score': 2},
+                                  {'id': '2', 'score': 11}, {'id': '3', 'score': True}, {'id': '9', 'score': 5}]})
+    assert parse_batch_scores(text, ['1', '2', '3']) == {'1': {'score': 8.0, 'reason': 'ok'}}
+    assert parse_batch_scores('not json', ['1']) == {}
+    assert prompt_ids(build_batch_prompt(items(3))) == ['0', '1', '2']
@@ -0,0 +1,85 @@
+import pytest
+
+from description_search import DescriptionIndex
+
+COUNTS = {
+    'red square': 2,
+    'a red square on grey': 1,
+    'the red square flashes': 5,
+    'bored squares': 3,
+    'square red': 1,
+    'a blue circle appears': 4,
+    'participant presses a button': 6,
+}
+
+
+@pytest.fixture
+def index():
+    index = DescriptionIndex()
+    for description in COUNTS:
+        index.add(description)
+    return index
+
+
+def matches(results):
+    return [(result['description'], result['match']) for result in results]
+
+
+def test_best_kind_of_match_then_most_used_first(index):
+    results = index.search('Red Square', COUNTS, fuzzy=False)
+    assert matches(results) == [
+        ('red square', 'exact'),
+        ('the red square flashes', 'word-prefix'),
+        ('a red square on grey', 'word-prefix'),
+        ('bored squares', 'substring'),
+    ]
+    assert [result['count'] for result in results] == [2, 5, 1, 3]
+
+
+def test_fuzzy_matches_come_after_text_matches(index):
+    results = index.search('red sqaure', COUNTS)
+    assert results and all(result['match'] == 'fuzzy' for result in results)
+    assert results[0]['description'] == 'red square'
+    assert results == sorted(results, key=lambda result: -result['score'])
+    assert index.search('red sqaure', COUNTS, fuzzy=False) == []
+    assert [result['match'] for result in index.search('square', COUNTS)][:2] == ['prefix', 'word-prefix']
+
+
+def test_short_queries_match_word_prefixes(index):
+    assert matches(index.search('pr', COUNTS)) == [('participant presses a button', 'word-prefix')]
+    assert index.search('zz', COUNTS) == []
+
+
+@pytest.mark.parametrize('query', ['', '   '])
+def test_empty_query_lists_the_most_used(index, query):
+    results = index.search(query, COUNTS, limit=3)
+    assert [result['description'] for result in results] == [
+        'participant presses a button', 'the red square flashes', 'a blue circle appears']
+
+
+def test_updates_are_incremental(index):
+    index.remove('red square')
+    index.remove('not indexed')
+    assert len(index) == len(COUNTS) - 1
+    assert 'red square' not in [result['description'] for result in index.search('red square', COUNTS)]
+    assert 'red square' not in [result['description'] for result in index.similar('red square', COUNTS)]
+
+    # The freed slot is reused without leaking the old description's words
+    index.add('green triangle')
+    index.add('green triangle')
+    assert len(index) == len(COUNTS)
+    assert matches(index.search('gre', COUNTS, fuzzy=False)) == [
+        ('green triangle', 'prefix'), ('a red square on grey', 'word-prefix')]
+    assert index.search('square red', COUNTS, fuzzy=False)[0]['description'] == 'square red'
+    index.add('red square')
+    assert index.search('red square', COUNTS)[0] == {'description': 'red square', 'count': 2, 'match': 'exact',
+                                                     'score': 1.0}
+
+
+def test_similar_ranks_shared_words(index):
+    results = index.similar('a red square appears on grey', COUNTS, k=3)
+    assert results[0]['description'] == 'a red square on grey'
+    assert 'participant presses a button' not in [result['description'] for result in results]
+    assert results == sorted(results, key=lambda result: -result['score'])
+    assert index.similar('an unrelated xylophone', COUNTS) == []
+    assert DescriptionIndex().similar('red square', COUNTS) == []
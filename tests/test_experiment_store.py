@@ -0,0 +1,40 @@
+import json
+
+import pytest
+
+from experiment_store import ExperimentStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ExperimentStore(tmp_path / 'experiments.db')
+    for name in ['run_1', 'run-1', 'run 100%', 'run 1000', 'C:\\runs\\a', 'Baseline']:
+        store.save({'model': 'qwen3:8b', 'experiment_name': name, 'description': 'a red square'})
+    return store
+
+
+@pytest.mark.parametrize('query,expected', [
+    ('_', ['run_1']),
+    ('%', ['run 100%']),
+    ('100%', ['run 100%']),
+    ('\\runs', ['C:\\runs\\a']),
+    ('RUN', ['run_1', 'run-1', 'run 100%', 'run 1000', 'C:\\runs\\a']),
+    ('line', ['Baseline']),
+])
+def test_name_filter_is_a_plain_substring(store, query, expected):
+    rows, _ = store.query_summaries(order='asc', name=query)
+    assert [row['experiment_name'] for row in rows] == expected
+
+
+def test_file_imported_under_a_fresh_id_is_not_reimported(store, tmp_path):
+    source = tmp_path / 'json'
+    source.mkdir()
+    (source / 'laptop_experiment_3.json').write_text(json.dumps({'experiment_id': 3, 'model': 'llama3:8b',
+                                                          'description': 'a blue circle'}))
+
+    filename, experiment_id = store.import_json_file(source / 'laptop_experiment_3.json')
+    assert experiment_id == 7 and filename == 'experiment_7.json'
+    assert store.get(filename)['description'] == 'a blue circle'
+    assert store.import_json_file(source / 'laptop_experiment_3.json') is None
+    assert ExperimentStore(store.db_path).migrate_json_dir(source) == (0, 1, 0)
+    assert store.count() == 7
@@ -0,0 +1,59 @@
+import json
+from pathlib import Path
+
+import pytest
+
+import hed_validation
+from hed_validation import fast_check_hed_string, validate_hed_string
+
+EXPERIMENTS_DIR = Path(__file__).parent.parent / 'prompt_experiments'
+
+VALID = [
+    'Sensory-event, Visual-presentation',
+    'Sensory-event, (Red, Square)',
+    'Event/Sensory-event',
+    'Item/Object/Man-made-object/Device/IO-device/Output-device/Display-device/Computer-screen',
+    'Label/Foo',
+]
+INVALID = [
+    ('Foo-bar', 'unknown-tag'),
+    ('(Red, Square', 'unmatched-open-parenthesis'),
+    ('Red,,Square', 'empty-tag'),
+    ('Red (Square)', 'missing-comma'),
+    ('Sensory-event/Visual-presentation', 'invalid-parent'),
+    ('Red/Square', 'invalid-parent'),
+]
+
+
+@pytest.mark.parametrize('hed_string', VALID)
+def test_valid_strings_pass_both(hed_string):
+    assert fast_check_hed_string(hed_string) == []
+    assert validate_hed_string(hed_string) == 0
+
+
+@pytest.mark.parametrize('hed_string,reason', INVALID)
+def test_fast_check_failures_fail_hedtools(hed_string, reason):
+    assert [item['reason'] for item in fast_check_hed_string(hed_string)] == [reason]
+    assert validate_hed_string(hed_string, fast_check=False) > 0
+
+
+def test_fast_pass_can_still_fail_hedtools():
+    # The fast check only reports definite errors; placement rules (Duration belongs in a top-level group) are left
+    # to hedtools
+    assert fast_check_hed_string('Duration/2 s') == []
+    assert validate_hed_string('Duration/2 s') > 0
+
+
+def test_fast_check_rejections_skip_hedtools(monkeypatch):
+    annotation = json.loads((EXPERIMENTS_DIR / 'experiment_0.json').read_text())['annotation']
+    assert len(fast_check_hed_string(annotation)) == 1
+    assert validate_hed_string(annotation, fast_check=False) == 3
+
+    def get_validator(*args):
+        raise AssertionError('hedtools should not run')
+
+    monkeypatch.setattr(hed_validation.schema_registry, 'get_validator', get_validator)
+    assert validate_hed_string(annotation) == 1
+    assert validate_hed_string('Foo-bar') == 1
+    # Strings that pass the fast check still go to hedtools
+    assert validate_hed_string('Sensory-event') == -1
@@ -0,0 +1,112 @@
+import threading
+import time
+
+from model_residency import ModelScheduler
+
+
+class Call:
+    """A thread holding a scheduler slot for model until finish()"""
+
+    def __init__(self, scheduler, model, started):
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(scheduler, model, started), daemon=True)
+        self._thread.start()
+
+    def _run(self, scheduler, model, started):
+        with scheduler.slot(model):
+            started.append(model)
+            self._done.wait(10)
+
+    def finish(self):
+        self._done.set()
+        self._thread.join(10)
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline
+        time.sleep(0.005)
+
+
+def queue(scheduler, model, started):
+    """Start a call expected to wait, returning once it is in the queue"""
+    waiting = scheduler.stats()['waiting']
+    call = Call(scheduler, model, started)
+    wait_for(lambda: scheduler.stats()['waiting'] == waiting + 1)
+    return call
+
+
+def scheduler(**kwargs):
+    return ModelScheduler(**{'max_loaded': 1, 'parallel': 1, 'switch_after': 100, 'grace': 0.01,
+                             'wait_timeout': 30, **kwargs})
+
+
+def test_resident_model_serves_up_to_parallel_calls():
+    models = scheduler(parallel=2)
+    started = []
+    first, second = Call(models, 'A', started), Call(models, 'A', started)
+    wait_for(lambda: len(started) == 2)
+    third = queue(models, 'A', started)
+    other = queue(models, 'B', started)
+
+    first.finish()
+    wait_for(lambda: len(started) == 3)
+    # B cannot load while A is still running
+    assert started == ['A', 'A', 'A']
+    assert models.stats()['resident'] == {'A': 2}
+
+    second.finish()
+    third.finish()
+    wait_for(lambda: len(started) == 4)
+    assert models.stats()['resident'] == {'B': 1}
+    other.finish()
+    assert models.stats()['switches'] == 2 and models.stats()['forced'] == 0
+
+
+def test_waiting_models_load_in_arrival_order():
+    models = scheduler()
+    started = []
+    first = Call(models, 'A', started)
+    wait_for(lambda: started == ['A'])
+    b, c, b_again = (queue(models, model, started) for model in ('B', 'C', 'B'))
+
+    for call in (first, b, b_again, c):
+        call.finish()
+    # The second call for B joins its loaded model ahead of C
+    assert started == ['A', 'B', 'B', 'C']
+
+
+def test_busy_model_yields_after_switch_after_calls():
+    models = scheduler(switch_after=1)
+    started = []
+    first = Call(models, 'A', started)
+    wait_for(lambda: started == ['A'])
+    other = queue(models, 'B', started)
+    second = queue(models, 'A', started)
+
+    first.finish()
+    wait_for(lambda: len(started) == 2)
+    third = queue(models, 'A', started)
+    second.finish()
+    wait_for(lambda: len(started) == 3)
+    assert started == ['A', 'A', 'B']
+    other.finish()
+    third.finish()
+    assert started == ['A', 'A', 'B', 'A']
+
+
+def test_least_recently_used_idle_model_is_evicted():
+    models = scheduler(max_loaded=2)
+    started = []
+    first = Call(models, 'A', started)
+    wait_for(lambda: started == ['A'])
+    second = Call(models, 'B', started)
+    wait_for(lambda: started == ['A', 'B'])
+    first.finish()
+    second.finish()
+    assert list(models.stats()['resident']) == ['A', 'B']
+
+    Call(models, 'C', started).finish()
+    assert started == ['A', 'B', 'C']
+    assert list(models.stats()['resident']) == ['B', 'C']
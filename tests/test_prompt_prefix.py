@@ -0,0 +1,77 @@
+import pytest
+
+from prompt_prefix import PrefillTracker, prefix_key, split_prompt
+from vocab_retrieval import cached_estimate_tokens, estimate_tokens
+
+DESCRIPTIONS = [
+    'A red square appears on the computer screen',
+    'The participant presses a button',
+    '',
+    'Ünïcode déscription with {{hed_vocab}} and --- ANNOTATION START --- in it',
+]
+
+
+def test_prefix_is_identical_across_descriptions(app_module):
+    template = app_module.DEFAULT_PROMPT_TEMPLATE
+    prefixes = set()
+    for description in DESCRIPTIONS:
+        hed_vocab, prompt, _ = app_module.prepare_prompt(template, description)
+        prefix, suffix = split_prompt(template, prompt, hed_vocab)
+        assert prefix + suffix == prompt
+        assert suffix.startswith(description)
+        prefixes.add(prefix.encode('utf-8'))
+    prefix, = prefixes
+    assert hed_vocab.encode('utf-8') in prefix
+    assert prefix.decode('utf-8').rstrip().endswith('Description from user:')
+
+
+@pytest.mark.parametrize('template', [
+    # The description comes first
+    '{{description}}\n\n{{hed_vocab}}',
+    # No description at all
+    'Annotate with {{hed_vocab}}',
+])
+def test_templates_without_a_prefix(template):
+    prompt = template.replace('{{hed_vocab}}', '<vocab/>').replace('{{description}}', 'a red square')
+    assert split_prompt(template, prompt, '<vocab/>') == ('', prompt)
+
+
+def test_prefix_that_depends_on_the_description_is_dropped():
+    template = '{% if description|length > 30 %}Long. {% endif %}{{hed_vocab}}\n{{description}}'
+    description = 'a much longer description of the stimulus'
+    prompt = f'Long. <vocab/>\n{description}'
+    assert split_prompt(template, prompt, '<vocab/>') == ('', prompt)
+
+
+def test_prefix_key():
+    assert prefix_key('prefix') == prefix_key('prefix')
+    assert len({prefix_key('prefix'), prefix_key('prefix '), prefix_key('prefix', 'system'),
+                prefix_key('prefix', None)}) == 4
+
+
+def test_prefill_tracker_counts_reused_prefix_tokens():
+    tracker = PrefillTracker()
+    prefix, suffix = 'You annotate events. ' * 50, 'Description: a red square'
+    prefix_tokens, suffix_tokens = cached_estimate_tokens(prefix), estimate_tokens(suffix)
+
+    # A cold request evaluates the whole prompt; a warm one only the suffix
+    assert tracker.observe('qwen3:8b', prefix, suffix, prefix_tokens + suffix_tokens) == 0
+    assert tracker.observe('qwen3:8b', prefix, suffix, suffix_tokens) == prefix_tokens
+    # Partly reused
+    assert tracker.observe('qwen3:8b', prefix, suffix, suffix_tokens + 10) == prefix_tokens - 10
+    # Nothing to account for without a prefix or a count
+    assert tracker.observe('qwen3:8b', '', suffix, suffix_tokens) == 0
+    assert tracker.observe('qwen3:8b', prefix, suffix, None) == 0
+
+
+def test_prefill_tracker_learns_model_token_counts():
+    tracker = PrefillTracker()
+    prefix, suffix = 'You annotate events. ' * 50, 'Description: a red square'
+    suffix_tokens = estimate_tokens(suffix)
+    model_prefix_tokens = 2 * cached_estimate_tokens(prefix)
+
+    # The model's tokenizer splits the prefix into more tokens than the estimate
+    assert tracker.observe('llama3:8b', prefix, suffix, model_prefix_tokens + suffix_tokens) == 0
+    assert tracker.observe('llama3:8b', prefix, suffix, suffix_tokens) == model_prefix_tokens
+    # Learned per model
+    assert tracker.observe('qwen3:8b', prefix, suffix, suffix_tokens) == cached_estimate_tokens(prefix)
@@ -0,0 +1,76 @@
+import random
+
+import pytest
+
+import reference_scoring
+from reference_scoring import ReferenceScorer, reference_grade, term_id
+from resources import resources
+
+
+@pytest.fixture(scope='module')
+def scorer():
+    return ReferenceScorer(resources.vocab())
+
+
+def score(scorer, annotation, reference):
+    return scorer.score_many([(annotation, reference)])[0]
+
+
+@pytest.mark.parametrize('annotation,reference,expected', [
+    ('Sensory-event', 'Sensory-event', 10.0),
+    # Long and short forms of a tag are the same tag
+    ('Event/Sensory-event', 'Sensory-event', 10.0),
+    # Sensory-event is one level below Event: depth 1 over depth 2
+    ('Event', 'Sensory-event', 5.0),
+    ('Sensory-event', 'Event', 5.0),
+    ('Red', 'Square', 0.0),
+    ('Duration/2 s', 'Duration/3 s', 10 * reference_scoring.VALUE_MISMATCH_CREDIT),
+    ('(Red, Square)', '(Square, Red)', 10.0),
+    ('Red, Red', 'Red', 10.0),
+    ('', '', 10.0),
+    ('Red', '', 0.0),
+])
+def test_tag_scores(scorer, annotation, reference, expected):
+    assert score(scorer, annotation, reference)['score'] == pytest.approx(expected)
+
+
+def test_group_weight(scorer):
+    result = score(scorer, 'Sensory-event, (Red, Square)', 'Sensory-event, (Red, Circle)')
+    assert result['tags']['f1'] == pytest.approx(2 / 3, abs=1e-4)
+    assert result['groups']['f1'] == 0
+    assert result['score'] == pytest.approx(10 * (1 - reference_scoring.GROUP_WEIGHT) * 2 / 3, abs=0.01)
+
+
+def test_unknown_tags_are_reported(scorer):
+    result = score(scorer, 'Foo, Red', 'Foo, Red')
+    assert result['score'] == 10.0
+    assert result['unknown_tags'] == 1
+    assert score(scorer, 'Foo', 'Bar')['score'] == 0
+    assert score(scorer, 'Sensory-event', 'Foo')['unknown_tags'] == 0
+
+    grade = reference_grade(result, 'Foo, Red')
+    assert grade['grader_model'] == reference_scoring.REFERENCE_GRADER
+    assert 'not in the vocabulary' in grade['full_response']
+    assert 'not in the vocabulary' not in reference_grade(score(scorer, 'Red', 'Red'), 'Red')['full_response']
+
+
+def test_term_ids_are_stable_and_not_padding():
+    assert term_id('sensory-event') == term_id('sensory-event')
+    assert term_id('sensory-event') != term_id('event')
+    assert all(term_id(f'tag-{index}') >= 0 for index in range(1000))
+
+
+def test_batch_matches_single_scores(scorer):
+    tags = ['Sensory-event', 'Event', 'Red', 'Square', 'Circle', 'Agent-action', 'Duration/2 s', 'Foo']
+    rng = random.Random(0)
+
+    def annotation():
+        chosen = rng.sample(tags, rng.randint(0, 4))
+        if len(chosen) > 2 and rng.random() < 0.5:
+            chosen = chosen[:1] + [f"({', '.join(chosen[1:])})"]
+        return ', '.join(chosen)
+
+    pairs = [(annotation(), annotation()) for _ in range(reference_scoring.CHUNK_SIZE + 200)]
+    batch = scorer.score_many(pairs)
+    for pair, result in zip(pairs[::50], batch[::50]):
+        assert result == score(scorer, *pair)
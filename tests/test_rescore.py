@@ -0,0 +1,141 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from experiment_store import ExperimentStore
+from rescore import RescoreJob, result_error
+
+WEB_DIR = Path(__file__).parent.parent / 'web'
+ERROR_GRADE = {'score': None, 'full_response': 'Error: connection refused', 'grader_model': 'mistral:latest'}
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ExperimentStore(tmp_path / 'experiments.db')
+
+
+@pytest.fixture
+def filenames(store):
+    saved = []
+    for index in range(4):
+        filename, _ = store.save({'model': 'qwen3:8b', 'description': f'description {index}',
+                                  'annotation': 'Sensory-event, Visual-presentation', 'validation_issues': 0,
+                                  'quality_grade': {'score': 9.0, 'full_response': '9/10'}})
+        saved.append(filename)
+    return saved
+
+
+def grade(score):
+    return lambda description, annotation: {'score': score, 'full_response': f'{score}/10'}
+
+
+def test_result_error():
+    assert result_error('validation_issues', 0) is None
+    assert result_error('validation_issues', 3) is None
+    assert result_error('validation_issues', -1)
+    assert result_error('quality_grade', {'score': 7.0, 'full_response': '7/10'}) is None
+    # An unparseable but real grader answer is a result, not an error
+    assert result_error('quality_grade', {'score': None, 'full_response': 'Looks fine'}) is None
+    assert result_error('quality_grade', ERROR_GRADE) == ERROR_GRADE['full_response']
+    assert result_error('quality_grade', None)
+
+
+def test_grading_error_keeps_stored_grade(store, filenames, tmp_path):
+    job = RescoreJob(filenames, store, grade_fn=lambda description, annotation: dict(ERROR_GRADE),
+                     validate=False, checkpoint_dir=tmp_path)
+    progress = job.run()
+
+    assert progress['status'] == 'failed'
+    assert progress['failed'] == len(filenames)
+    assert progress['done'] == 0
+    for filename in filenames:
+        record = store.get(filename)
+        assert record['quality_grade']['score'] == 9.0
+        assert 'rescore_job' not in record
+
+
+def test_resume_retries_failed_and_skips_done(store, filenames, tmp_path):
+    flaky = set(filenames[::2])
+
+    def first_grade(description, annotation):
+        failing = any(store.get(f)['description'] == description for f in flaky)
+        return dict(ERROR_GRADE) if failing else {'score': 5.0, 'full_response': '5/10'}
+
+    job = RescoreJob(filenames, store, grade_fn=first_grade, validate=False, checkpoint_dir=tmp_path)
+    progress = job.run()
+    assert progress['done'] == len(filenames) - len(flaky)
+    assert set(progress['errors']) == flaky
+
+    graded = []
+
+    def second_grade(description, annotation):
+        graded.append(description)
+        return {'score': 6.0, 'full_response': '6/10'}
+
+    resumed = RescoreJob.resume(job.job_id, store, grade_fn=second_grade, checkpoint_dir=tmp_path)
+    progress = resumed.run()
+    assert progress['status'] == 'done'
+    assert progress['done'] == len(filenames)
+    assert sorted(graded) == sorted(store.get(f)['description'] for f in flaky)
+    for filename in filenames:
+        expected = 6.0 if filename in flaky else 5.0
+        assert store.get(filename)['quality_grade']['score'] == expected
+
+
+def test_batched_grading_errors_are_per_experiment(store, filenames, tmp_path):
+    def grade_batch(pairs):
+        return [dict(ERROR_GRADE) if index == 0 else {'score': 4.0, 'full_response': '4/10'}
+                for index, _ in enumerate(pairs)]
+
+    job = RescoreJob(filenames, store, grade_batch_fn=grade_batch, validate=False, checkpoint_dir=tmp_path,
+                     options={'grading_batch_size': len(filenames)})
+    progress = job.run()
+    assert progress['failed'] == 1
+    assert progress['done'] == len(filenames) - 1
+    assert store.get(filenames[0])['quality_grade']['score'] == 9.0
+    assert [store.get(f)['quality_grade']['score'] for f in filenames[1:]] == [4.0] * (len(filenames) - 1)
+
+
+def test_grader_exception_is_failure(store, filenames, tmp_path):
+    def broken(description, annotation):
+        raise RuntimeError('grader down')
+
+    job = RescoreJob(filenames[:1], store, grade_fn=broken, validate=False, checkpoint_dir=tmp_path)
+    progress = job.run()
+    assert progress['errors'] == {filenames[0]: 'grader down'}
+    assert store.get(filenames[0])['quality_grade']['score'] == 9.0
+
+
+def test_validation_reruns_hed_checks(store, filenames, tmp_path):
+    store.update(filenames[0], {'annotation': 'Foo-bar, (Red, Square'})
+    store.update(filenames[1], {'annotation': 'Duration/2 s'})
+    job = RescoreJob(filenames, store, validate=True, grade=False, checkpoint_dir=tmp_path)
+    progress = job.run()
+
+    assert progress['status'] == 'done'
+    assert progress['done'] == len(filenames)
+    issues = [store.get(filename)['validation_issues'] for filename in filenames]
+    assert issues[0] == 2  # from the fast check
+    assert issues[1] > 0  # from hedtools
+    assert issues[2:] == [0, 0]
+
+
+def test_validation_runs_from_unguarded_scripts(tmp_path):
+    # A script without an `if __name__ == '__main__'` guard must not be re-run by validation workers
+    db_path = tmp_path / 'experiments.db'
+    filename, _ = ExperimentStore(db_path).save({'model': 'qwen3:8b', 'description': 'a red square',
+                                                 'annotation': 'Sensory-event', 'validation_issues': 3})
+    script = tmp_path / 'rescore_all.py'
+    script.write_text(
+        'from experiment_store import ExperimentStore\n'
+        'from rescore import RescoreJob\n'
+        f'store = ExperimentStore({str(db_path)!r})\n'
+        f'print(RescoreJob([{filename!r}], store, grade=False, checkpoint_dir={str(tmp_path)!r}).run()["status"])\n')
+    env = dict(os.environ, PYTHONPATH=str(WEB_DIR))
+    output = subprocess.run([sys.executable, str(script)], cwd=tmp_path, env=env, capture_output=True, text=True,
+                            timeout=120, check=True).stdout
+    assert output.strip().splitlines() == ['done']
+    assert ExperimentStore(db_path).get(filename)['validation_issues'] == 0
@@ -0,0 +1,97 @@
+import uuid
+
+import pytest
+
+import response_cache
+from response_cache import ResponseCache, cache_key
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(response_cache.time, 'time', clock)
+    return clock
+
+
+@pytest.fixture
+def cache(tmp_path, clock):
+    return ResponseCache(tmp_path / 'responses.db', max_entries=3, ttl=60)
+
+
+def test_key_covers_model_prompt_and_params():
+    key = cache_key('qwen3:8b', 'prompt', {'sample': 1, 'format': 'abc'})
+    assert key == cache_key('qwen3:8b', 'prompt', {'format': 'abc', 'sample': 1})
+    assert cache_key('qwen3:8b', 'prompt') == cache_key('qwen3:8b', 'prompt', {})
+    assert len({key, cache_key('llama3:8b', 'prompt', {'sample': 1, 'format': 'abc'}),
+                cache_key('qwen3:8b', 'prompt ', {'sample': 1, 'format': 'abc'}),
+                cache_key('qwen3:8b', 'prompt', {'sample': 2, 'format': 'abc'}),
+                cache_key('qwen3:8b', 'prompt', {'sample': 1})}) == 5
+
+
+def test_hits_and_misses(cache):
+    assert cache.get('qwen3:8b', 'prompt') is None
+    cache.put('qwen3:8b', 'prompt', 'response')
+    assert cache.get('qwen3:8b', 'prompt') == 'response'
+    assert cache.get('qwen3:8b', 'prompt', {'sample': 1}) is None
+    assert cache.get('llama3:8b', 'prompt') is None
+    cache.put('qwen3:8b', 'prompt', 'newer response')
+    assert cache.get('qwen3:8b', 'prompt') == 'newer response'
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['entries']) == (2, 3, 1)
+
+
+def test_expired_entries_are_dropped(cache, clock):
+    cache.put('qwen3:8b', 'prompt', 'response')
+    clock.now += 59
+    assert cache.get('qwen3:8b', 'prompt') == 'response'
+    # Reading does not extend the entry's life
+    clock.now += 2
+    assert cache.get('qwen3:8b', 'prompt') is None
+    assert cache.stats()['entries'] == 0
+
+
+def test_least_recently_used_entries_are_evicted(cache, clock):
+    for prompt in ('a', 'b', 'c'):
+        cache.put('qwen3:8b', prompt, prompt.upper())
+        clock.now += 1
+    assert cache.get('qwen3:8b', 'a') == 'A'
+    clock.now += 1
+    cache.put('qwen3:8b', 'd', 'D')
+    assert cache.get('qwen3:8b', 'b') is None
+    assert [cache.get('qwen3:8b', prompt) for prompt in ('a', 'c', 'd')] == ['A', 'C', 'D']
+
+    cache.clear()
+    assert cache.stats()['entries'] == 0
+    assert cache.get('qwen3:8b', 'a') is None
+
+
+def test_cached_generate_response(app_module):
+    prompt = f'Describe: {uuid.uuid4()}'
+    calls = []
+
+    def generate(model, prompt):
+        calls.append(prompt)
+        return f'response {len(calls)}'
+
+    assert app_module.cached_generate_response('qwen3:8b', prompt, True, generate=generate) == ('response 1', False)
+    assert app_module.cached_generate_response('qwen3:8b', prompt, True, generate=generate) == ('response 1', True)
+    # Params are part of the key
+    assert app_module.cached_generate_response('qwen3:8b', prompt, True, params={'sample': 1},
+                                               generate=generate) == ('response 2', False)
+    # Bypassing skips the lookup but replaces the stored response
+    assert app_module.cached_generate_response('qwen3:8b', prompt, True, bypass_cache=True,
+                                               generate=generate) == ('response 3', False)
+    assert app_module.cached_generate_response('qwen3:8b', prompt, True, generate=generate) == ('response 3', True)
+    assert app_module.cached_generate_response('qwen3:8b', prompt, False, generate=generate) == ('response 4', False)
+    # A cancelled generation is not cached
+    assert app_module.cached_generate_response('qwen3:8b', prompt + '!', True,
+                                               generate=lambda model, prompt: None) == (None, False)
+    assert app_module.get_response_cache().get('qwen3:8b', prompt + '!') is None
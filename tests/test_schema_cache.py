@@ -0,0 +1,33 @@
+import threading
+
+import schema_cache
+from schema_cache import SchemaRegistry
+
+
+def test_invalidate_during_load_is_not_undone(monkeypatch):
+    registry = SchemaRegistry()
+    started, release = threading.Event(), threading.Event()
+    loads = []
+
+    def load(version):
+        loads.append(version)
+        if len(loads) == 1:
+            started.set()
+            release.wait(5)
+        return object()
+
+    monkeypatch.setattr(schema_cache, 'load_schema_version', load)
+    results = []
+    loader = threading.Thread(target=lambda: results.append(registry.get_schema()))
+    loader.start()
+    assert started.wait(5)
+    registry.invalidate()
+    release.set()
+    loader.join(5)
+
+    assert results and results[0] is not None
+    assert registry.stats()['loaded'] == []
+    fresh = registry.get_schema()
+    assert fresh is not results[0]
+    assert registry.get_schema() is fresh
+    assert len(loads) == 2
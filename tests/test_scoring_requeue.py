@@ -0,0 +1,63 @@
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from experiment_store import ExperimentStore
+
+WEB_DIR = Path(__file__).parent.parent / 'web'
+
+
+def pending_experiment(description):
+    return {'model': 'qwen3:8b', 'description': description, 'annotation': 'Sensory-event',
+            'scoring_status': 'pending', 'validation_issues': None, 'quality_grade': None}
+
+
+def wait_for(condition, timeout=30):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline
+        time.sleep(0.05)
+
+
+def test_import_does_not_requeue(tmp_path):
+    # The CLI imports app; only a serving process may pick up unfinished scoring
+    db_path = tmp_path / 'experiments.db'
+    filename, _ = ExperimentStore(db_path).save(pending_experiment('a red square'))
+    env = dict(os.environ, EXPERIMENTS_DB=str(db_path), PYTHONPATH=str(WEB_DIR))
+    env.pop('WERKZEUG_RUN_MAIN', None)
+    output = subprocess.run([sys.executable, '-c', 'import app; print(sum(app.scoring_queue.stats().values()))'],
+                            cwd=tmp_path, env=env, capture_output=True, text=True, timeout=120, check=True).stdout
+    assert output.strip().splitlines()[-1] == '0'
+    assert ExperimentStore(db_path).get(filename)['scoring_status'] == 'pending'
+
+
+def test_requeue_scores_unfinished(app_module):
+    store = app_module.get_store()
+    filename, _ = store.save(pending_experiment('a blue circle'))
+    assert app_module.requeue_unfinished_scoring() >= 1
+    wait_for(lambda: store.get(filename)['scoring_status'] == 'done')
+    assert store.get(filename)['validation_issues'] == 0
+
+
+def test_requeue_leaves_experiments_of_live_owners(app_module):
+    store = app_module.get_store()
+    sleeper = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(60)'])
+    try:
+        owned, _ = store.save(dict(pending_experiment('a green triangle'), scoring_owner=sleeper.pid))
+        orphaned, _ = store.save(dict(pending_experiment('a yellow star'), scoring_owner=sleeper.pid))
+        store.update(owned, {'scoring_status': 'running'})
+        dead = subprocess.run([sys.executable, '-c', 'import os; print(os.getpid())'],
+                              capture_output=True, text=True, check=True)
+        store.update(orphaned, {'scoring_owner': int(dead.stdout)})
+
+        app_module.requeue_unfinished_scoring()
+        wait_for(lambda: store.get(orphaned)['scoring_status'] == 'done')
+        assert store.get(owned)['scoring_status'] == 'running'
+        assert store.get(owned)['scoring_owner'] == sleeper.pid
+        # The orphan was claimed, so a second worker starting now finds nothing to take over
+        assert store.claim_unfinished_scoring(os.getpid(), lambda pid: True) == []
+    finally:
+        sleeper.kill()
+        sleeper.wait()
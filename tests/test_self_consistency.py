@@ -0,0 +1,86 @@
+import pytest
+
+from hed_checker import get_fast_checker
+from mock_llm import mock_response_text
+from resources import resources
+from self_consistency import SelfConsistencyRunner, normalize_annotation
+
+
+@pytest.fixture(scope='module')
+def tree():
+    return get_fast_checker(resources.vocab()).tree
+
+
+def prompts_with_different_answers(app_module):
+    """Two prompts the mock model answers with different annotations"""
+    first = 'Describe: a red circle'
+    answer = app_module.first_annotation(mock_response_text(first))
+    second = next(f'Describe: stimulus {index}' for index in range(100)
+                  if app_module.first_annotation(mock_response_text(f'Describe: stimulus {index}')) != answer)
+    return first, second
+
+
+def test_majority_wins_and_stops_the_rest(app_module, tree):
+    majority, minority = prompts_with_different_answers(app_module)
+
+    def sample(index, cancel):
+        if index == 2:
+            # The dissenting sample is still generating when the quorum is reached
+            cancel.wait(10)
+            return app_module.generate_until_cancelled('qwen3:8b', minority, cancel)
+        return app_module.generate_until_cancelled('qwen3:8b', majority, cancel)
+
+    result = SelfConsistencyRunner(sample, app_module.first_annotation, samples=3, quorum=2, tree=tree).run()
+    stats = result['self_consistency']
+    assert result['annotation'] == app_module.first_annotation(mock_response_text(majority))
+    assert result['response'] == mock_response_text(majority)
+    assert stats['samples_completed'] == 2
+    assert stats['samples_cancelled'] == 1
+    assert stats['quorum_reached'] and stats['consensus_votes'] == 2
+    assert stats['agreement'] == 1.0
+
+
+def test_plurality_when_no_quorum(app_module, tree):
+    majority, minority = prompts_with_different_answers(app_module)
+    prompts = [minority, majority, majority]
+
+    def sample(index, cancel):
+        return app_module.generate_until_cancelled('qwen3:8b', prompts[index], cancel)
+
+    result = SelfConsistencyRunner(sample, app_module.first_annotation, samples=3, quorum=3, tree=tree).run()
+    stats = result['self_consistency']
+    assert result['annotation'] == app_module.first_annotation(mock_response_text(majority))
+    assert not stats['quorum_reached']
+    assert stats['samples_completed'] == 3
+    assert [variant['votes'] for variant in stats['variants']] == [2, 1]
+
+
+def test_failed_and_empty_samples_do_not_vote(app_module, tree):
+    def sample(index, cancel):
+        if index == 0:
+            raise RuntimeError('model server down')
+        return 'no markers here' if index == 1 else mock_response_text('Describe: a red circle')
+
+    stats = SelfConsistencyRunner(sample, app_module.first_annotation, samples=3, quorum=2, tree=tree).run()[
+        'self_consistency']
+    assert stats['samples_failed'] == 1
+    assert stats['samples_completed'] == 2
+    assert stats['consensus_votes'] == 1 and not stats['quorum_reached']
+
+    with pytest.raises(RuntimeError, match='model server down'):
+        SelfConsistencyRunner(lambda index, cancel: sample(0, cancel), app_module.first_annotation, samples=2).run()
+
+
+@pytest.mark.parametrize('first,second', [
+    ('Sensory-event, (Red, Square)', '(square, RED), sensory-event'),
+    ('Event/Sensory-event, Red', 'Sensory-event, Red, Red'),
+    ('Item-count/3, (Red)', ' (Red) , Property/Data-property/Data-value/Quantitative-value/Item-count/3'),
+])
+def test_equivalent_annotations_normalize_alike(tree, first, second):
+    assert normalize_annotation(first, tree) == normalize_annotation(second, tree)
+
+
+def test_normalization_keeps_differences(tree):
+    assert normalize_annotation('Item-count/3', tree) != normalize_annotation('Item-count/4', tree)
+    assert normalize_annotation('(Red, Square)', tree) != normalize_annotation('Red, Square', tree)
+    assert normalize_annotation('', tree) == normalize_annotation('()', tree) == ''
@@ -0,0 +1,54 @@
+import itertools
+import random
+
+import pytest
+
+ECHOED_TEMPLATE = '--- ANNOTATION START ---\n--- ANNOTATION END ---\n\n'
+ANNOTATION = '(Foreground-view, (Item-count/3, Ingestible-object)), (Background-view, (Human, Outdoors))'
+RESPONSE = ('--- REASONING PROCESS START ---\n1. "three apples": `Item-count/3`, `Ingestible-object`\n'
+            '--- REASONING PROCESS END ---\n\n' + ECHOED_TEMPLATE
+            + f'--- ANNOTATION START ---\n{ANNOTATION}\n--- ANNOTATION END ---\n')
+
+
+def chunkings(text, seed=0):
+    """Every two-chunk split, one-character chunks and random splits of text"""
+    yield [text]
+    for split in range(1, len(text)):
+        yield [text[:split], text[split:]]
+    yield list(text)
+    rng = random.Random(seed)
+    for _ in range(200):
+        splits = sorted(rng.sample(range(1, len(text)), rng.randint(2, 30)))
+        yield [text[start:end] for start, end in zip([0, *splits], [*splits, len(text)])]
+
+
+def events(app_module, chunks):
+    """The annotation event the stream sends, and how much text had arrived when it was sent"""
+    parser = app_module.AnnotationStreamParser()
+    received = 0
+    for chunk in chunks:
+        received += len(chunk)
+        if parser.feed(chunk) is not None:
+            return [('annotation', parser.annotation, received)]
+    return []
+
+
+def test_annotation_is_found_across_chunk_boundaries(app_module):
+    expected = [('annotation', ANNOTATION, len(RESPONSE))]
+    assert events(app_module, [RESPONSE]) == expected
+    assert app_module.extract_annotations(RESPONSE) == [ANNOTATION]
+    end_of_marker = RESPONSE.rindex('--- ANNOTATION END ---') + len('--- ANNOTATION END ---')
+    for chunks in chunkings(RESPONSE):
+        # The event is sent with the chunk that completes the END marker
+        received = next(end for end in itertools.accumulate(map(len, chunks)) if end >= end_of_marker)
+        assert events(app_module, chunks) == [('annotation', ANNOTATION, received)], chunks
+
+
+@pytest.mark.parametrize('partial', [
+    ECHOED_TEMPLATE,
+    ECHOED_TEMPLATE + '--- ANNOTATION START ---\n(Foreground-view, (Item-count/3, Ingest',
+    ECHOED_TEMPLATE + f'--- ANNOTATION START ---\n{ANNOTATION}\n--- ANNOTATION EN',
+])
+def test_unfinished_annotation_sends_no_event(app_module, partial):
+    for chunks in chunkings(partial):
+        assert events(app_module, chunks) == []
@@ -0,0 +1,45 @@
+import re
+
+import pytest
+
+from hed_checker import get_fast_checker
+from mock_llm import MOCK_ANNOTATIONS
+from resources import resources
+from structured_output import TAG_SHAPE, annotation_pattern, annotation_schema, tag_pattern
+
+
+@pytest.fixture(scope='module')
+def tree():
+    return get_fast_checker(resources.vocab()).tree
+
+
+def prompt_example(template):
+    """The example annotation in a prompt template (the first non-empty annotation section)"""
+    sections = re.findall(r'--- ANNOTATION START ---\n(.*?)--- ANNOTATION END ---', template, re.DOTALL)
+    return next(section.strip() for section in sections if section.strip())
+
+
+def test_prompt_examples_match(app_module, tree):
+    pattern = re.compile(tag_pattern(tree))
+    example = prompt_example(app_module.DEFAULT_PROMPT_TEMPLATE)
+    # A value-taking tag used without its value
+    assert '(Item-count, High)' in example
+    for annotation in [example, *MOCK_ANNOTATIONS]:
+        assert pattern.match(annotation), annotation
+
+
+@pytest.mark.parametrize('annotation', ['Foo-bar', 'Red; Square', 'Sensory-event, ', 'High/3'])
+def test_invented_tags_and_values_are_rejected(tree, annotation):
+    assert not re.match(tag_pattern(tree), annotation)
+
+
+def test_long_patterns_fall_back_to_tag_shape(tree):
+    full = annotation_schema(tree)['properties']['annotation']['pattern']
+    assert full == tag_pattern(tree)
+    assert annotation_schema(tree, len(full))['properties']['annotation']['pattern'] == full
+
+    shape = annotation_schema(tree, 0)['properties']['annotation']['pattern']
+    assert shape == annotation_pattern(TAG_SHAPE)
+    assert re.match(shape, 'Foo-bar, (Item-count/3, Red)')
+    assert not re.match(shape, 'Red; Square')
+    assert 'pattern' not in annotation_schema()['properties']['annotation']
@@ -0,0 +1,99 @@
+import json
+import random
+
+import pytest
+
+from experiment_store import ExperimentStore
+from summary_index import SummaryIndex
+
+MODELS = ['qwen3:8b', 'llama3:8b', 'gemini-2.5-flash']
+NAMES = ['', 'baseline', 'Baseline v2', 'run_1', 'run-1', '50% vocab']
+DESCRIPTIONS = ['a red square', ' a red square ', 'a blue circle', 'a tone plays', '']
+
+
+def experiment(rng):
+    return {
+        'model': rng.choice(MODELS),
+        'experiment_name': rng.choice(NAMES),
+        'description': rng.choice(DESCRIPTIONS),
+        'timestamp': f'2025-0{rng.randint(1, 9)}-1{rng.randint(0, 9)}T12:00:00',
+        'inference_time': rng.random() * 10,
+        'validation_issues': rng.choice([0, 0, 1, 3, -1]),
+        'annotation': 'Sensory-event',
+        'quality_grade': {'score': rng.choice([None, 2.0, 5.5, 8.0, 10.0])}
+    }
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ExperimentStore(tmp_path / 'experiments.db')
+    rng = random.Random(0)
+    for _ in range(150):
+        store.save(experiment(rng))
+    return store
+
+
+@pytest.fixture
+def index(store, tmp_path):
+    return SummaryIndex(store, watch_dir=tmp_path / 'watch', scan_interval=0)
+
+
+FILTERS = [
+    {},
+    {'model': 'qwen3:8b'},
+    {'model': 'missing'},
+    {'name': 'base'},
+    {'name': 'run_'},
+    {'name': '%'},
+    {'since': '2025-03', 'until': '2025-07'},
+    {'min_score': 5, 'max_score': 9},
+    {'validation_issues': 0},
+    {'max_issues': 1, 'model': 'llama3:8b'},
+    {'name': '', 'model': None},
+]
+
+
+def all_pages(source, limit, order, **filters):
+    rows, cursor = source.query_summaries(limit=limit, order=order, **filters)
+    pages = [rows]
+    while cursor is not None:
+        rows, cursor = source.query_summaries(cursor=cursor, limit=limit, order=order, **filters)
+        pages.append(rows)
+    return pages
+
+
+@pytest.mark.parametrize('filters', FILTERS)
+@pytest.mark.parametrize('order', ['asc', 'desc'])
+def test_index_matches_store(store, index, filters, order):
+    for limit in (7, 50):
+        assert all_pages(index, limit, order, **filters) == all_pages(store, limit, order, **filters)
+
+
+def test_index_follows_writes(store, index):
+    rng = random.Random(1)
+    filename, _ = store.save(experiment(rng))
+    store.update(filename, {'experiment_name': 'renamed run_1', 'quality_grade': {'score': 9.5}})
+    first = index.query_summaries(limit=5)[0][0]['filename']
+    store.update(first, {'model': 'llama3:8b', 'description': 'a green triangle'})
+
+    for filters in FILTERS:
+        assert index.query_summaries(limit=500, **filters) == store.query_summaries(limit=500, **filters)
+    assert index.query_summaries(fields=['quality_score'], name='renamed')[0] == \
+        store.query_summaries(fields=['quality_score'], name='renamed')[0]
+    assert index.description_counts() == store.description_counts()
+
+
+def test_files_dropped_while_down_are_imported(store, tmp_path):
+    watch_dir = tmp_path / 'watch'
+    watch_dir.mkdir()
+    record = dict(experiment(random.Random(2)), experiment_id=1000, description='a dropped file')
+    (watch_dir / 'experiment_1000.json').write_text(json.dumps(record))
+
+    index = SummaryIndex(store, watch_dir=watch_dir, scan_interval=60)
+    assert index.files_imported == 1
+    assert store.has('experiment_1000.json')
+    assert index.search_descriptions('dropped')
+
+    # A restart finds the file already imported
+    assert SummaryIndex(store, watch_dir=watch_dir, scan_interval=60).files_imported == 0
+    assert store.count() == 151
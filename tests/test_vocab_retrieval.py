@@ -0,0 +1,60 @@
+import pytest
+
+from resources import resources
+from vocab_retrieval import cached_estimate_tokens, estimate_tokens, get_vocab_index, prune_vocab, tokenize
+
+
+@pytest.fixture(scope='module')
+def index():
+    return get_vocab_index(resources.vocab())
+
+
+def top_names(index, description, k):
+    return [node.name for node, _ in index.score(description)[:k]]
+
+
+@pytest.mark.parametrize('description,expected', [
+    ('A red square appears on the computer screen', {'Computer-screen', 'Square', 'Red'}),
+    ('The participant presses a button with the left hand', {'Left', 'Push-button'}),
+    ('A 440 Hz tone plays', {'Tone'}),
+])
+def test_relevant_tags_rank_first(index, description, expected):
+    assert expected <= set(top_names(index, description, 6))
+
+
+def test_multi_word_names_rank_above_their_parts(index):
+    names = top_names(index, 'A red square appears on the computer screen', 10)
+    assert names[0] == 'Computer-screen'
+    assert names.index('Computer-screen') < names.index('Screen-window')
+
+
+def test_selection_keeps_ancestors_and_placeholders(index):
+    selected = index.select('the item count', top_k=1)
+    assert sorted(node.name for node in selected) == [
+        '#', 'Data-property', 'Data-value', 'Item-count', 'Property', 'Quantitative-value']
+
+    xml, tag_count = index.render_for('A red square appears on the computer screen')
+    assert 'Computer-screen' in xml and 'Tone' not in xml
+    assert tag_count < len(index.tree)
+    assert index.render_for('A red square appears on the computer screen', top_k=2)[1] < tag_count
+
+
+@pytest.mark.parametrize('description', ['', 'the and of', 'zzzz qqqq'])
+def test_unmatched_descriptions_get_the_full_vocab(index, description):
+    assert index.score(description) == []
+    xml, tag_count = prune_vocab(resources.vocab(), description)
+    assert (xml, tag_count) == (index.tree.render(), len(index.tree))
+
+
+def test_index_is_built_once_per_vocab_version(index):
+    vocab = resources.vocab()
+    assert get_vocab_index(vocab) is index
+    other = get_vocab_index(vocab.replace('Computer-screen', 'Computer-monitor'))
+    assert other is not index and other.tree.get('Computer-monitor') is not None
+    assert get_vocab_index(vocab) is not index
+
+
+def test_tokenize_and_token_estimates():
+    assert tokenize('The participant presses buttons') == ['participant', 'press', 'button']
+    text = resources.vocab()
+    assert cached_estimate_tokens(text) == estimate_tokens(text) == cached_estimate_tokens(text)
@@ -0,0 +1,270 @@
+"""Columnar (NumPy) cache of experiment scalars for vectorized group-by statistics, kept current incrementally."""
+import datetime
+import io
+import sqlite3
+import threading
+
+import numpy as np
+
+from experiment_store import get_store
+
+# Scalar columns aggregated by /api/stats
+METRIC_COLUMNS = ['quality_score', 'inference_time', 'validation_issues']
+# Metrics that store -1 when they could not be measured (hedtools failed); held as NaN so aggregates skip them
+SENTINEL_COLUMNS = {'validation_issues'}
+# Categorical columns experiments can be grouped and filtered by -> summary table column
+GROUP_COLUMNS = {'model': 'model', 'template': 'template_hash', 'name': 'experiment_name'}
+DEFAULT_GROUP_BY = ('model', 'template')
+DEFAULT_PERCENTILES = (50, 90, 95)
+INITIAL_CAPACITY = 1024
+
+
+def parse_timestamp(value):
+    """ISO timestamp -> POSIX seconds, NaN when it is missing or not a timestamp (e.g. 'Unknown')"""
+    try:
+        return datetime.datetime.fromisoformat(value).timestamp()
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def grouped_summary(codes, values, group_count, percentiles=DEFAULT_PERCENTILES):
+    """
+    Per-group count, mean, min, max and percentiles of values (NaN ignored),
+    for integer group codes in [0, group_count). One sort by (group, value)
+    serves every group; percentiles interpolate linearly like np.percentile.
+    Returns a dict of arrays of length group_count (NaN for empty groups).
+    """
+    valid = ~np.isnan(values)
+    codes, values = codes[valid], values[valid]
+    # Sort by value, then stably by group (a radix sort for integer codes): each group's values end up sorted
+    order = np.argsort(values, kind='stable')
+    order = order[np.argsort(codes[order], kind='stable')]
+    codes, values = codes[order], values[order]
+    counts = np.bincount(codes, minlength=group_count)
+    sums = np.bincount(codes, weights=values, minlength=group_count)
+    starts = np.cumsum(counts) - counts
+    present = counts > 0
+    last = np.maximum(counts - 1, 0)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        summary = {'count': counts, 'mean': np.where(present, sums / counts, np.nan)}
+    empty = np.full(group_count, np.nan)
+    if not len(values):
+        summary.update({'min': empty, 'max': empty, **{f'p{q:g}': empty for q in percentiles}})
+        return summary
+    clamp = len(values) - 1
+    summary['min'] = np.where(present, values[np.minimum(starts, clamp)], np.nan)
+    summary['max'] = np.where(present, values[np.minimum(starts + last, clamp)], np.nan)
+    for q in percentiles:
+        position = last * (q / 100.0)
+        low = np.floor(position).astype(np.int64)
+        high = np.ceil(position).astype(np.int64)
+        low_values = values[np.minimum(starts + low, clamp)]
+        high_values = values[np.minimum(starts + high, clamp)]
+        summary[f'p{q:g}'] = np.where(present, low_values + (high_values - low_values) * (position - low), np.nan)
+    return summary
+
+
+class ColumnarCache:
+    """
+    One NumPy array per scalar column of every stored experiment, with
+    categorical columns (model, template hash, name) held as integer codes.
+
+    Loaded once, then kept current like the summary index: when `PRAGMA
+    data_version` shows another connection committed, only rows with a newer
+    revision are read; changed rows are overwritten in place and new rows
+    appended (arrays grow by doubling). Aggregates then never touch SQLite.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._conn = sqlite3.connect(store.db_path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        self._size = 0
+        self._positions = {}
+        self._categories = {name: ([], {}) for name in GROUP_COLUMNS}
+        self._columns = self._allocate(INITIAL_CAPACITY)
+        self._revision = 0
+        self._data_version = None
+        self.refreshes = 0
+        self.rows_read = 0
+        self.refresh()
+
+    @staticmethod
+    def _allocate(capacity):
+        columns = {'experiment_id': np.zeros(capacity, dtype=np.int64),
+                   'timestamp': np.full(capacity, np.nan)}
+        columns.update({name: np.full(capacity, np.nan) for name in METRIC_COLUMNS})
+        columns.update({name: np.zeros(capacity, dtype=np.int32) for name in GROUP_COLUMNS})
+        return columns
+
+    def _grow(self, needed):
+        capacity = len(self._columns['experiment_id'])
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        grown = self._allocate(capacity)
+        for name, column in self._columns.items():
+            grown[name][:self._size] = column[:self._size]
+        self._columns = grown
+
+    def _code(self, group, value):
+        values, codes = self._categories[group]
+        value = value if value is not None else ''
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(values)
+            values.append(value)
+        return code
+
+    def refresh(self):
+        """Apply every experiment change committed since the last refresh"""
+        with self._lock:
+            version = self._conn.execute('PRAGMA data_version').fetchone()[0]
+            if version == self._data_version:
+                return
+            # Read the version first: a commit landing during the read is picked up next time
+            self._data_version = version
+            rows = self._conn.execute(
+                f'''SELECT experiment_id, timestamp, {', '.join(METRIC_COLUMNS)},
+                           {', '.join(GROUP_COLUMNS.values())}, revision
+                    FROM experiments WHERE filename IS NOT NULL AND revision > ? ORDER BY revision''',
+                (self._revision,)).fetchall()
+            self._grow(self._size + len(rows))
+            columns = self._columns
+            for row in rows:
+                experiment_id = row['experiment_id']
+                position = self._positions.get(experiment_id)
+                if position is None:
+                    position = self._positions[experiment_id] = self._size
+                    self._size += 1
+                columns['experiment_id'][position] = experiment_id
+                columns['timestamp'][position] = parse_timestamp(row['timestamp'])
+                for name in METRIC_COLUMNS:
+                    value = row[name]
+                    if not isinstance(value, (int, float)) or (name in SENTINEL_COLUMNS and value < 0):
+                        value = np.nan
+                    columns[name][position] = value
+                for group, column in GROUP_COLUMNS.items():
+                    columns[group][position] = self._code(group, row[column])
+                self._revision = max(self._revision, row['revision'])
+            self.refreshes += 1
+            self.rows_read += len(rows)
+
+    def _selection(self, filters):
+        """Boolean mask of the rows matching filters (group values, name substring, since/until timestamps)"""
+        size = self._size
+        mask = np.ones(size, dtype=bool)
+        for group in ('model', 'template'):
+            value = filters.get(group)
+            if value:
+                values, _ = self._categories[group]
+                # Templates are addressed by any prefix of their hash
+                matches = [code for code, candidate in enumerate(values)
+                           if (candidate.startswith(value) if group == 'template' else candidate == value)]
+                mask &= np.isin(self._columns[group][:size], matches)
+        name = filters.get('name')
+        if name:
+            values, _ = self._categories['name']
+            matches = [code for code, candidate in enumerate(values) if name.lower() in candidate.lower()]
+            mask &= np.isin(self._columns['name'][:size], matches)
+        for key, compare in (('since', np.greater_equal), ('until', np.less_equal)):
+            if filters.get(key):
+                bound = parse_timestamp(filters[key])
+                if np.isnan(bound):
+                    raise ValueError(f'{key} must be an ISO timestamp')
+                mask &= compare(self._columns['timestamp'][:size], bound)
+        return mask
+
+    def stats(self, group_by=DEFAULT_GROUP_BY, percentiles=DEFAULT_PERCENTILES, **filters):
+        """
+        Aggregate METRIC_COLUMNS per combination of the group_by columns over
+        the rows matching filters (model, template hash prefix, name substring,
+        since, until). Groups are sorted by their values.
+        """
+        unknown = [group for group in group_by if group not in GROUP_COLUMNS]
+        if unknown:
+            raise ValueError(f"Unknown group: {', '.join(unknown)}")
+        unknown = set(filters) - {'model', 'template', 'name', 'since', 'until'}
+        if unknown:
+            raise ValueError(f"Unknown filter: {', '.join(sorted(unknown))}")
+        percentiles = tuple(float(q) for q in percentiles)
+        if any(not 0 <= q <= 100 for q in percentiles):
+            raise ValueError('percentiles must be between 0 and 100')
+        self.refresh()
+
+        with self._lock:
+            mask = self._selection(filters)
+            keys = [self._columns[group][:self._size][mask] for group in group_by]
+            metrics = {name: self._columns[name][:self._size][mask] for name in METRIC_COLUMNS}
+            labels = {group: list(self._categories[group][0]) for group in group_by}
+            cardinalities = [max(1, len(labels[group])) for group in group_by]
+            revision = self._revision
+
+        selected = int(mask.sum())
+        if group_by and selected:
+            # Fold the per-column codes into one integer key so a 1-D unique finds the groups
+            combined = np.zeros(selected, dtype=np.int64)
+            for column, cardinality in zip(keys, cardinalities):
+                combined = combined * cardinality + column
+            unique_combined, codes = np.unique(combined, return_inverse=True)
+            unique_keys = np.zeros((len(unique_combined), len(group_by)), dtype=np.int64)
+            for index in range(len(group_by) - 1, -1, -1):
+                unique_combined, unique_keys[:, index] = np.divmod(unique_combined, cardinalities[index])
+            codes = codes.reshape(-1)
+        else:
+            # No grouping puts every selected run in one group
+            unique_keys = np.zeros((1 if selected else 0, len(group_by)), dtype=np.int32)
+            codes = np.zeros(selected, dtype=np.int64)
+        group_count = len(unique_keys)
+        runs = np.bincount(codes, minlength=group_count)
+        summaries = {name: grouped_summary(codes, values, group_count, percentiles)
+                     for name, values in metrics.items()}
+
+        groups = []
+        for index, key in enumerate(unique_keys):
+            group = {name: labels[name][code] for name, code in zip(group_by, key)}
+            group['runs'] = int(runs[index])
+            for name, summary in summaries.items():
+                group[name] = {stat: (None if np.isnan(values[index]) else
+                                      int(values[index]) if stat == 'count' else round(float(values[index]), 6))
+                               for stat, values in summary.items()}
+            groups.append(group)
+        groups.sort(key=lambda group: tuple(group[name] for name in group_by))
+        return {'group_by': list(group_by), 'runs': int(len(codes)), 'revision': revision, 'groups': groups}
+
+    def export(self):
+        """The cache as .npz bytes: one array per column, categorical columns decoded to strings"""
+        with self._lock:
+            size = self._size
+            arrays = {name: column[:size].copy() for name, column in self._columns.items() if name not in GROUP_COLUMNS}
+            for group in GROUP_COLUMNS:
+                values = np.array(self._categories[group][0] or [''], dtype=str)
+                arrays[group] = values[self._columns[group][:size]]
+        buffer = io.BytesIO()
+        np.savez_compressed(buffer, **arrays)
+        return buffer.getvalue()
+
+    def info(self):
+        with self._lock:
+            return {
+                'experiments': self._size,
+                'revision': self._revision,
+                'refreshes': self.refreshes,
+                'rows_read': self.rows_read
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_columnar_cache():
+    """Return the process-wide columnar cache over get_store(), building it on first use"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ColumnarCache(get_store())
+        return _cache
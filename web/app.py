@@ -1,65 +1,82 @@
-from flask import Flask, render_template, request, jsonify, send_file
-from ollama import chat
-from ollama import ChatResponse
-from google import genai
-from jinja2 import Template
+from flask import Flask, render_template, request, jsonify, send_file, Response, stream_with_context
 from dotenv import load_dotenv
 import os
+import io
 import json
 import datetime
 import time
+import threading
 from pathlib import Path
 import re
+from concurrent.futures import ThreadPoolExecutor
 
 # HED validation imports
-from hed import HedString, load_schema_version
-from hed.errors import ErrorHandler, get_printable_issue_string
-from hed.validator import HedValidator
+from schema_cache import schema_registry
+from batch_runner import BatchRunner, build_cells, model_backend, DEFAULT_BACKEND_LIMITS, DEFAULT_MAX_WORKERS
+from experiment_store import get_store, DEFAULT_PAGE_SIZE, SUMMARY_FILTERS
+from summary_index import get_summary_index
+from description_search import DEFAULT_SEARCH_LIMIT, DEFAULT_SIMILAR_K, MAX_SEARCH_LIMIT
+from analytics import get_columnar_cache, DEFAULT_GROUP_BY, DEFAULT_PERCENTILES
+from response_cache import get_response_cache, RESPONSE_CACHE_ENABLED
+from vocab_retrieval import prune_vocab, estimate_tokens, cached_estimate_tokens, DEFAULT_TOP_K, DEFAULT_SUBTREE_DEPTH
+from job_queue import JobQueue
+from resources import resources, compile_template
+from hed_checker import get_fast_checker
+from reference_scoring import get_reference_scorer, reference_grade, REFERENCE_GRADER
+from hed_validation import validate_hed_string, fast_check_hed_string
+from rescore import RescoreJob, select_filenames, list_checkpoints
+from self_consistency import SelfConsistencyRunner, DEFAULT_SAMPLES
+from batch_grading import BatchGrader, BATCH_GRADING_SCHEMA, GRADING_BATCH_SIZE
+from structured_output import STRUCTURED_OUTPUT_INSTRUCTIONS, MAX_TAG_PATTERN_LENGTH, annotation_schema, schema_key, parse_structured_response
+from serving import experiment_limiter
+from prompt_prefix import split_prompt, prefill_tracker, gemini_context_cache, PREFIX_CACHE_ENABLED
+from model_residency import model_residency, MODEL_KEEP_ALIVE
+from atomic_io import write_text_atomic, file_lock
+from metrics import (registry, span, activate, current_trace, observe_stage, record_generation, Trace, EXPERIMENTS,
+                     LLM_REQUESTS)
 
 # Load environment variables from parent directory
 load_dotenv(Path(__file__).parent.parent / '.env')
 
 app = Flask(__name__)
 
-# Load HED vocabulary
+# Parse the HED schema once at startup instead of on the first validation
+schema_registry.warm()
+
+# Validation and grading run here after generation returns, unless a request opts out
+ASYNC_SCORING = os.getenv('ASYNC_SCORING', '1') == '1'
+scoring_queue = JobQueue(name='scoring')
+# When to ask the LLM grader: 'auto' only for descriptions without a gold annotation (those are scored
+# against it), 'always' also as a second opinion next to the reference score, 'never' reference scoring only
+LLM_GRADING = os.getenv('LLM_GRADING', 'auto')
+# Model the LLM grader runs on unless a request names another
+GRADER_MODEL = os.getenv('GRADER_MODEL', 'mistral:latest')
+
+# Bulk rescoring jobs run one at a time; each fans out to its own worker pools
+rescore_queue = JobQueue(max_workers=1, name='rescore')
+rescore_jobs = {}
+
+# Load HED vocabulary (cached; re-read only when the file changes)
 def load_hed_vocab():
-    vocab_path = Path(__file__).parent.parent / 'HED_vocab_reformatted.xml'
-    with open(vocab_path, 'r') as file:
-        return file.read()
+    return resources.vocab()
 
 # Save HED vocabulary
 def save_hed_vocab(vocab_content):
-    vocab_path = Path(__file__).parent.parent / 'HED_vocab_reformatted.xml'
-    with open(vocab_path, 'w') as file:
-        file.write(vocab_content)
+    resources.save_vocab(vocab_content)
 
-# Auto-save experiment to filesystem
-def auto_save_experiment(experiment_data):
+# Auto-save experiment to the experiment store
+def auto_save_experiment(experiment_data, hed_vocab=None):
     try:
-        # Create experiments directory if it doesn't exist
-        experiments_dir = Path(__file__).parent.parent / 'prompt_experiments'
-        experiments_dir.mkdir(exist_ok=True)
-        
-        # Find next available experiment ID
-        experiment_id = 0
-        while (experiments_dir / f'experiment_{experiment_id}.json').exists():
-            experiment_id += 1
-        
-        # Add experiment ID to the data
-        experiment_data['experiment_id'] = experiment_id
-        
-        filename = f'experiment_{experiment_id}.json'
-        
-        # Save experiment
-        with open(experiments_dir / filename, 'w') as f:
-            json.dump(experiment_data, f, indent=2)
-        
-        return filename, experiment_id
+        return get_store().save(experiment_data, hed_vocab=hed_vocab)
     except Exception as e:
         print(f"Error auto-saving experiment: {e}")
         return None, None
 
 # Default prompt template
+# Shown when Ollama cannot be asked for its installed models
+FALLBACK_OLLAMA_MODELS = ['qwen3:8b', 'llama3.2:latest', 'mistral:latest']
+GEMINI_MODELS = ['gemini-2.5-flash']
+
 DEFAULT_PROMPT_TEMPLATE = '''
 You are an expert in converting natural language descriptions of events into structured annotations using a predefined Hierarchical Event Descriptor (HED) vocabulary. Your task is to extract relevant concepts from the input description and represent them as a comma-separated list of HED tags, strictly adhering to the provided vocabulary.
 
@@ -114,83 +131,233 @@ Description from user:
 --- ANNOTATION END ---
 '''
 
+# Preload the vocab (and its tag index), the default template and model clients so the first request does not pay for them
+resources.warm()
+compile_template(DEFAULT_PROMPT_TEMPLATE)
+get_fast_checker(load_hed_vocab())
+get_reference_scorer(load_hed_vocab())
+# Load the experiment summaries and analytics columns once; both are then served from memory
+get_summary_index()
+get_columnar_cache()
+# Learn which models Ollama has loaded and load the pinned ones without holding up startup
+threading.Thread(target=model_residency.warm, name='model-warm', daemon=True).start()
+
 @app.route('/')
 def index():
     return render_template('index.html')
 
 @app.route('/api/models')
 def get_models():
-    """Get available models"""
-    # For now, return common models. In a real app, you might query Ollama for available models
-    ollama_models = ['qwen3:8b', 'llama3.2:latest', 'mistral:latest']
-    gemini_models = ['gemini-2.5-flash']
-    
+    """Get available models: those installed in Ollama (and which are loaded or pinned) plus Gemini"""
+    installed = model_residency.installed()
     return jsonify({
-        'ollama': ollama_models,
-        'gemini': gemini_models
+        'ollama': installed if installed is not None else FALLBACK_OLLAMA_MODELS,
+        'gemini': GEMINI_MODELS,
+        'loaded': [model['model'] for model in model_residency.loaded()] if installed is not None else [],
+        'pinned': model_residency.pinned()
     })
 
+@app.route('/api/models/preload', methods=['POST'])
+def preload_model():
+    """Start loading an Ollama model in the background, optionally pinning it in memory"""
+    data = request.json or {}
+    model = data.get('model', '')
+    if not model or model.startswith('gemini'):
+        return jsonify({'error': 'An Ollama model is required'}), 400
+    threading.Thread(target=preload_in_background, args=(model, bool(data.get('pin'))), daemon=True).start()
+    return jsonify({'success': True, 'model': model}), 202
+
+@app.route('/api/models/unpin', methods=['POST'])
+def unpin_model():
+    """Let a pinned Ollama model unload after MODEL_KEEP_ALIVE"""
+    model = (request.json or {}).get('model', '')
+    if model not in model_residency.pinned():
+        return jsonify({'error': 'Model is not pinned'}), 404
+    try:
+        model_residency.unpin(model)
+        return jsonify({'success': True})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def preload_in_background(model, pin):
+    try:
+        model_residency.preload(model, pin)
+    except Exception as e:
+        print(f"Error preloading {model}: {e}")
+
 @app.route('/api/experiments')
 def get_experiments():
-    """Get list of saved experiments"""
-    experiments_dir = Path(__file__).parent.parent / 'prompt_experiments'
-    experiments = []
+    """Get one page of saved experiments, filtered and most recent first"""
+    args = request.args
+    fields = [f.strip() for f in args.get('fields', '').split(',') if f.strip()]
+    try:
+        experiments, next_cursor = get_summary_index().query_summaries(
+            cursor=args.get('cursor', type=int),
+            limit=args.get('limit', DEFAULT_PAGE_SIZE, type=int),
+            order=args.get('order', 'desc'),
+            fields=fields or None,
+            model=args.get('model'),
+            name=args.get('name'),
+            since=args.get('since'),
+            until=args.get('until'),
+            min_score=args.get('min_score', type=float),
+            max_score=args.get('max_score', type=float),
+            validation_issues=args.get('validation_issues', type=int),
+            max_issues=args.get('max_issues', type=int)
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    if experiments_dir.exists():
-        for file_path in experiments_dir.glob('*.json'):
-            try:
-                with open(file_path, 'r') as f:
-                    data = json.load(f)
-                    # Extract experiment ID from filename if not in data
-                    experiment_id = data.get('experiment_id')
-                    if experiment_id is None:
-                        # Extract from filename for backward compatibility
-                        try:
-                            experiment_id = int(file_path.stem.split('_')[1])
-                        except (ValueError, IndexError):
-                            experiment_id = 0
-                    
-                    # Get quality grade information
-                    quality_grade = data.get('quality_grade', {})
-                    quality_score = quality_grade.get('score') if quality_grade else None
-                    
-                    experiments.append({
-                        'filename': file_path.name,
-                        'experiment_id': experiment_id,
-                        'model': data.get('model', 'Unknown'),
-                        'timestamp': data.get('timestamp', 'Unknown'),
-                        'inference_time': data.get('inference_time'),
-                        'experiment_name': data.get('experiment_name', ''),
-                        'description': data.get('description', '')[:100] + '...' if len(data.get('description', '')) > 100 else data.get('description', ''),
-                        'validation_issues': data.get('validation_issues', data.get('total_validation_issues', 0)),
-                        'annotation': data.get('annotation', data.get('annotations', [''])[0] if data.get('annotations') else ''),
-                        'quality_score': quality_score
-                    })
-            except Exception as e:
-                print(f"Error loading experiment {file_path}: {e}")
-    
-    # Sort by experiment ID (descending - most recent first)
-    experiments.sort(key=lambda x: x['experiment_id'], reverse=True)
-    
-    return jsonify(experiments)
+    for experiment in experiments:
+        if 'description' in experiment:
+            description = experiment['description'] or ''
+            experiment['description'] = description[:100] + '...' if len(description) > 100 else description
+    
+    return jsonify({
+        'experiments': experiments,
+        'next_cursor': next_cursor,
+        'has_more': next_cursor is not None
+    })
+
+@app.route('/api/stats')
+def get_stats():
+    """Aggregate quality score, inference time and validation issues per model x template (or other groups)"""
+    args = request.args
+    group_by = args.get('group_by')
+    percentiles = args.get('percentiles')
+    try:
+        result = get_columnar_cache().stats(
+            group_by=[g.strip() for g in group_by.split(',') if g.strip()] if group_by is not None else DEFAULT_GROUP_BY,
+            percentiles=[float(q) for q in percentiles.split(',') if q.strip()] if percentiles else DEFAULT_PERCENTILES,
+            **{key: args[key] for key in ('model', 'template', 'name', 'since', 'until') if args.get(key)}
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(result)
+
+@app.route('/api/stats/export')
+def export_stats():
+    """Download the analytics columns as a NumPy .npz archive"""
+    return send_file(io.BytesIO(get_columnar_cache().export()), mimetype='application/octet-stream',
+                     as_attachment=True, download_name='experiments_columns.npz')
 
 @app.route('/api/experiment/<filename>')
 def get_experiment(filename):
     """Get a specific experiment"""
-    experiments_dir = Path(__file__).parent.parent / 'prompt_experiments'
-    file_path = experiments_dir / filename
-    
-    if not file_path.exists():
-        return jsonify({'error': 'Experiment not found'}), 404
-    
     try:
-        with open(file_path, 'r') as f:
-            data = json.load(f)
+        data = get_store().get(filename)
+        if data is None:
+            return jsonify({'error': 'Experiment not found'}), 404
         return jsonify(data)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/experiment/<filename>/scoring')
+def get_experiment_scoring(filename):
+    """Get the validation/grading status of an experiment"""
+    data = get_store().get(filename, rehydrate=False)
+    if data is None:
+        return jsonify({'error': 'Experiment not found'}), 404
+    
+    return jsonify({
+        'filename': filename,
+        'scoring_status': scoring_queue.status(filename) or data.get('scoring_status', 'done'),
+        'validation_issues': data.get('validation_issues'),
+        'quality_grade': data.get('quality_grade'),
+        'scoring_error': data.get('scoring_error')
+    })
+
+@app.route('/api/jobs')
+def get_job_stats():
+    """Get background scoring and rescoring queue, admission and model scheduling counters"""
+    return jsonify({'scoring': scoring_queue.stats(), 'rescore': rescore_queue.stats(),
+                    'admission': experiment_limiter.stats(), 'models': model_residency.stats()})
+
+@app.route('/api/rescore', methods=['POST'])
+def start_rescore():
+    """Re-validate and/or re-grade a subset of the experiment history in the background"""
+    data = request.json or {}
+    options = {key: data[key] for key in ('grader_model', 'use_cache', 'bypass_cache', 'grading_batch_size',
+                                                 'llm_grading')
+               if key in data}
+    filters = {key: data.get(key) for key in SUMMARY_FILTERS if data.get(key) is not None}
+    
+    try:
+        filenames = select_filenames(get_store(), data.get('filenames'), **filters)
+        job = RescoreJob(filenames, get_store(), grade_fn=rescore_grade_fn(options),
+                         grade_batch_fn=rescore_grade_batch_fn(options), validate=data.get('validate', True),
+                         grade=data.get('grade', True), options=options)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    start_rescore_job(job)
+    return jsonify(job.progress()), 202
+
+@app.route('/api/rescore')
+def list_rescore_jobs():
+    """List rescoring jobs from their checkpoints"""
+    jobs = list_checkpoints()
+    for job in jobs:
+        if job['job_id'] in rescore_jobs:
+            job.update(rescore_jobs[job['job_id']].progress())
+    return jsonify(jobs)
+
+@app.route('/api/rescore/<job_id>')
+def get_rescore_job(job_id):
+    """Get the progress of a rescoring job"""
+    if job_id in rescore_jobs:
+        return jsonify(rescore_jobs[job_id].progress())
+    for job in list_checkpoints():
+        if job['job_id'] == job_id:
+            return jsonify(job)
+    return jsonify({'error': 'Rescore job not found'}), 404
+
+@app.route('/api/rescore/<job_id>/resume', methods=['POST'])
+def resume_rescore_job(job_id):
+    """Resume an interrupted rescoring job from its checkpoint"""
+    if rescore_queue.status(job_id):
+        return jsonify({'error': 'Rescore job is already running'}), 409
+    
+    try:
+        job = RescoreJob.resume(job_id, get_store())
+        job.grade_fn = rescore_grade_fn(job.options)
+        job.grade_batch_fn = rescore_grade_batch_fn(job.options)
+    except FileNotFoundError:
+        return jsonify({'error': 'Rescore job not found'}), 404
+    
+    start_rescore_job(job)
+    return jsonify(job.progress()), 202
+
+def rescore_grade_fn(options):
+    """Build the grading callable of a rescoring job from its options"""
+    def grade(description, annotation):
+        return grade_annotation(description, annotation, grader_model=options.get('grader_model') or GRADER_MODEL,
+                                use_cache=options.get('use_cache'), bypass_cache=options.get('bypass_cache', False),
+                                llm_grading=options.get('llm_grading'))
+    return grade
+
+def rescore_grade_batch_fn(options):
+    """Build the batched grading callable of a rescoring job (used when options ask for grading_batch_size > 1)"""
+    def grade_batch(pairs):
+        references = reference_grades(pairs)
+        llm_indexes = [index for index, reference in enumerate(references)
+                       if needs_llm_grade(reference, options.get('llm_grading'))]
+        llm_grades = dict.fromkeys(range(len(pairs)))
+        if llm_indexes:
+            # The job runs several batches at once on its own grading workers
+            llm_grades.update(zip(llm_indexes, grade_annotations_batch(
+                [pairs[index] for index in llm_indexes], grader_model=options.get('grader_model') or GRADER_MODEL,
+                use_cache=options.get('use_cache'), bypass_cache=options.get('bypass_cache', False),
+                batch_size=options.get('grading_batch_size') or GRADING_BATCH_SIZE, max_workers=1)))
+        return [combine_grades(reference, llm_grades[index]) for index, reference in enumerate(references)]
+    return grade_batch
+
+def start_rescore_job(job):
+    rescore_jobs[job.job_id] = job
+    rescore_queue.submit(job.job_id, job.run)
+
 @app.route('/api/run_experiment', methods=['POST'])
+@experiment_limiter.limit_route
 def run_experiment():
     """Run an experiment with the given parameters"""
     data = request.json
@@ -204,92 +371,191 @@ def run_experiment():
         return jsonify({'error': 'Description is required'}), 400
     
     try:
-        # Load HED vocabulary
-        hed_vocab = load_hed_vocab()
-        
-        # Render the template
-        template = Template(prompt_template)
-        prompt = template.render(hed_vocab=hed_vocab, description=description)
-        
-        # Start timing
-        start_time = time.time()
-        
-        # Choose the appropriate API based on model
-        if model.startswith('gemini'):
-            # Use Gemini API
-            api_key = os.getenv('GEMINI_API_KEY')
-            if not api_key:
-                raise ValueError("GEMINI_API_KEY environment variable is not set")
-            
-            client = genai.Client(api_key=api_key)
-            response = client.models.generate_content(
-                model=model,
-                contents=prompt
-            )
-            model_response = response.text
-        else:
-            # Use Ollama API
-            response = chat(model=model, messages=[
-                {
-                    'role': 'user',
-                    'content': prompt,
-                },
-            ])
-            model_response = response['message']['content']
-        
-        # Calculate inference time
-        inference_time = time.time() - start_time
-        
-        # Extract annotations from model response
-        annotations = extract_annotations(model_response)
-        
-        # Get the first annotation only (there should be only one)
-        annotation = annotations[0] if annotations else ""
-        
-        # Validate the single annotation
-        validation_issues = validate_hed_string(annotation) if annotation else 0
-        
-        # Grade the annotation quality
-        quality_grade = grade_annotation_quality(description, annotation) if annotation else {
-            'score': None,
-            'full_response': 'No annotation to grade',
-            'grader_model': 'llama3.2:3b'
-        }
-        
-        # Automatically save experiment to filesystem
-        experiment_data = {
-            'model': model,
-            'prompt_template': prompt_template,
-            'description': description,
-            'experiment_name': experiment_name,
-            'model_response': model_response,
-            'annotation': annotation,
-            'validation_issues': validation_issues,
-            'quality_grade': quality_grade,
-            'inference_time': inference_time,
-            'timestamp': datetime.datetime.now().isoformat(),
-            'prompt': prompt
-        }
-        
-        # Save to filesystem automatically
-        saved_filename, experiment_id = auto_save_experiment(experiment_data)
-        
-        return jsonify({
-            'success': True,
-            'response': model_response,
-            'annotation': annotation,
-            'validation_issues': validation_issues,
-            'quality_grade': quality_grade,
-            'prompt': prompt,
-            'inference_time': inference_time,
-            'auto_saved': True,
-            'filename': saved_filename,
-            'experiment_id': experiment_id
-        })
+        result = execute_experiment(model, prompt_template, description, experiment_name, **experiment_options(data))
+        return jsonify(result)
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def clamp_batch_limits(max_workers=None, backend_limits=None):
+    """
+    Return (max_workers, backend_limits) for a batch request, within the
+    server's own limits: each backend at most its OLLAMA_CONCURRENCY /
+    GEMINI_CONCURRENCY and the pool at most BATCH_MAX_WORKERS. A request can
+    lower them but not raise them.
+    """
+    backend_limits = backend_limits or {}
+    limits = {backend: max(1, min(int(backend_limits.get(backend) or limit), limit))
+              for backend, limit in DEFAULT_BACKEND_LIMITS.items()}
+    return max(1, min(int(max_workers or DEFAULT_MAX_WORKERS), DEFAULT_MAX_WORKERS)), limits
+
+@app.route('/api/run_batch', methods=['POST'])
+@experiment_limiter.limit_route
+def run_batch():
+    """Run descriptions x models x prompt templates, streaming each result as NDJSON"""
+    data = request.json or {}
+    
+    descriptions = [d for d in data.get('descriptions', []) if d and d.strip()]
+    models = data.get('models') or ['qwen3:8b']
+    prompt_templates = data.get('prompt_templates') or [DEFAULT_PROMPT_TEMPLATE]
+    experiment_name = data.get('experiment_name', '')
+    options = experiment_options(data)
+    
+    if not descriptions:
+        return jsonify({'error': 'At least one description is required'}), 400
+    try:
+        max_workers, backend_limits = clamp_batch_limits(data.get('max_workers'), data.get('backend_limits'))
+    except (TypeError, ValueError, AttributeError):
+        return jsonify({'error': 'max_workers and backend_limits values must be integers'}), 400
+    
+    runner = BatchRunner(
+        lambda cell: execute_experiment(cell['model'], cell['prompt_template'], cell['description'], experiment_name,
+                                        **options),
+        max_workers=max_workers,
+        backend_limits=backend_limits
+    )
+    cells = build_cells(descriptions, models, prompt_templates)
+    
+    def generate():
+        yield json.dumps({'event': 'start', 'total': len(cells)}) + '\n'
+        completed = 0
+        for cell in runner.run(cells):
+            completed += 1
+            # The rendered prompt is saved with the experiment; don't stream 54 KB per cell
+            cell.pop('prompt_template', None)
+            cell.get('result', {}).pop('prompt', None)
+            yield json.dumps(dict(cell, event='result', completed=completed)) + '\n'
+        yield json.dumps({'event': 'done', 'total': len(cells)}) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.route('/api/run_experiment_stream', methods=['POST'])
+@experiment_limiter.limit_route
+def run_experiment_stream():
+    """Run an experiment, streaming tokens and results as server-sent events"""
+    data = request.json or {}
+    
+    model = data.get('model', 'qwen3:8b')
+    prompt_template = data.get('prompt_template', DEFAULT_PROMPT_TEMPLATE)
+    description = data.get('description', '')
+    experiment_name = data.get('experiment_name', '')
+    use_cache = data.get('use_cache')
+    bypass_cache = data.get('bypass_cache', False)
+    vocab_retrieval = data.get('vocab_retrieval')
+    prefix_cache = data.get('prefix_cache')
+    
+    if not description:
+        return jsonify({'error': 'Description is required'}), 400
+    if data.get('structured_output'):
+        return jsonify({'error': 'structured_output is not streamed; use /api/run_experiment'}), 400
+    
+    def sse(event, payload):
+        return f'event: {event}\ndata: {json.dumps(payload)}\n\n'
+    
+    def generate():
+        trace = Trace()
+        try:
+            with activate(trace), span('render'):
+                hed_vocab, prompt, prompt_stats = prepare_prompt(prompt_template, description, vocab_retrieval)
+                prefix = prompt_prefix(prompt_template, prompt, hed_vocab, prefix_cache)
+            yield sse('prompt', dict(prompt_stats, prompt=prompt))
+            
+            caching = RESPONSE_CACHE_ENABLED if use_cache is None else use_cache
+            params = {'prefix_cache': True} if prefix else None
+            cached = get_response_cache().get(model, prompt, params) if caching and not bypass_cache else None
+            
+            # Score while the model is still generating if the grader can run alongside it; otherwise
+            # finish_experiment scores once the stream is done
+            early_scoring = grading_overlaps_generation(model, description)
+            with ThreadPoolExecutor(max_workers=1) as scorer:
+                parser = AnnotationStreamParser()
+                scoring = None
+                time_to_first_token = None
+                time_to_annotation = None
+                start_time = time.time()
+                
+                chunks = [cached] if cached is not None else stream_response(model, prompt, prefix)
+                for chunk in traced_stream(trace, chunks):
+                    if time_to_first_token is None:
+                        time_to_first_token = time.time() - start_time
+                    parser.feed(chunk)
+                    yield sse('token', {'text': chunk})
+                    
+                    if parser.annotation is not None and time_to_annotation is None:
+                        time_to_annotation = time.time() - start_time
+                        yield sse('annotation', {
+                            'annotation': parser.annotation,
+                            'time_to_first_token': time_to_first_token,
+                            'time_to_annotation': time_to_annotation
+                        })
+                        annotation = parser.annotation
+                        if early_scoring:
+                            scoring = scorer.submit(traced(trace, lambda: (
+                                annotation, *score_annotation(description, annotation, use_cache, bypass_cache))))
+                
+                inference_time = time.time() - start_time
+                model_response = parser.text
+                if caching and cached is None:
+                    get_response_cache().put(model, prompt, model_response, params)
+                if prefix:
+                    prompt_stats['prefix_cache'] = prefix_cache_stats(trace, prefix)
+                
+                scores = scoring.result() if scoring is not None else None
+            
+            with activate(trace):
+                result = finish_experiment(
+                    model, prompt_template, description, experiment_name, hed_vocab, prompt, model_response,
+                    inference_time, cached is not None, scores=scores, use_cache=use_cache, bypass_cache=bypass_cache,
+                    extra=dict(prompt_stats, time_to_first_token=time_to_first_token,
+                               time_to_annotation=time_to_annotation)
+                )
+            yield sse('result', result)
+        except Exception as e:
+            yield sse('error', {'error': str(e)})
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def grading_overlaps_generation(model, description):
+    """
+    Whether grading an annotation can run while model is still streaming.
+    The LLM grader (GRADER_MODEL) is usually another Ollama model, and with
+    room for one loaded model (OLLAMA_MAX_LOADED_MODELS=1, the default) the
+    scheduler holds its call until the stream releases its slot; started
+    early it would only sit in that queue. Reference grading and validation
+    make no model call.
+    """
+    if model.startswith('gemini') or model == GRADER_MODEL or model_residency.scheduler.max_loaded > 1:
+        return True
+    gold = get_store().gold_annotations([description]).get(description.strip())
+    return not needs_llm_grade(gold)
+
+def traced(trace, fn):
+    """Wrap fn so it runs with trace active (for work handed to another thread)"""
+    def run():
+        with activate(trace):
+            return fn()
+    return run
+
+def traced_stream(trace, chunks):
+    """
+    Yield from a response stream, timing the time spent inside it as the inference stage.
+    The trace is only active while the stream is producing, not while the caller handles a chunk.
+    """
+    iterator = iter(chunks)
+    elapsed = 0.0
+    try:
+        while True:
+            start = time.perf_counter()
+            with activate(trace), span('inference', observe=False):
+                chunk = next(iterator, None)
+            elapsed += time.perf_counter() - start
+            if chunk is None:
+                return
+            yield chunk
+    finally:
+        observe_stage('inference', elapsed, trace)
+
 @app.route('/api/save_experiment', methods=['POST'])
 def save_experiment():
     """Save an experiment to a file (legacy endpoint - now mainly for manual saves)"""
@@ -333,39 +599,42 @@ def save_experiment():
 @app.route('/api/download_experiment/<filename>')
 def download_experiment(filename):
     """Download an experiment file"""
-    experiments_dir = Path(__file__).parent.parent / 'prompt_experiments'
-    file_path = experiments_dir / filename
+    data = get_store().get(filename)
     
-    if not file_path.exists():
+    if data is None:
         return jsonify({'error': 'Experiment not found'}), 404
     
-    return send_file(file_path, as_attachment=True)
+    return Response(
+        json.dumps(data, indent=2),
+        mimetype='application/json',
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
 
 @app.route('/api/descriptions')
 def get_descriptions():
     """Get list of unique descriptions from saved experiments with usage counts"""
-    experiments_dir = Path(__file__).parent.parent / 'prompt_experiments'
-    description_counts = {}
-    
-    if experiments_dir.exists():
-        for file_path in experiments_dir.glob('*.json'):
-            try:
-                with open(file_path, 'r') as f:
-                    data = json.load(f)
-                    description = data.get('description', '').strip()
-                    if description:
-                        description_counts[description] = description_counts.get(description, 0) + 1
-            except Exception as e:
-                print(f"Error loading experiment {file_path}: {e}")
-    
-    # Sort by usage count (descending) then alphabetically
-    sorted_descriptions = sorted(description_counts.items(), key=lambda x: (-x[1], x[0]))
+    # Sorted by usage count (descending) then alphabetically
+    sorted_descriptions = get_summary_index().description_counts()
     
     return jsonify([{
         'description': desc,
         'count': count
     } for desc, count in sorted_descriptions])
 
+@app.route('/api/descriptions/search')
+def search_descriptions():
+    """Find prior descriptions by substring/prefix (then fuzzily), plus the k most similar to the query"""
+    args = request.args
+    query = args.get('q', '')
+    limit = max(1, min(args.get('limit', DEFAULT_SEARCH_LIMIT, type=int), MAX_SEARCH_LIMIT))
+    k = max(0, min(args.get('k', DEFAULT_SIMILAR_K, type=int), MAX_SEARCH_LIMIT))
+    index = get_summary_index()
+    return jsonify({
+        'query': query,
+        'matches': index.search_descriptions(query, limit, fuzzy=args.get('fuzzy', '1') != '0'),
+        'similar': index.similar_descriptions(query, k) if query.strip() else []
+    })
+
 @app.route('/api/hed_vocab')
 def get_hed_vocab():
     """Get the HED vocabulary content"""
@@ -418,23 +687,9 @@ def update_experiment_name():
         return jsonify({'error': 'Filename is required'}), 400
     
     try:
-        experiments_dir = Path(__file__).parent.parent / 'prompt_experiments'
-        file_path = experiments_dir / filename
-        
-        if not file_path.exists():
+        if not get_store().update(filename, {'experiment_name': new_name}):
             return jsonify({'error': 'Experiment not found'}), 404
         
-        # Load existing experiment data
-        with open(file_path, 'r') as f:
-            experiment_data = json.load(f)
-        
-        # Update the experiment name
-        experiment_data['experiment_name'] = new_name
-        
-        # Save updated data
-        with open(file_path, 'w') as f:
-            json.dump(experiment_data, f, indent=2)
-        
         return jsonify({
             'success': True,
             'message': 'Experiment name updated successfully'
@@ -456,34 +711,38 @@ def save_env_var():
         # Path to .env file in parent directory
         env_path = Path(__file__).parent.parent / '.env'
         
-        # Read existing .env content if it exists
-        existing_content = {}
-        if env_path.exists():
-            with open(env_path, 'r') as f:
-                for line in f:
-                    line = line.strip()
-                    if line and not line.startswith('#') and '=' in line:
-                        key, value = line.split('=', 1)
-                        existing_content[key] = value
-        
-        # Update with new values
-        updated_vars = []
-        for key, value in env_vars.items():
-            if value.strip():  # Only update if value is not empty
-                existing_content[key] = value.strip()
-                updated_vars.append(key)
-            else:  # Remove the key if empty value is provided
-                if key in existing_content:
-                    del existing_content[key]
-                    updated_vars.append(f"{key} (removed)")
-        
-        # Write back to .env file
-        with open(env_path, 'w') as f:
-            for key, value in existing_content.items():
-                f.write(f'{key}={value}\n')
+        # Lock the read-modify-write so concurrent saves from any worker don't drop each other's keys
+        with file_lock(env_path):
+            # Read existing .env content if it exists
+            existing_content = {}
+            if env_path.exists():
+                with open(env_path, 'r') as f:
+                    for line in f:
+                        line = line.strip()
+                        if line and not line.startswith('#') and '=' in line:
+                            key, value = line.split('=', 1)
+                            existing_content[key] = value
+            
+            # Update with new values
+            updated_vars = []
+            for key, value in env_vars.items():
+                if value.strip():  # Only update if value is not empty
+                    existing_content[key] = value.strip()
+                    updated_vars.append(key)
+                else:  # Remove the key if empty value is provided
+                    if key in existing_content:
+                        del existing_content[key]
+                        updated_vars.append(f"{key} (removed)")
+            
+            # Write back to .env file via temp file + rename so a crash never truncates it
+            write_text_atomic(env_path, ''.join(f'{key}={value}\n' for key, value in existing_content.items()))
         
-        # Reload environment variables
-        load_dotenv(env_path)
+        # Reload environment variables, dropping removed keys and rebuilding API clients
+        for key in env_vars:
+            if key not in existing_content:
+                os.environ.pop(key, None)
+        load_dotenv(env_path, override=True)
+        resources.reload_credentials()
         
         return jsonify({
             'success': True,
@@ -557,42 +816,728 @@ def check_api_key():
         'key_preview': api_key[:10] + '...' if api_key else None
     })
 
-def validate_hed_string(hed_string: str, schema_name='standard', schema_version='8.4.0') -> int:
+@app.route('/api/check_hed', methods=['POST'])
+def check_hed():
+    """Fast-path check of one or more annotation strings, returning structured issues"""
+    data = request.json or {}
+    annotations = data.get('annotations')
+    if annotations is None and data.get('annotation') is not None:
+        annotations = [data['annotation']]
+    if not isinstance(annotations, list):
+        return jsonify({'error': 'annotation or annotations is required'}), 400
+    
+    try:
+        results = []
+        for annotation in annotations:
+            issues = fast_check_hed_string(annotation)
+            results.append({'annotation': annotation, 'valid': not issues, 'issues': issues})
+        return jsonify({'results': results})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/grade_batch', methods=['POST'])
+def grade_batch():
+    """Grade a list of {description, annotation} items with batched grader calls"""
+    data = request.json or {}
+    items = data.get('items') or []
+    
+    if not items or not all(isinstance(item, dict) and item.get('annotation') for item in items):
+        return jsonify({'error': 'items must be a non-empty list of {description, annotation}'}), 400
+    
+    try:
+        grades = grade_annotations_batch(
+            [(item.get('description', ''), item['annotation']) for item in items],
+            grader_model=data.get('grader_model') or GRADER_MODEL,
+            use_cache=data.get('use_cache'),
+            bypass_cache=data.get('bypass_cache', False),
+            batch_size=data.get('batch_size') or GRADING_BATCH_SIZE
+        )
+        return jsonify({'grades': grades})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/gold_annotations')
+def get_gold_annotations():
+    """List the gold (reference) annotations stored per description"""
+    try:
+        return jsonify({'gold_annotations': get_store().list_gold_annotations()})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/gold_annotations', methods=['POST'])
+def save_gold_annotations():
+    """Store the gold annotation of a description (or of each of `items`); an empty annotation removes it"""
+    data = request.json or {}
+    items = data.get('items')
+    if items is None:
+        items = [data]
+    if not isinstance(items, list) or not all(isinstance(item, dict) and (item.get('description') or '').strip()
+                                              for item in items):
+        return jsonify({'error': 'description (or items of {description, annotation}) is required'}), 400
+    
+    try:
+        store = get_store()
+        for item in items:
+            store.set_gold_annotation(item['description'], item.get('annotation'))
+        return jsonify({'success': True, 'saved': len(items)})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/score_reference', methods=['POST'])
+def score_reference():
+    """
+    Score items of {annotation, reference} against their reference annotation, or
+    {annotation, description} against the description's gold annotation, without an LLM
+    """
+    data = request.json or {}
+    items = data.get('items') or []
+    if not items or not all(isinstance(item, dict) and 'annotation' in item for item in items):
+        return jsonify({'error': 'items must be a non-empty list of {annotation, reference or description}'}), 400
+    
+    try:
+        gold = get_store().gold_annotations(item['description'] for item in items
+                                            if item.get('reference') is None and item.get('description'))
+        references = [item['reference'] if item.get('reference') is not None
+                      else gold.get((item.get('description') or '').strip()) for item in items]
+        missing = [index for index, reference in enumerate(references) if reference is None]
+        if missing:
+            return jsonify({'error': 'No reference or gold annotation for items', 'items': missing}), 400
+        scores = get_reference_scorer(load_hed_vocab()).score_many(
+            [(item['annotation'], reference) for item, reference in zip(items, references)])
+        return jsonify({'scores': scores})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/schema_cache')
+def get_schema_cache_stats():
+    """Get HED schema cache hit/miss counters"""
+    return jsonify(schema_registry.stats())
+
+@app.route('/api/schema_cache/invalidate', methods=['POST'])
+def invalidate_schema_cache():
+    """Drop cached HED schemas so they are reloaded on next use"""
+    data = request.json or {}
+    schema_name = data.get('schema_name')
+    schema_version = data.get('schema_version')
+    
+    schema_registry.invalidate(schema_name, schema_version)
+    if data.get('reload', True):
+        schema_registry.warm([(schema_name or 'standard', schema_version or '8.4.0')])
+    
+    return jsonify({
+        'success': True,
+        'stats': schema_registry.stats()
+    })
+
+@app.route('/api/response_cache')
+def get_response_cache_stats():
+    """Get LLM response cache statistics"""
+    return jsonify(get_response_cache().stats())
+
+@app.route('/api/response_cache/clear', methods=['POST'])
+def clear_response_cache():
+    """Remove every cached LLM response"""
+    get_response_cache().clear()
+    return jsonify({'success': True})
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus text exposition of stage timings, token usage, queues and caches"""
+    queues = {'scoring': scoring_queue.stats(), 'rescore': rescore_queue.stats()}
+    cache = get_response_cache().stats()
+    schemas = schema_registry.stats()
+    scheduling = model_residency.stats()
+    gauges = [
+        ('hed_queue_jobs', 'Background jobs by queue and state',
+         {(('queue', queue), ('state', state)): value for queue, stats in queues.items()
+          for state, value in stats.items()}),
+        ('hed_admission', 'Experiment admission slots and outcomes',
+         {(('state', key),): value for key, value in experiment_limiter.stats().items()}),
+        ('hed_summary_index', 'In-memory experiment summary index',
+         {(('counter', key),): value for key, value in get_summary_index().stats().items()}),
+        ('hed_columnar_cache', 'In-memory analytics columns',
+         {(('counter', key),): value for key, value in get_columnar_cache().info().items()}),
+        ('hed_response_cache', 'LLM response cache counters',
+         {(('counter', key),): cache[key] for key in ('entries', 'hits', 'misses')}),
+        ('hed_schema_cache', 'HED schema cache counters',
+         {(('counter', key),): schemas[key] for key in ('hits', 'misses', 'invalidations')}),
+        ('hed_gemini_context_cache', 'Gemini cached prompt prefixes',
+         {(('counter', key),): value for key, value in gemini_context_cache.stats().items()}),
+        ('hed_model_scheduler', 'Ollama calls admitted for a resident model, model switches and timeouts',
+         {(('counter', key),): scheduling[key] for key in ('waiting', 'switches', 'grouped', 'forced')}),
+    ]
+    return Response(registry.render(gauges), mimetype='text/plain; version=0.0.4')
+
+def generate_response(model, prompt, prefix=None):
+    """
+    Send a rendered prompt to Ollama or Gemini and return the response text.
+    prefix is the prompt's static leading part (see prompt_prefix.split_prompt),
+    sent so the server can reuse its cached prefill across descriptions.
+    """
+    # Choose the appropriate API based on model
+    if model.startswith('gemini'):
+        # Use Gemini API
+        return gemini_generate(model, prompt, prefix=prefix)
+    
+    # Use Ollama API
+    response = ollama_chat(model, prompt, prefix)
+    record_ollama_usage(model, response, prompt, prefix)
+    return response['message']['content']
+
+def generate_json_response(model, prompt, schema, system=None, temperature=None, prefix=None):
+    """
+    Like generate_response, but constrain the output to JSON matching a JSON schema.
+    system is an optional system instruction; temperature None keeps the model's default.
+    """
+    if model.startswith('gemini'):
+        config = {'response_mime_type': 'application/json', 'response_json_schema': schema}
+        if system:
+            config['system_instruction'] = system
+        if temperature is not None:
+            config['temperature'] = temperature
+        return gemini_generate(model, prompt, config, prefix)
+    
+    response = ollama_chat(model, prompt, prefix, system, format=schema,
+                           options={'temperature': temperature} if temperature is not None else None)
+    record_ollama_usage(model, response, prompt, prefix)
+    return response['message']['content']
+
+def ollama_chat(model, prompt, prefix=None, system=None, **kwargs):
+    """
+    Call Ollama's chat API. With a prefix, it goes first as the system message
+    (ahead of any system instruction) and only the rest of the prompt is the
+    user message, so every request starts with the same tokens; the model is
+    kept loaded for MODEL_KEEP_ALIVE so its KV cache still holds them next time.
+    Calls wait their turn in the model scheduler so calls for one model run back
+    to back instead of making Ollama swap models; pinned models stay loaded.
+    """
+    if prefix:
+        messages = [{'role': 'system', 'content': f'{prefix}\n\n{system}' if system else prefix}]
+        prompt = prompt[len(prefix):]
+    else:
+        messages = [{'role': 'system', 'content': system}] if system else []
+    messages.append({
+        'role': 'user',
+        'content': prompt,
+    })
+    keep_alive = model_residency.keep_alive(model, MODEL_KEEP_ALIVE if prefix else None)
+    if keep_alive is not None:
+        kwargs['keep_alive'] = keep_alive
+    
+    def chat():
+        return resources.ollama_client().chat(model=model, messages=messages, **kwargs)
+    if kwargs.get('stream'):
+        return model_residency.stream(model, chat)
+    with model_residency.slot(model):
+        return chat()
+
+def gemini_request(client, model, prompt, prefix=None, config=None):
     """
-    Validate a HED string and return the number of validation issues.
-    Returns 0 if no issues found, otherwise returns the count of issues.
+    Return (contents, config) for a Gemini call, with the prefix (and system
+    instruction) served from Gemini's context cache when one is available.
     """
+    name = gemini_context_cache.get(client, model, prefix, (config or {}).get('system_instruction')) if prefix else None
+    if name is None:
+        return prompt, config
+    config = {key: value for key, value in (config or {}).items() if key != 'system_instruction'}
+    config['cached_content'] = name
+    return prompt[len(prefix):], config
+
+def gemini_generate(model, prompt, config=None, prefix=None):
+    """Generate with Gemini, using a cached prefix when possible, and return the response text"""
+    client = resources.gemini_client()
+    contents, request_config = gemini_request(client, model, prompt, prefix, config)
     try:
-        if schema_name != 'standard':
-            schema = load_schema_version(f'{schema_name}_{schema_version}')
-        else:
-            schema = load_schema_version(f'{schema_version}')
+        response = client.models.generate_content(model=model, contents=contents, config=request_config)
+    except Exception:
+        if request_config is config:
+            raise
+        # The cached prefix may have been deleted or expired early; drop it and send the whole prompt
+        gemini_context_cache.forget(model, prefix, (config or {}).get('system_instruction'))
+        response = client.models.generate_content(model=model, contents=prompt, config=config)
+    record_gemini_usage(model, response.usage_metadata)
+    return response.text
+
+def structured_generator(settings, model, prefix=None):
+    """
+    Return (generate, cache_params) for a structured_output setting: True for
+    {reasoning, annotation} JSON, or a dict with constrain_tags to also limit
+    the annotation to tag names from the vocabulary (as far as model's backend
+    accepts a pattern that long).
+    """
+    settings = settings if isinstance(settings, dict) else {}
+    tree = get_fast_checker(load_hed_vocab()).tree if settings.get('constrain_tags') else None
+    backend = 'gemini' if model.startswith('gemini') else 'ollama'
+    schema = annotation_schema(tree, MAX_TAG_PATTERN_LENGTH[backend])
+    
+    def generate(model, prompt):
+        return generate_json_response(model, prompt, schema, system=STRUCTURED_OUTPUT_INSTRUCTIONS, prefix=prefix)
+    return generate, {'format': schema_key(schema)}
+
+def stream_response(model, prompt, prefix=None):
+    """Yield response text chunks from Ollama or Gemini as they are generated"""
+    if model.startswith('gemini'):
+        # Use Gemini streaming API
+        client = resources.gemini_client()
+        contents, config = gemini_request(client, model, prompt, prefix)
+        usage = None
+        try:
+            for chunk in client.models.generate_content_stream(model=model, contents=contents, config=config):
+                usage = chunk.usage_metadata or usage
+                if chunk.text:
+                    yield chunk.text
+        except Exception:
+            if config is not None:
+                gemini_context_cache.forget(model, prefix)
+            raise
+        record_gemini_usage(model, usage)
+        return
+    
+    # Use Ollama streaming API
+    for part in ollama_chat(model, prompt, prefix, stream=True):
+        content = part['message']['content']
+        if content:
+            yield content
+        if part.get('done'):
+            record_ollama_usage(model, part, prompt, prefix)
+
+def record_ollama_usage(model, response, prompt=None, prefix=None):
+    """
+    Record token counts and load/prefill/eval durations reported by Ollama (nanoseconds).
+    With a prefix, the prefill tokens the KV cache saved are estimated as well.
+    """
+    def seconds(key):
+        value = response.get(key)
+        return value / 1e9 if value is not None else None
+    cached_tokens = prefill_tracker.observe(model, prefix, prompt[len(prefix):],
+                                            response.get('prompt_eval_count')) if prefix else None
+    record_generation(model, response.get('prompt_eval_count'), response.get('eval_count'),
+                      seconds('load_duration'), seconds('prompt_eval_duration'), seconds('eval_duration'),
+                      seconds('total_duration'), cached_prompt_tokens=cached_tokens)
+
+def record_gemini_usage(model, usage_metadata):
+    """Record the token counts Gemini reports, including cached prompt tokens (it does not report durations)"""
+    if usage_metadata is not None:
+        record_generation(model, usage_metadata.prompt_token_count, usage_metadata.candidates_token_count,
+                          cached_prompt_tokens=usage_metadata.cached_content_token_count)
+
+def cached_generate_response(model, prompt, use_cache=None, bypass_cache=False, params=None, generate=None):
+    """
+    generate_response through the persistent response cache.
+    use_cache=None follows the RESPONSE_CACHE setting; bypass_cache skips the lookup
+    but still stores the fresh response. generate replaces generate_response; a None
+    response from it is returned but not cached. Returns (response_text, cache_hit).
+    """
+    generate = generate or generate_response
+    if use_cache is None:
+        use_cache = RESPONSE_CACHE_ENABLED
+    if not use_cache:
+        LLM_REQUESTS.inc(model=model, cache='off')
+        return generate(model, prompt), False
+    
+    cache = get_response_cache()
+    if not bypass_cache:
+        cached = cache.get(model, prompt, params)
+        if cached is not None:
+            LLM_REQUESTS.inc(model=model, cache='hit')
+            return cached, True
+    
+    LLM_REQUESTS.inc(model=model, cache='miss')
+    model_response = generate(model, prompt)
+    if model_response is not None:
+        cache.put(model, prompt, model_response, params)
+    return model_response, False
+
+def generate_until_cancelled(model, prompt, cancel, prefix=None):
+    """Stream a response, closing the stream early (and returning None) once cancel is set"""
+    chunks = []
+    stream = stream_response(model, prompt, prefix)
+    try:
+        for chunk in stream:
+            if cancel.is_set():
+                return None
+            chunks.append(chunk)
+    finally:
+        stream.close()
+    return ''.join(chunks)
+
+def first_annotation(model_response):
+    """Return the first annotation in a response, or '' if there is none"""
+    annotations = extract_annotations(model_response)
+    return annotations[0] if annotations else ""
+
+def generate_self_consistent(model, prompt, settings, use_cache=None, bypass_cache=False, generate=None,
+                             params=None, prefix=None):
+    """
+    Draw several samples for one prompt and keep the annotation a quorum agrees on.
+    settings is True (defaults), a sample count or a dict with samples / quorum / max_workers.
+    Samples are streamed so they can stop early, unless a (non-streaming) generate is given.
+    prefix is passed to the streamed samples (see generate_response).
+    Returns (model_response, cache_hit, stats).
+    """
+    if not isinstance(settings, dict):
+        settings = {} if settings is True else {'samples': settings}
+    cache_hits = []
+    trace = current_trace()
+    
+    def sample(index, cancel):
+        if cancel.is_set():
+            return None
+        # Each sample has its own cache entry so repeated runs replay the same votes
+        with activate(trace), span('inference.sample'):
+            response, hit = cached_generate_response(
+                model, prompt, use_cache, bypass_cache, params=dict(params or {}, sample=index),
+                generate=(lambda m, p: generate_until_cancelled(m, p, cancel, prefix)) if generate is None else generate)
+        if hit:
+            cache_hits.append(index)
+        return response
+    
+    runner = SelfConsistencyRunner(
+        sample, first_annotation,
+        samples=settings.get('samples', DEFAULT_SAMPLES),
+        quorum=settings.get('quorum'),
+        # One thread per sample unless the caller caps it, so samples are in flight together and a quorum can stop
+        # the rest early
+        max_workers=settings.get('max_workers'),
+        tree=get_fast_checker(load_hed_vocab()).tree
+    )
+    result = runner.run()
+    stats = result['self_consistency']
+    stats['cache_hits'] = len(cache_hits)
+    cache_hit = bool(cache_hits) and len(cache_hits) == stats['samples_completed']
+    return result['response'], cache_hit, stats
+
+def experiment_options(data):
+    """Pick the per-experiment options out of a request body"""
+    return {
+        'use_cache': data.get('use_cache'),
+        'bypass_cache': data.get('bypass_cache', False),
+        'vocab_retrieval': data.get('vocab_retrieval'),
+        'async_scoring': data.get('async_scoring', ASYNC_SCORING),
+        'self_consistency': data.get('self_consistency'),
+        'structured_output': data.get('structured_output'),
+        'prefix_cache': data.get('prefix_cache')
+    }
+
+def prepare_prompt(prompt_template, description, vocab_retrieval=None):
+    """
+    Render the prompt, optionally with the vocabulary pruned to the tags relevant to the description.
+    vocab_retrieval is falsy (full vocab), True (defaults) or a dict with top_k / subtree_depth.
+    Returns (hed_vocab, prompt, prompt_stats) where hed_vocab is the vocab actually rendered.
+    """
+    # Load HED vocabulary
+    hed_vocab = load_hed_vocab()
+    prompt_stats = {}
+    
+    if vocab_retrieval:
+        settings = vocab_retrieval if isinstance(vocab_retrieval, dict) else {}
+        top_k = int(settings.get('top_k', DEFAULT_TOP_K))
+        subtree_depth = int(settings.get('subtree_depth', DEFAULT_SUBTREE_DEPTH))
+        full_vocab_tokens = cached_estimate_tokens(hed_vocab)
+        hed_vocab, tag_count = prune_vocab(hed_vocab, description, top_k, subtree_depth)
+        prompt_stats['vocab_retrieval'] = {
+            'top_k': top_k,
+            'subtree_depth': subtree_depth,
+            'tag_count': tag_count,
+            'full_vocab_tokens_estimate': full_vocab_tokens,
+            'vocab_tokens_estimate': estimate_tokens(hed_vocab)
+        }
+    
+    # Render the template (compiled once per template text)
+    template = compile_template(prompt_template)
+    prompt = template.render(hed_vocab=hed_vocab, description=description)
+    vocab_tokens = prompt_stats['vocab_retrieval']['vocab_tokens_estimate'] if vocab_retrieval else None
+    prompt_stats['prompt_tokens_estimate'] = estimate_prompt_tokens(template, prompt, hed_vocab, description,
+                                                                    vocab_tokens)
+    
+    return hed_vocab, prompt, prompt_stats
+
+# Stands in for the vocabulary when a template is rendered to count the tokens around it
+VOCAB_PLACEHOLDER = '\x00hed_vocab\x00'
+
+def estimate_prompt_tokens(template, prompt, hed_vocab, description, vocab_tokens=None):
+    """
+    estimate_tokens of a rendered prompt without scanning the vocabulary in it
+    again: the template is rendered around a placeholder and the vocabulary's
+    own estimate (cached per vocab version) added where it appears. Falls back
+    to counting the prompt when the template does not insert the vocab as is.
+    """
+    skeleton = template.render(hed_vocab=VOCAB_PLACEHOLDER, description=description)
+    uses = skeleton.count(VOCAB_PLACEHOLDER)
+    if len(skeleton) + uses * (len(hed_vocab) - len(VOCAB_PLACEHOLDER)) != len(prompt):
+        return estimate_tokens(prompt)
+    if vocab_tokens is None:
+        vocab_tokens = cached_estimate_tokens(hed_vocab) if uses else 0
+    return estimate_tokens(skeleton.replace(VOCAB_PLACEHOLDER, ' ')) + uses * vocab_tokens
+
+def execute_experiment(model, prompt_template, description, experiment_name='', use_cache=None, bypass_cache=False,
+                       vocab_retrieval=None, async_scoring=False, self_consistency=None, structured_output=None,
+                       prefix_cache=None):
+    """
+    Run one experiment end to end: render, generate, extract, validate, grade and save.
+    With self_consistency several samples are drawn and the consensus annotation is kept.
+    With structured_output the model answers in schema-constrained JSON instead of marked sections.
+    With prefix_cache (None follows the PREFIX_CACHE setting) the prompt's static part is sent
+    separately so the model server reuses its prefill, and the tokens saved are reported.
+    Returns the payload sent back by /api/run_experiment.
+    """
+    with activate(Trace()) as trace:
+        with span('render'):
+            hed_vocab, prompt, prompt_stats = prepare_prompt(prompt_template, description, vocab_retrieval)
+            prefix = prompt_prefix(prompt_template, prompt, hed_vocab, prefix_cache)
+            generate, params = structured_generator(structured_output, model, prefix) if structured_output else (None, None)
+            if prefix:
+                # Same prompt, different message layout: keep its responses apart in the cache
+                params = dict(params or {}, prefix_cache=True)
+                if generate is None and not self_consistency:
+                    generate = lambda m, p: generate_response(m, p, prefix)
+        if structured_output:
+            prompt_stats['structured_output'] = {
+                'constrain_tags': bool(isinstance(structured_output, dict) and structured_output.get('constrain_tags'))
+            }
         
-        check_for_warnings = True
-        data = hed_string
-        hedObj = HedString(data, schema)
-        short_string = hedObj.get_as_form('short_tag')
-
-        # Validate the string
-        error_handler = ErrorHandler(check_for_warnings=check_for_warnings)
-        validator = HedValidator(schema)
-        issues = validator.validate(hedObj, allow_placeholders=False, error_handler=error_handler)
+        # Start timing
+        start_time = time.time()
+        
+        with span('inference'):
+            if self_consistency:
+                model_response, cache_hit, prompt_stats['self_consistency'] = generate_self_consistent(
+                    model, prompt, self_consistency, use_cache, bypass_cache, generate=generate, params=params,
+                    prefix=prefix)
+            else:
+                model_response, cache_hit = cached_generate_response(model, prompt, use_cache, bypass_cache,
+                                                                     params=params, generate=generate)
+        if prefix:
+            prompt_stats['prefix_cache'] = prefix_cache_stats(trace, prefix)
+        
+        # Calculate inference time
+        inference_time = time.time() - start_time
         
-        if issues:
-            return len(issues)
+        return finish_experiment(model, prompt_template, description, experiment_name, hed_vocab, prompt,
+                                 model_response, inference_time, cache_hit, extra=prompt_stats,
+                                 use_cache=use_cache, bypass_cache=bypass_cache, async_scoring=async_scoring)
+
+def prompt_prefix(prompt_template, prompt, hed_vocab, prefix_cache=None):
+    """Return the static prefix to send separately, or None when prefix caching is off or there is none"""
+    if not (PREFIX_CACHE_ENABLED if prefix_cache is None else prefix_cache):
+        return None
+    return split_prompt(prompt_template, prompt, hed_vocab)[0] or None
+
+def prefix_cache_stats(trace, prefix):
+    """Prefix size and the prefill tokens the model server reused during the inference stage"""
+    _, token_usage = trace.snapshot()
+    return {
+        'prefix_tokens_estimate': cached_estimate_tokens(prefix),
+        'prefill_tokens_saved': sum(usage.get('cached_prompt_tokens', 0) for usage in token_usage
+                                    if (usage.get('stage') or '').startswith('inference'))
+    }
+
+def score_annotation(description, annotation, use_cache=None, bypass_cache=False):
+    """Validate and grade a single annotation, returning (validation_issues, quality_grade)"""
+    # Validate the single annotation
+    with span('validation'):
+        validation_issues = validate_hed_string(annotation) if annotation else 0
+    
+    # Grade the annotation quality
+    with span('grading'):
+        quality_grade = grade_annotation(description, annotation, use_cache=use_cache,
+                                         bypass_cache=bypass_cache) if annotation else {
+            'score': None,
+            'full_response': 'No annotation to grade',
+            'grader_model': GRADER_MODEL
+        }
+    return validation_issues, quality_grade
+
+def finish_experiment(model, prompt_template, description, experiment_name, hed_vocab, prompt, model_response,
+                      inference_time, cache_hit, scores=None, extra=None, use_cache=None, bypass_cache=False,
+                      async_scoring=False):
+    """
+    Extract, score and save a generated response, returning the API payload.
+    scores is an already computed (annotation, validation_issues, quality_grade) triple;
+    it is reused when its annotation matches the one extracted from the full response.
+    With async_scoring the experiment is saved right away and validation and grading
+    run on the background scoring queue, which updates the stored experiment.
+    Stage timings and model token usage of the current trace are stored with it.
+    """
+    trace = current_trace() or Trace()
+    
+    # Extract annotations from model response
+    with span('extraction'):
+        annotations = extract_annotations(model_response)
+    
+    # Get the first annotation only (there should be only one)
+    annotation = annotations[0] if annotations else ""
+    
+    scoring_status = 'done'
+    if scores is not None and scores[0] == annotation:
+        validation_issues, quality_grade = scores[1], scores[2]
+    elif async_scoring and annotation:
+        validation_issues, quality_grade = None, None
+        scoring_status = 'pending'
+    else:
+        validation_issues, quality_grade = score_annotation(description, annotation, use_cache, bypass_cache)
+    
+    # Automatically save experiment to filesystem
+    experiment_data = {
+        'model': model,
+        'prompt_template': prompt_template,
+        'description': description,
+        'experiment_name': experiment_name,
+        'model_response': model_response,
+        'annotation': annotation,
+        'validation_issues': validation_issues,
+        'quality_grade': quality_grade,
+        'inference_time': inference_time,
+        'cache_hit': cache_hit,
+        'scoring_status': scoring_status,
+        'timestamp': datetime.datetime.now().isoformat(),
+        'prompt': prompt
+    }
+    if scoring_status == 'pending':
+        # The process that will score it, so a restart only takes over scoring whose owner is gone
+        experiment_data['scoring_owner'] = os.getpid()
+    experiment_data.update(extra or {})
+    # Persistence itself is timed after this snapshot, so it is only in the API result and /metrics
+    experiment_data['timings'], experiment_data['token_usage'] = trace.snapshot()
+    
+    # Save to the experiment store automatically; the prompt is stored by reference
+    with activate(trace), span('persistence'):
+        saved_filename, experiment_id = auto_save_experiment(experiment_data, hed_vocab)
+    EXPERIMENTS.inc(model=model)
+    
+    if scoring_status == 'pending':
+        if saved_filename:
+            scoring_queue.submit(saved_filename, run_scoring_job, saved_filename, description, annotation,
+                                 use_cache, bypass_cache)
         else:
-            return 0
+            # Nothing to update later if the save failed; score in-line instead
+            validation_issues, quality_grade = score_annotation(description, annotation, use_cache, bypass_cache)
+            scoring_status = 'done'
+    
+    result = {
+        'success': True,
+        'response': model_response,
+        'annotation': annotation,
+        'validation_issues': validation_issues,
+        'quality_grade': quality_grade,
+        'prompt': prompt,
+        'inference_time': inference_time,
+        'cache_hit': cache_hit,
+        'scoring_status': scoring_status,
+        'auto_saved': True,
+        'filename': saved_filename,
+        'experiment_id': experiment_id
+    }
+    result.update(extra or {})
+    result['timings'], result['token_usage'] = trace.snapshot()
+    return result
+
+def run_scoring_job(filename, description, annotation, use_cache=None, bypass_cache=False):
+    """Background job: validate and grade a saved experiment and store the results"""
+    store = get_store()
+    store.update(filename, {'scoring_status': 'running', 'scoring_owner': os.getpid()})
+    trace = Trace()
+    try:
+        with activate(trace):
+            validation_issues, quality_grade = score_annotation(description, annotation, use_cache, bypass_cache)
+    except Exception as e:
+        store.update(filename, {'scoring_status': 'error', 'scoring_error': str(e)})
+        raise
+    
+    # Add the scoring stages to the timings recorded when the experiment was saved
+    stored = store.get(filename, rehydrate=False) or {}
+    timings, token_usage = trace.snapshot()
+    store.update(filename, {
+        'validation_issues': validation_issues,
+        'quality_grade': quality_grade,
+        'scoring_status': 'done',
+        'timings': dict(stored.get('timings') or {}, **timings),
+        'token_usage': (stored.get('token_usage') or []) + token_usage
+    })
+
+def process_alive(pid):
+    """Whether a process with this pid is running (on this host)"""
+    if pid == os.getpid():
+        # Our own pid on a row at startup is a previous run that had it too (a container's pid 1)
+        return False
+    if os.name == 'nt':
+        # os.kill would terminate the process on Windows; take over instead
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    except (OSError, ValueError, TypeError):
+        return False
+    return True
+
+def requeue_unfinished_scoring():
+    """
+    Queue the experiments whose scoring was still pending or running when
+    their owner process stopped; the queue lives in memory. Experiments a
+    live process still owns, such as the old worker during a gunicorn reload,
+    are left to it. Called on server startup only (the __main__ block and
+    wsgi.py), never on import.
+    """
+    try:
+        unfinished = get_store().claim_unfinished_scoring(os.getpid(), process_alive)
     except Exception as e:
-        print(f"HED validation error: {e}")
-        return -1  # Return -1 to indicate validation couldn't be performed
+        print(f"Error finding experiments left unscored: {e}")
+        return 0
+    for filename, description, annotation in unfinished:
+        scoring_queue.submit(filename, run_scoring_job, filename, description, annotation)
+    if unfinished:
+        print(f"Re-queued scoring of {len(unfinished)} experiment(s) left unscored by the last run")
+    return len(unfinished)
+
+ANNOTATION_START = '--- ANNOTATION START ---'
+ANNOTATION_PATTERN = re.compile(r'--- ANNOTATION START ---\s*(.*?)\s*--- ANNOTATION END ---', re.DOTALL)
 
 def extract_annotations(text):
-    """Extract text between --- ANNOTATION START --- and --- ANNOTATION END --- markers"""
-    pattern = r'--- ANNOTATION START ---\s*(.*?)\s*--- ANNOTATION END ---'
-    matches = re.findall(pattern, text, re.DOTALL)
+    """
+    Extract the annotation of a structured (JSON) response, or else the text between
+    --- ANNOTATION START --- and --- ANNOTATION END --- markers
+    """
+    structured = parse_structured_response(text)
+    if structured is not None:
+        annotation = structured['annotation'].strip()
+        return [annotation] if annotation else []
+    matches = ANNOTATION_PATTERN.findall(text)
     return [match.strip() for match in matches if match.strip()]
 
-def grade_annotation_quality(description, annotation, grader_model='mistral:latest'):
+class AnnotationStreamParser:
+    """
+    Incrementally detect the first non-empty annotation block in a streamed response.
+    Matches what extract_annotations would return for the text received so far.
+    """
+    
+    def __init__(self):
+        self.text = ''
+        self.annotation = None
+        self._scan_from = 0
+    
+    def feed(self, chunk):
+        """Append a chunk; returns the annotation once its END marker has arrived"""
+        self.text += chunk
+        while self.annotation is None:
+            start = self.text.find(ANNOTATION_START, self._scan_from)
+            if start == -1:
+                # Keep enough tail to catch a marker split across chunks
+                self._scan_from = max(self._scan_from, len(self.text) - len(ANNOTATION_START) + 1)
+                break
+            match = ANNOTATION_PATTERN.match(self.text, start)
+            if match is None:
+                self._scan_from = start
+                break
+            if match.group(1).strip():
+                self.annotation = match.group(1).strip()
+            else:
+                self._scan_from = match.end()
+        return self.annotation
+
+def grade_annotation_quality(description, annotation, grader_model=GRADER_MODEL, use_cache=None, bypass_cache=False):
     """
     Grade the quality of an annotation using an LLM grader.
     Returns a score from 0-10 based on clarity and how well the original description can be inferred.
@@ -609,23 +1554,20 @@ Here's the generated annotation:
 
 Evaluate the quality of the annotation on the scale of 0-10 based on clarity and how well the original description can be inferred from the annotation"""
         
-        # Use Ollama API to grade the annotation
-        response = chat(model=grader_model, messages=[
-            {
-                'role': 'user',
-                'content': grading_prompt,
-            },
-        ])
-        
-        grader_response = response['message']['content']
+        # Use Ollama API to grade the annotation (served from the response cache when enabled)
+        with span('grading.inference'):
+            grader_response, cache_hit = cached_generate_response(grader_model, grading_prompt, use_cache,
+                                                                  bypass_cache)
         
         # Extract numeric score from response
-        score = extract_quality_score(grader_response)
+        with span('grading.parse'):
+            score = extract_quality_score(grader_response)
         
         return {
             'score': score,
             'full_response': grader_response,
-            'grader_model': grader_model
+            'grader_model': grader_model,
+            'cache_hit': cache_hit
         }
         
     except Exception as e:
@@ -636,10 +1578,73 @@ Evaluate the quality of the annotation on the scale of 0-10 based on clarity and
             'grader_model': grader_model
         }
 
+def reference_grades(pairs):
+    """
+    Grade (description, annotation) pairs against the gold annotations of their
+    descriptions in one vectorized pass; None for descriptions without one.
+    """
+    gold = get_store().gold_annotations(description for description, _ in pairs)
+    scored = [(index, annotation, gold[(description or '').strip()])
+              for index, (description, annotation) in enumerate(pairs) if (description or '').strip() in gold]
+    grades = [None] * len(pairs)
+    if scored:
+        with span('grading.reference'):
+            results = get_reference_scorer(load_hed_vocab()).score_many(
+                [(annotation, reference) for _, annotation, reference in scored])
+        for (index, _, reference), result in zip(scored, results):
+            grades[index] = reference_grade(result, reference)
+    return grades
+
+def needs_llm_grade(reference, llm_grading=None):
+    """Whether the LLM grader runs for an annotation whose reference grade is reference (None: no gold)"""
+    llm_grading = llm_grading or LLM_GRADING
+    return llm_grading == 'always' or (reference is None and llm_grading != 'never')
+
+def combine_grades(reference, llm_grade):
+    """The reference grade when there is one (with the LLM grade as its second opinion), else the LLM grade"""
+    if reference is None:
+        return llm_grade or {'score': None, 'full_response': 'No gold annotation for this description',
+                             'grader_model': REFERENCE_GRADER}
+    if llm_grade is not None:
+        reference['second_opinion'] = llm_grade
+    return reference
+
+def grade_annotation(description, annotation, grader_model=GRADER_MODEL, use_cache=None, bypass_cache=False,
+                     llm_grading=None):
+    """
+    Grade an annotation against the gold annotation of its description, asking
+    the LLM grader when there is none (or as well, per llm_grading / LLM_GRADING).
+    """
+    reference = reference_grades([(description, annotation)])[0]
+    llm_grade = None
+    if needs_llm_grade(reference, llm_grading):
+        llm_grade = grade_annotation_quality(description, annotation, grader_model, use_cache, bypass_cache)
+    return combine_grades(reference, llm_grade)
+
+def grade_annotations_batch(pairs, grader_model=GRADER_MODEL, use_cache=None, bypass_cache=False,
+                            batch_size=GRADING_BATCH_SIZE, max_workers=None):
+    """
+    Grade many (description, annotation) pairs, packing up to batch_size of them into
+    each structured grader request. Returns the grades in input order, shaped like
+    grade_annotation_quality's with the size of the batch each was graded in.
+    """
+    def grade_prompt(prompt):
+        with span('grading.inference'):
+            return cached_generate_response(
+                grader_model, prompt, use_cache, bypass_cache, params={'format': 'batch_grading'},
+                generate=lambda m, p: generate_json_response(m, p, BATCH_GRADING_SCHEMA, temperature=0))
+    
+    def grade_single(description, annotation):
+        return grade_annotation_quality(description, annotation, grader_model, use_cache, bypass_cache)
+    
+    grader = BatchGrader(grade_prompt, grade_single, batch_size=batch_size,
+                         max_workers=max_workers or DEFAULT_BACKEND_LIMITS[model_backend(grader_model)])
+    with span('grading'):
+        grades = grader.grade((index, description, annotation) for index, (description, annotation) in enumerate(pairs))
+    return [dict(grades[str(index)], grader_model=grader_model) for index in range(len(pairs))]
+
 def extract_quality_score(response_text):
     """Extract numeric score from grader response"""
-    import re
-    
     # Look for patterns like "8/10", "score: 7", "rating of 9", etc.
     patterns = [
         r'(\d+(?:\.\d+)?)/10',  # X/10 format
@@ -662,4 +1667,8 @@ def extract_quality_score(response_text):
     return None
 
 if __name__ == '__main__':
+    # Only the process that serves requests picks up unfinished scoring: with debug=True the reloader's parent
+    # process runs this block too, and the CLI imports app without serving at all (wsgi.py covers gunicorn)
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        requeue_unfinished_scoring()
     app.run(debug=True, host='0.0.0.0', port=3000)
@@ -0,0 +1,81 @@
+"""Crash- and concurrency-safe file writes: temp file plus rename, and an advisory cross-process lock."""
+import json
+import os
+import secrets
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to a lock that only covers this process
+    fcntl = None
+
+_process_locks = {}
+_process_locks_guard = threading.Lock()
+
+
+def _create_temp(path):
+    """
+    Create a new temp file next to path, returning (fd, temp path). The file
+    is created 0666 less the umask, as open() would create path itself
+    (mkstemp would make it 0600, and reading the umask means setting it).
+    """
+    while True:
+        tmp_path = path.parent / f'.{path.name}.{secrets.token_hex(4)}.tmp'
+        try:
+            return os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666), tmp_path
+        except FileExistsError:
+            continue
+
+
+def write_text_atomic(path, text):
+    """
+    Write text to a temp file next to path, fsync it and rename it over path,
+    so readers see either the old or the new file and never a partial one.
+    An existing file keeps its permissions (e.g. a private .env).
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = _create_temp(path)
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        if path.exists():
+            os.chmod(tmp_path, path.stat().st_mode & 0o7777)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def write_json_atomic(path, data):
+    """Atomically write data as indented JSON"""
+    write_text_atomic(path, json.dumps(data, indent=2))
+
+
+@contextmanager
+def file_lock(path):
+    """
+    Hold an exclusive lock on `<path>.lock` for a read-modify-write of path
+    that must not interleave with other threads or processes.
+    """
+    path = Path(path)
+    key = str(path.resolve())
+    with _process_locks_guard:
+        thread_lock = _process_locks.setdefault(key, threading.Lock())
+    with thread_lock:
+        if fcntl is None:
+            yield
+            return
+        with open(path.with_name(path.name + '.lock'), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
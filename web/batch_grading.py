@@ -0,0 +1,179 @@
+"""Grade many (description, annotation) pairs per grader call, with JSON scores keyed by item ID."""
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from vocab_retrieval import estimate_tokens
+
+# Pairs packed into one grading request (1 keeps the one-call-per-annotation grader)
+GRADING_BATCH_SIZE = int(os.getenv('GRADING_BATCH_SIZE', '1'))
+# Context window of the grader model; Ollama serves 4096 tokens unless OLLAMA_CONTEXT_LENGTH is raised
+GRADING_CONTEXT_TOKENS = int(os.getenv('GRADING_CONTEXT_TOKENS', '4096'))
+# Output allowance per pair for the score and a one-sentence reason
+RESPONSE_TOKENS_PER_ITEM = 48
+# estimate_tokens counts words and punctuation, which undercounts model tokens; keep this much headroom
+CONTEXT_SAFETY = 0.8
+
+BATCH_GRADING_MARKER = 'Evaluate the quality of each annotation'
+
+BATCH_GRADING_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'scores': {
+            'type': 'array',
+            'items': {
+                'type': 'object',
+                'properties': {
+                    'id': {'type': 'string'},
+                    'score': {'type': 'number', 'minimum': 0, 'maximum': 10},
+                    'reason': {'type': 'string'}
+                },
+                'required': ['id', 'score', 'reason']
+            }
+        }
+    },
+    'required': ['scores']
+}
+
+
+def build_batch_prompt(items):
+    """Render the grading prompt for a list of (item_id, description, annotation)"""
+    blocks = [f"[item {item_id}]\nDescription: {description}\nAnnotation: {annotation}"
+              for item_id, description, annotation in items]
+    return ("Each item below pairs a description with a HED annotation generated for it.\n\n"
+            + '\n\n'.join(blocks)
+            + f"\n\n{BATCH_GRADING_MARKER} on the scale of 0-10 based on clarity and how well the original "
+              "description can be inferred from the annotation. Answer in JSON with one entry per item in "
+              "\"scores\": its \"id\", the \"score\" and a one-sentence \"reason\".")
+
+
+def parse_batch_scores(text, item_ids):
+    """
+    Return {item_id: {'score', 'reason'}} for the items the response scored
+    validly; items that are missing, duplicated or out of range are left out.
+    """
+    try:
+        data = json.loads(text)
+    except (TypeError, ValueError):
+        return {}
+    entries = data.get('scores') if isinstance(data, dict) else None
+    if not isinstance(entries, list):
+        return {}
+    wanted = set(item_ids)
+    scores = {}
+    for entry in entries:
+        if not isinstance(entry, dict):
+            continue
+        item_id = str(entry.get('id', '')).strip().removeprefix('item ').strip()
+        score = entry.get('score')
+        if item_id not in wanted or item_id in scores or isinstance(score, bool):
+            continue
+        try:
+            score = float(score)
+        except (TypeError, ValueError):
+            continue
+        if 0 <= score <= 10:
+            scores[item_id] = {'score': score, 'reason': str(entry.get('reason', ''))}
+    return scores
+
+
+def fits_context(items, context_tokens=GRADING_CONTEXT_TOKENS):
+    """Whether one request for these items leaves room for the answer in the grader's context"""
+    needed = estimate_tokens(build_batch_prompt(items)) + RESPONSE_TOKENS_PER_ITEM * len(items)
+    return needed <= context_tokens * CONTEXT_SAFETY
+
+
+def plan_batches(items, batch_size=GRADING_BATCH_SIZE, context_tokens=GRADING_CONTEXT_TOKENS):
+    """Pack items in order into batches of at most batch_size that fit the context window"""
+    batches = []
+    current = []
+    for item in items:
+        if current and (len(current) >= batch_size or not fits_context(current + [item], context_tokens)):
+            batches.append(current)
+            current = []
+        current.append(item)
+    if current:
+        batches.append(current)
+    return batches
+
+
+class BatchGrader:
+    """
+    Grade (item_id, description, annotation) items in batched requests.
+
+    grade_prompt(prompt) returns (response_text, cache_hit) for a structured
+    request built by build_batch_prompt. Batches are sized to fit the context
+    window up front. A batch whose request fails, or whose answer is not
+    valid JSON or leaves items unscored (what a truncated prompt looks like),
+    is split in half and retried. Only a single item that still cannot be
+    scored goes to grade_single(description, annotation), the free-text grader.
+    """
+
+    def __init__(self, grade_prompt, grade_single=None, batch_size=GRADING_BATCH_SIZE,
+                 context_tokens=GRADING_CONTEXT_TOKENS, max_workers=1):
+        self.grade_prompt = grade_prompt
+        self.grade_single = grade_single
+        self.batch_size = max(1, int(batch_size))
+        self.context_tokens = context_tokens
+        self.max_workers = max(1, int(max_workers))
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.splits = 0
+        self.fallbacks = 0
+
+    def grade(self, items):
+        """Return {item_id: grade} for every item; a grade has score, full_response, cache_hit and batch_size"""
+        items = [(str(item_id), description, annotation) for item_id, description, annotation in items]
+        batches = plan_batches(items, self.batch_size, self.context_tokens)
+        results = {}
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(batches) or 1),
+                                thread_name_prefix='grade-batch') as executor:
+            for batch_results in executor.map(self._grade_batch, batches):
+                results.update(batch_results)
+        return results
+
+    def _grade_batch(self, batch):
+        if len(batch) == 1 and self.grade_single is not None and self.batch_size == 1:
+            return self._fallback(batch[0])
+        error = None
+        scores = {}
+        cache_hit = False
+        try:
+            with self._lock:
+                self.requests += 1
+            response, cache_hit = self.grade_prompt(build_batch_prompt(batch))
+            scores = parse_batch_scores(response, [item_id for item_id, _, _ in batch])
+        except Exception as e:
+            error = str(e)
+
+        results = {
+            item_id: {'score': scores[item_id]['score'], 'full_response': scores[item_id]['reason'],
+                      'cache_hit': cache_hit, 'batch_size': len(batch)}
+            for item_id, _, _ in batch if item_id in scores
+        }
+        missing = [item for item in batch if item[0] not in scores]
+        if not missing:
+            return results
+        if len(missing) > 1:
+            with self._lock:
+                self.splits += 1
+            middle = len(missing) // 2
+            results.update(self._grade_batch(missing[:middle]))
+            results.update(self._grade_batch(missing[middle:]))
+        elif self.grade_single is not None:
+            results.update(self._fallback(missing[0]))
+        else:
+            results[missing[0][0]] = {'score': None, 'full_response': f"Error: {error or 'item not scored'}",
+                                      'cache_hit': cache_hit, 'batch_size': 1}
+        return results
+
+    def _fallback(self, item):
+        item_id, description, annotation = item
+        with self._lock:
+            self.fallbacks += 1
+        return {item_id: dict(self.grade_single(description, annotation), batch_size=1)}
+
+    def stats(self):
+        with self._lock:
+            return {'requests': self.requests, 'splits': self.splits, 'fallbacks': self.fallbacks}
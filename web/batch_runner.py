@@ -0,0 +1,89 @@
+"""Concurrent fan-out of experiments over descriptions x models x prompt templates."""
+import os
+import itertools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# Local Ollama serves one generation at a time well; Gemini is happy to run many
+DEFAULT_BACKEND_LIMITS = {
+    'ollama': int(os.getenv('OLLAMA_CONCURRENCY', '1')),
+    'gemini': int(os.getenv('GEMINI_CONCURRENCY', '8')),
+}
+DEFAULT_MAX_WORKERS = int(os.getenv('BATCH_MAX_WORKERS', '8'))
+
+
+def model_backend(model):
+    """Return the backend name ('gemini' or 'ollama') serving the given model"""
+    return 'gemini' if model.startswith('gemini') else 'ollama'
+
+
+def build_cells(descriptions, models, prompt_templates):
+    """Expand the N x M x K grid into a flat list of cells"""
+    cells = []
+    for index, (description, model, (template_index, prompt_template)) in enumerate(
+            itertools.product(descriptions, models, enumerate(prompt_templates))):
+        cells.append({
+            'index': index,
+            'description': description,
+            'model': model,
+            'template_index': template_index,
+            'prompt_template': prompt_template
+        })
+    return cells
+
+
+def group_by_model(cells):
+    """Reorder cells so each model's cells are consecutive (models in order of first appearance)"""
+    groups = {}
+    for cell in cells:
+        groups.setdefault(cell['model'], []).append(cell)
+    return [cell for group in groups.values() for cell in group]
+
+
+class BatchRunner:
+    """
+    Schedule experiment cells on a bounded thread pool.
+    Each backend has its own concurrency limit; cells for a saturated backend
+    wait in a queue instead of holding a worker thread, so a slow local model
+    never starves the cloud calls (or vice versa). Ollama cells run grouped by
+    model so the local server does not swap models between them.
+    """
+
+    def __init__(self, run_cell, max_workers=None, backend_limits=None):
+        self.run_cell = run_cell
+        self.max_workers = max_workers or DEFAULT_MAX_WORKERS
+        self.backend_limits = dict(DEFAULT_BACKEND_LIMITS)
+        self.backend_limits.update(backend_limits or {})
+
+    def _execute(self, cell):
+        try:
+            return dict(cell, result=self.run_cell(cell))
+        except Exception as e:
+            return dict(cell, error=str(e))
+
+    def run(self, cells):
+        """Run the cells and yield each one with its result as soon as it finishes"""
+        pending = {}
+        for cell in cells:
+            pending.setdefault(model_backend(cell['model']), deque()).append(cell)
+        if 'ollama' in pending:
+            pending['ollama'] = deque(group_by_model(pending['ollama']))
+        running = {backend: 0 for backend in pending}
+        futures = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            def submit_ready():
+                for backend, queue in pending.items():
+                    limit = max(1, self.backend_limits.get(backend, 1))
+                    while queue and running[backend] < limit and len(futures) < self.max_workers:
+                        cell = queue.popleft()
+                        futures[executor.submit(self._execute, cell)] = backend
+                        running[backend] += 1
+
+            submit_ready()
+            while futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    running[futures.pop(future)] -= 1
+                    yield future.result()
+                submit_ready()
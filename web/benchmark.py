@@ -0,0 +1,226 @@
+"""End-to-end benchmark of the annotation pipeline against the mock LLM server."""
+import json
+import os
+import resource
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DESCRIPTIONS = [
+    'A red circle appears in the center of the screen',
+    'The participant presses the left button with the index finger to indicate that the target was seen',
+    'A 440 Hz tone is played through the headphones for 200 ms',
+    'Three pieces of fruit are shown in the foreground while a person walks outdoors in the background',
+    'A green square flashes briefly and the participant moves their eyes toward it',
+    'A fixation cross is displayed at the start of each trial',
+    'The experimenter says the word apple and the participant repeats it aloud',
+    'A car drives past a row of trees on a city street',
+]
+
+# Pipeline stage -> app function whose calls are timed
+STAGE_FUNCTIONS = {
+    'render': 'prepare_prompt',
+    'inference': 'cached_generate_response',
+    'extraction': 'extract_annotations',
+    'validation': 'validate_hed_string',
+    'grading': 'grade_annotation_quality',
+    'persistence': 'auto_save_experiment',
+}
+
+
+def configure_environment(workdir, mock_url):
+    """
+    Point the app at the mock server and at throwaway stores; must run
+    before app is imported since those settings are read at import time.
+    """
+    os.makedirs(workdir, exist_ok=True)
+    os.environ['EXPERIMENTS_DB'] = os.path.join(workdir, 'experiments.db')
+    os.environ['RESPONSE_CACHE_DB'] = os.path.join(workdir, 'response_cache.db')
+    os.environ['RESCORE_CHECKPOINT_DIR'] = os.path.join(workdir, 'rescore_jobs')
+    os.environ['OLLAMA_HOST'] = mock_url
+    os.environ['GEMINI_API_KEY'] = 'mock'
+    os.environ['GEMINI_BASE_URL'] = mock_url + '/'
+    os.environ['ASYNC_SCORING'] = '0'
+
+
+def percentile(values, q):
+    """Linear-interpolated percentile (q in 0-100) of a list of numbers"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def summarize_durations(values):
+    return {
+        'count': len(values),
+        'mean': sum(values) / len(values),
+        'p50': percentile(values, 50),
+        'p95': percentile(values, 95),
+        'p99': percentile(values, 99)
+    }
+
+
+class StageTimer:
+    """
+    Wraps the app's stage functions to time every call. Calls made inside
+    another timed stage are recorded under both names (e.g. the grader's
+    model call is grading/inference, not inference).
+    """
+
+    def __init__(self, app_module):
+        self.app = app_module
+        self.durations = defaultdict(list)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._originals = {}
+
+    def _wrap(self, stage, function):
+        def timed(*args, **kwargs):
+            stack = getattr(self._local, 'stack', None)
+            if stack is None:
+                stack = self._local.stack = []
+            stack.append(stage)
+            name = '/'.join(stack)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                stack.pop()
+                with self._lock:
+                    self.durations[name].append(elapsed)
+        return timed
+
+    def install(self):
+        for stage, attribute in STAGE_FUNCTIONS.items():
+            self._originals[attribute] = getattr(self.app, attribute)
+            setattr(self.app, attribute, self._wrap(stage, self._originals[attribute]))
+        return self
+
+    def restore(self):
+        for attribute, function in self._originals.items():
+            setattr(self.app, attribute, function)
+        self._originals = {}
+
+    def reset(self):
+        with self._lock:
+            self.durations = defaultdict(list)
+
+    def record(self, stage, elapsed):
+        with self._lock:
+            self.durations[stage].append(elapsed)
+
+
+def run_level(app_module, timer, concurrency, requests, models, vocab_retrieval=False):
+    """Run `requests` experiments with `concurrency` in flight; returns the level's report"""
+    timer.reset()
+    errors = []
+
+    def one(index):
+        start = time.perf_counter()
+        try:
+            app_module.execute_experiment(models[index % len(models)], app_module.DEFAULT_PROMPT_TEMPLATE,
+                                          BENCH_DESCRIPTIONS[index % len(BENCH_DESCRIPTIONS)], 'benchmark',
+                                          use_cache=False, vocab_retrieval=vocab_retrieval, async_scoring=False)
+        except Exception as e:
+            errors.append(str(e))
+        timer.record('total', time.perf_counter() - start)
+
+    tracemalloc.reset_peak()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(one, range(requests)))
+    wall_time = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+
+    return {
+        'concurrency': concurrency,
+        'requests': requests,
+        'errors': len(errors),
+        'first_error': errors[0] if errors else None,
+        'wall_time': wall_time,
+        'requests_per_sec': requests / wall_time if wall_time else None,
+        'peak_traced_mb': peak / 2 ** 20,
+        'stages': {stage: summarize_durations(values) for stage, values in sorted(timer.durations.items())}
+    }
+
+
+def run_benchmark(app_module, concurrency_levels=(1, 4, 16), requests=32, models=('qwen3:8b',),
+                  vocab_retrieval=False, mock_config=None):
+    """Benchmark the pipeline at each concurrency level; returns the full report"""
+    timer = StageTimer(app_module).install()
+    tracemalloc.start()
+    try:
+        # Warm up caches, stores and connections outside the measurements
+        app_module.get_store()
+        run_level(app_module, timer, 1, 1, list(models), vocab_retrieval)
+        levels = {str(c): run_level(app_module, timer, c, requests, list(models), vocab_retrieval)
+                  for c in concurrency_levels}
+    finally:
+        tracemalloc.stop()
+        timer.restore()
+    return {
+        'config': {
+            'requests_per_level': requests,
+            'models': list(models),
+            'vocab_retrieval': bool(vocab_retrieval),
+            'mock': mock_config or {}
+        },
+        'levels': levels,
+        # ru_maxrss is in KiB on Linux
+        'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    }
+
+
+def compare_to_baseline(report, baseline, tolerance=0.2, min_delta=0.002):
+    """
+    Return a list of regressions of report against baseline: a lower
+    request rate, a higher p95 for any stage (by more than min_delta
+    seconds) or a higher memory peak, each beyond the relative tolerance.
+    """
+    regressions = []
+    for level, base in baseline.get('levels', {}).items():
+        current = report['levels'].get(level)
+        if current is None:
+            continue
+        if base.get('requests_per_sec') and current['requests_per_sec'] < base['requests_per_sec'] * (1 - tolerance):
+            regressions.append(f"c={level} requests/s {current['requests_per_sec']:.2f} < "
+                               f"baseline {base['requests_per_sec']:.2f}")
+        for stage, base_stats in base.get('stages', {}).items():
+            stats = current['stages'].get(stage)
+            if stats is None:
+                continue
+            limit = max(base_stats['p95'] * (1 + tolerance), base_stats['p95'] + min_delta)
+            if stats['p95'] > limit:
+                regressions.append(f"c={level} {stage} p95 {stats['p95'] * 1000:.1f}ms > "
+                                   f"baseline {base_stats['p95'] * 1000:.1f}ms")
+        if base.get('peak_traced_mb') and current['peak_traced_mb'] > base['peak_traced_mb'] * (1 + tolerance):
+            regressions.append(f"c={level} peak memory {current['peak_traced_mb']:.1f}MB > "
+                               f"baseline {base['peak_traced_mb']:.1f}MB")
+    return regressions
+
+
+def format_report(report):
+    """Render the report as a plain-text table"""
+    lines = []
+    for level, result in report['levels'].items():
+        lines.append(f"concurrency {level}: {result['requests']} requests in {result['wall_time']:.2f}s "
+                     f"({result['requests_per_sec']:.2f} req/s), {result['errors']} errors, "
+                     f"peak traced memory {result['peak_traced_mb']:.1f}MB")
+        lines.append(f"  {'stage':<22}{'count':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        for stage, stats in result['stages'].items():
+            lines.append(f"  {stage:<22}{stats['count']:>6}{stats['p50'] * 1000:>10.2f}"
+                         f"{stats['p95'] * 1000:>10.2f}{stats['p99'] * 1000:>10.2f}")
+    lines.append(f"max RSS {report['max_rss_mb']:.1f}MB")
+    return '\n'.join(lines)
+
+
+def load_baseline(path):
+    with open(path, 'r') as f:
+        return json.load(f)
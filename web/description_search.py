@@ -0,0 +1,210 @@
+"""Search index over the description history: substring/prefix and fuzzy matches, and similar descriptions."""
+import bisect
+import hashlib
+import heapq
+import math
+from collections import Counter, defaultdict
+from functools import lru_cache
+
+import numpy as np
+
+from vocab_retrieval import tokenize
+
+DEFAULT_SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+DEFAULT_SIMILAR_K = 5
+# Dimensions of the hashed description vectors
+VECTOR_DIMENSIONS = 256
+# Word bigrams count for less than single words in a description vector
+BIGRAM_WEIGHT = 0.5
+# Share of a query's trigrams a description must contain to be a fuzzy match
+FUZZY_THRESHOLD = 0.5
+INITIAL_CAPACITY = 256
+
+# Rank of each kind of match; lower is listed first
+MATCH_RANK = {'exact': 0, 'prefix': 1, 'word-prefix': 2, 'substring': 3, 'fuzzy': 4}
+
+
+def trigrams(text):
+    """Character trigrams of text, padded so word starts and short texts have some"""
+    text = f'  {text} '
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+@lru_cache(maxsize=65536)
+def _feature(feature):
+    """Stable (dimension, sign) of a feature; Python's hash() changes between processes"""
+    digest = int.from_bytes(hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest(), 'little')
+    return digest % VECTOR_DIMENSIONS, 1.0 if digest >> 63 else -1.0
+
+
+class DescriptionIndex:
+    """
+    Incremental index of distinct descriptions.
+
+    Text search uses a trigram inverted index: a substring query is answered
+    by intersecting the postings of its trigrams and confirming the few
+    candidates, a fuzzy query by counting shared trigrams, and queries too
+    short for trigrams by bisecting a sorted word list. Similarity search
+    uses a local vector index: each description is a hashed bag of its
+    stemmed words and word pairs in one row of a NumPy matrix, and a query
+    (weighted by how rare its words are in the history) is ranked against
+    every row with a single matrix product.
+
+    Descriptions are added and removed one at a time as experiments are
+    written; the owner (SummaryIndex) serializes access.
+    """
+
+    def __init__(self, dimensions=VECTOR_DIMENSIONS):
+        self.dimensions = dimensions
+        self._texts = []
+        self._lowered = []
+        self._ids = {}
+        self._free = []
+        self._trigrams = defaultdict(set)
+        self._words = []
+        self._word_ids = defaultdict(set)
+        self._document_frequency = Counter()
+        self._vectors = np.zeros((INITIAL_CAPACITY, dimensions), dtype=np.float32)
+
+    def __len__(self):
+        return len(self._ids)
+
+    def _features(self, text):
+        tokens = tokenize(text)
+        features = Counter(tokens)
+        for first, second in zip(tokens, tokens[1:]):
+            features[f'{first} {second}'] += BIGRAM_WEIGHT
+        return features
+
+    def _vector(self, weights):
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for feature, weight in weights.items():
+            dimension, sign = _feature(feature)
+            vector[dimension] += sign * weight
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def add(self, description):
+        if description in self._ids:
+            return
+        lowered = description.lower()
+        if self._free:
+            slot = self._free.pop()
+            self._texts[slot], self._lowered[slot] = description, lowered
+        else:
+            slot = len(self._texts)
+            self._texts.append(description)
+            self._lowered.append(lowered)
+            if slot >= len(self._vectors):
+                grown = np.zeros((2 * len(self._vectors), self.dimensions), dtype=np.float32)
+                grown[:len(self._vectors)] = self._vectors
+                self._vectors = grown
+        self._ids[description] = slot
+        for trigram in trigrams(lowered):
+            self._trigrams[trigram].add(slot)
+        for word in set(lowered.split()):
+            if not self._word_ids[word]:
+                bisect.insort(self._words, word)
+            self._word_ids[word].add(slot)
+        features = self._features(description)
+        self._document_frequency.update(features.keys())
+        self._vectors[slot] = self._vector(features)
+
+    def remove(self, description):
+        slot = self._ids.pop(description, None)
+        if slot is None:
+            return
+        lowered = self._lowered[slot]
+        for trigram in trigrams(lowered):
+            self._trigrams[trigram].discard(slot)
+            if not self._trigrams[trigram]:
+                del self._trigrams[trigram]
+        for word in set(lowered.split()):
+            self._word_ids[word].discard(slot)
+            if not self._word_ids[word]:
+                del self._word_ids[word]
+                del self._words[bisect.bisect_left(self._words, word)]
+        for feature in self._features(description):
+            self._document_frequency[feature] -= 1
+            if self._document_frequency[feature] <= 0:
+                del self._document_frequency[feature]
+        self._vectors[slot] = 0
+        self._texts[slot] = self._lowered[slot] = None
+        self._free.append(slot)
+
+    def _word_prefix_slots(self, prefix):
+        slots = set()
+        start = bisect.bisect_left(self._words, prefix)
+        for word in self._words[start:]:
+            if not word.startswith(prefix):
+                break
+            slots |= self._word_ids[word]
+        return slots
+
+    def search(self, query, counts, limit=DEFAULT_SEARCH_LIMIT, fuzzy=True):
+        """
+        Descriptions containing query (case-insensitive), best kind of match
+        first (exact, prefix, word prefix, substring), then the most used;
+        with fuzzy, descriptions sharing most of its trigrams fill up the rest.
+        counts maps descriptions to their usage. Returns dicts with
+        description, count, match and score (1 for text matches).
+        """
+        query = query.strip().lower()
+        if len(query) < 3:
+            candidates = self._word_prefix_slots(query)
+        else:
+            # A substring of a description has all of its trigrams in the description's
+            postings = sorted((self._trigrams.get(query[i:i + 3], set()) for i in range(len(query) - 2)), key=len)
+            candidates = set.intersection(*postings)
+        found = {}
+        for slot in candidates:
+            text = self._lowered[slot]
+            if text == query:
+                kind = 'exact'
+            elif text.startswith(query):
+                kind = 'prefix'
+            elif f' {query}' in f' {text}':
+                kind = 'word-prefix'
+            elif query in text:
+                kind = 'substring'
+            else:
+                continue
+            found[slot] = (kind, 1.0)
+
+        if fuzzy and len(found) < limit and len(query) >= 3:
+            query_trigrams = trigrams(query)
+            # Count the query trigrams each description has in one pass over their postings
+            postings = [np.fromiter(self._trigrams.get(trigram, ()), dtype=np.int64) for trigram in query_trigrams]
+            shared = np.bincount(np.concatenate(postings), minlength=len(self._texts)) / len(query_trigrams)
+            for slot in np.flatnonzero(shared >= FUZZY_THRESHOLD).tolist():
+                if slot not in found:
+                    found[slot] = ('fuzzy', float(shared[slot]))
+
+        ranked = heapq.nsmallest(limit, found.items(), key=lambda item: (
+            MATCH_RANK[item[1][0]], -item[1][1], -counts.get(self._texts[item[0]], 0), self._lowered[item[0]]))
+        return [{'description': self._texts[slot], 'count': counts.get(self._texts[slot], 0), 'match': kind,
+                 'score': round(score, 3)} for slot, (kind, score) in ranked]
+
+    def similar(self, text, counts, k=DEFAULT_SIMILAR_K, exclude_self=True):
+        """Top-k descriptions by cosine similarity of their vectors to text's, with their usage counts"""
+        if not self._ids or k <= 0:
+            return []
+        total = len(self._ids)
+        features = self._features(text)
+        # Words most descriptions share say little about which stimulus it is; words no description has only
+        # add hash collisions
+        weights = {feature: weight * math.log(1 + total / self._document_frequency[feature])
+                   for feature, weight in features.items() if self._document_frequency.get(feature)}
+        query = self._vector(weights)
+        if not query.any():
+            return []
+        scores = self._vectors[:len(self._texts)] @ query
+        own = self._ids.get(text.strip())
+        if exclude_self and own is not None:
+            scores[own] = -np.inf
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return [{'description': self._texts[slot], 'count': counts.get(self._texts[slot], 0),
+                 'score': round(float(scores[slot]), 3)} for slot in top if scores[slot] > 0]
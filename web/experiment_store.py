@@ -0,0 +1,532 @@
+"""SQLite-backed experiment storage with a summary index separate from the large payloads."""
+import datetime
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from pathlib import Path
+
+from resources import compile_template
+
+EXPERIMENTS_DIR = Path(__file__).parent.parent / 'prompt_experiments'
+HED_VOCAB_PATH = Path(__file__).parent.parent / 'HED_vocab_reformatted.xml'
+DEFAULT_DB_PATH = Path(os.getenv('EXPERIMENTS_DB', EXPERIMENTS_DIR / 'experiments.db'))
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS experiments (
+    experiment_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    filename TEXT UNIQUE,
+    model TEXT,
+    timestamp TEXT,
+    inference_time REAL,
+    experiment_name TEXT,
+    description TEXT,
+    validation_issues INTEGER,
+    annotation TEXT,
+    quality_score REAL,
+    revision INTEGER,
+    template_hash TEXT,
+    source_file TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_experiments_description ON experiments(description);
+CREATE INDEX IF NOT EXISTS idx_experiments_model ON experiments(model, experiment_id);
+CREATE INDEX IF NOT EXISTS idx_experiments_timestamp ON experiments(timestamp);
+CREATE TABLE IF NOT EXISTS experiment_payloads (
+    experiment_id INTEGER PRIMARY KEY REFERENCES experiments(experiment_id) ON DELETE CASCADE,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS blobs (
+    hash TEXT PRIMARY KEY,
+    content TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS gold_annotations (
+    description TEXT PRIMARY KEY,
+    annotation TEXT NOT NULL,
+    updated_at TEXT
+);
+'''
+
+SUMMARY_COLUMNS = ['experiment_id', 'filename', 'model', 'timestamp', 'inference_time', 'experiment_name',
+                   'description', 'validation_issues', 'annotation', 'quality_score']
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+# Listing filter -> SQL condition on the summary table
+SUMMARY_FILTERS = {
+    'model': 'model = ?',
+    'name': "experiment_name LIKE '%' || ? || '%' ESCAPE '\\'",
+    'since': 'timestamp >= ?',
+    'until': 'timestamp <= ?',
+    'min_score': 'quality_score >= ?',
+    'max_score': 'quality_score <= ?',
+    'validation_issues': 'validation_issues = ?',
+    'max_issues': 'validation_issues <= ?'
+}
+
+
+def escape_like(value):
+    """Escape LIKE wildcards so value matches as a plain substring (with ESCAPE '\\')"""
+    return str(value).replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+# Filters whose value is rewritten before it is bound
+SUMMARY_FILTER_VALUES = {'name': escape_like}
+
+
+def summary_query_columns(order, fields, filters):
+    """Validate a listing query and return the columns it selects (experiment_id always first)"""
+    unknown = set(filters) - set(SUMMARY_FILTERS)
+    if unknown:
+        raise ValueError(f"Unknown filter: {', '.join(sorted(unknown))}")
+    if order not in ('asc', 'desc'):
+        raise ValueError("order must be 'asc' or 'desc'")
+    columns = list(fields) if fields else list(SUMMARY_COLUMNS)
+    invalid = [column for column in columns if column not in SUMMARY_COLUMNS]
+    if invalid:
+        raise ValueError(f"Unknown field: {', '.join(invalid)}")
+    if 'experiment_id' not in columns:
+        columns.insert(0, 'experiment_id')
+    return columns
+
+
+def experiment_filename(experiment_id):
+    """Return the legacy filename used to address an experiment"""
+    return f'experiment_{experiment_id}.json'
+
+
+def content_hash(content):
+    """Return the SHA-256 hex digest used to address a blob"""
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def render_prompt(prompt_template, hed_vocab, description):
+    """Render a prompt exactly the way run_experiment does"""
+    return compile_template(prompt_template).render(hed_vocab=hed_vocab, description=description)
+
+
+def summarize(data):
+    """Project an experiment record onto the summary columns"""
+    quality_grade = data.get('quality_grade') or {}
+    annotation = data.get('annotation')
+    if annotation is None:
+        annotation = data['annotations'][0] if data.get('annotations') else ''
+    return {
+        'model': data.get('model', 'Unknown'),
+        'timestamp': data.get('timestamp', 'Unknown'),
+        'inference_time': data.get('inference_time'),
+        'experiment_name': data.get('experiment_name', ''),
+        'description': data.get('description', ''),
+        'validation_issues': data.get('validation_issues', data.get('total_validation_issues', 0)),
+        'annotation': annotation,
+        'quality_score': quality_grade.get('score'),
+        'template_hash': data.get('prompt_template_hash')
+    }
+
+
+class ExperimentStore:
+    """
+    Experiments live in two tables: `experiments` holds the small columns the
+    listing pages need and `experiment_payloads` holds the full JSON record
+    (model response, grades). Listing never touches the payloads.
+    IDs come from SQLite's AUTOINCREMENT, so allocation is a single insert.
+
+    Prompt templates, vocabularies and rendered prompts are stored once in the
+    content-addressed `blobs` table and referenced from payloads by hash. A
+    rendered prompt that can be reproduced from its template, vocab and
+    description is not stored at all; it is re-rendered on read.
+    """
+
+    def __init__(self, db_path=DEFAULT_DB_PATH):
+        self.db_path = Path(db_path)
+        self._local = threading.local()
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection().executescript(SCHEMA)
+        self._add_revision_column()
+        self._add_template_hash_column()
+        self._add_source_file_column()
+
+    def _add_revision_column(self):
+        """Give databases created before summary revisions existed a revision for every row"""
+        conn = self.connection()
+        columns = [row['name'] for row in conn.execute('PRAGMA table_info(experiments)')]
+        if 'revision' not in columns:
+            with self.transaction() as conn:
+                # Another process may have migrated between the check and the lock
+                columns = [row['name'] for row in conn.execute('PRAGMA table_info(experiments)')]
+                if 'revision' not in columns:
+                    conn.execute('ALTER TABLE experiments ADD COLUMN revision INTEGER')
+                    conn.execute('UPDATE experiments SET revision = experiment_id')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_experiments_revision ON experiments(revision)')
+
+    def _add_template_hash_column(self):
+        """Give databases created before analytics existed the template hash of every row, read from its payload"""
+        conn = self.connection()
+        columns = [row['name'] for row in conn.execute('PRAGMA table_info(experiments)')]
+        if 'template_hash' not in columns:
+            with self.transaction() as conn:
+                columns = [row['name'] for row in conn.execute('PRAGMA table_info(experiments)')]
+                if 'template_hash' not in columns:
+                    conn.execute('ALTER TABLE experiments ADD COLUMN template_hash TEXT')
+                    conn.execute(
+                        '''UPDATE experiments SET template_hash = (
+                               SELECT json_extract(data, '$.prompt_template_hash') FROM experiment_payloads p
+                               WHERE p.experiment_id = experiments.experiment_id)''')
+
+    def _add_source_file_column(self):
+        """Give databases created before imports recorded their source file the (empty) column and its index"""
+        conn = self.connection()
+        columns = [row['name'] for row in conn.execute('PRAGMA table_info(experiments)')]
+        if 'source_file' not in columns:
+            with self.transaction() as conn:
+                columns = [row['name'] for row in conn.execute('PRAGMA table_info(experiments)')]
+                if 'source_file' not in columns:
+                    conn.execute('ALTER TABLE experiments ADD COLUMN source_file TEXT')
+        conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_experiments_source_file ON experiments(source_file)')
+
+    def connection(self):
+        """Return this thread's connection, opening it on first use"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA foreign_keys=ON')
+            self._local.conn = conn
+        return conn
+
+    def transaction(self):
+        return _Transaction(self.connection())
+
+    def count(self):
+        return self.connection().execute('SELECT COUNT(*) FROM experiments').fetchone()[0]
+
+    def put_blob(self, conn, content):
+        """Store content once and return its hash"""
+        digest = content_hash(content)
+        conn.execute('INSERT OR IGNORE INTO blobs (hash, content) VALUES (?, ?)', (digest, content))
+        return digest
+
+    def get_blob(self, digest):
+        row = self.connection().execute('SELECT content FROM blobs WHERE hash = ?', (digest,)).fetchone()
+        return row['content'] if row else None
+
+    def _dehydrate(self, conn, data, hed_vocab=None):
+        """Replace large inline fields with blob hashes"""
+        record = dict(data)
+        prompt_template = record.pop('prompt_template', None)
+        if prompt_template is not None:
+            record['prompt_template_hash'] = self.put_blob(conn, prompt_template)
+        if hed_vocab is not None:
+            record['hed_vocab_hash'] = self.put_blob(conn, hed_vocab)
+
+        prompt = record.pop('prompt', None)
+        if prompt is not None:
+            reproducible = (hed_vocab is not None and prompt_template is not None
+                            and render_prompt(prompt_template, hed_vocab, record.get('description', '')) == prompt)
+            if reproducible:
+                record.pop('prompt_hash', None)
+            else:
+                record['prompt_hash'] = self.put_blob(conn, prompt)
+        return record
+
+    def _rehydrate(self, record):
+        """Inline the blobs referenced by a stored record"""
+        data = dict(record)
+        if 'prompt_template_hash' in data:
+            data['prompt_template'] = self.get_blob(data['prompt_template_hash'])
+        if 'prompt_hash' in data:
+            data['prompt'] = self.get_blob(data['prompt_hash'])
+        elif 'hed_vocab_hash' in data and data.get('prompt_template') is not None:
+            hed_vocab = self.get_blob(data['hed_vocab_hash'])
+            data['prompt'] = render_prompt(data['prompt_template'], hed_vocab, data.get('description', ''))
+        return data
+
+    def _write(self, conn, experiment_id, data, hed_vocab=None):
+        record = self._dehydrate(conn, data, hed_vocab)
+        summary = summarize(record)
+        # Every write takes the next revision, so readers can fetch just the rows changed since they last looked
+        conn.execute(
+            f'''UPDATE experiments SET {', '.join(f'{k} = ?' for k in summary)},
+                revision = (SELECT COALESCE(MAX(revision), 0) + 1 FROM experiments)
+                WHERE experiment_id = ?''',
+            [*summary.values(), experiment_id]
+        )
+        conn.execute('INSERT OR REPLACE INTO experiment_payloads (experiment_id, data) VALUES (?, ?)',
+                     (experiment_id, json.dumps(record)))
+
+    def save(self, experiment_data, experiment_id=None, filename=None, hed_vocab=None):
+        """
+        Insert a new experiment, returning (filename, experiment_id).
+        Pass the vocab the prompt was rendered with so the prompt can be stored by reference.
+        """
+        with self.transaction() as conn:
+            return self._insert(conn, experiment_data, experiment_id, filename, hed_vocab)
+
+    def _insert(self, conn, experiment_data, experiment_id=None, filename=None, hed_vocab=None):
+        cursor = conn.execute('INSERT INTO experiments (experiment_id) VALUES (?)', (experiment_id,))
+        experiment_id = cursor.lastrowid
+        filename = filename or experiment_filename(experiment_id)
+        conn.execute('UPDATE experiments SET filename = ? WHERE experiment_id = ?', (filename, experiment_id))
+        experiment_data['experiment_id'] = experiment_id
+        self._write(conn, experiment_id, experiment_data, hed_vocab)
+        return filename, experiment_id
+
+    def get(self, filename, rehydrate=True):
+        """Return the full experiment record, or None if it does not exist"""
+        row = self.connection().execute(
+            '''SELECT p.data FROM experiments e JOIN experiment_payloads p USING (experiment_id)
+               WHERE e.filename = ?''', (filename,)).fetchone()
+        if row is None:
+            return None
+        data = json.loads(row['data'])
+        return self._rehydrate(data) if rehydrate else data
+
+    def update(self, filename, changes):
+        """Merge changes into a stored experiment; returns False if it does not exist"""
+        with self.transaction() as conn:
+            row = conn.execute(
+                '''SELECT e.experiment_id, p.data FROM experiments e JOIN experiment_payloads p USING (experiment_id)
+                   WHERE e.filename = ?''', (filename,)).fetchone()
+            if row is None:
+                return False
+            data = json.loads(row['data'])
+            data.update(changes)
+            self._write(conn, row['experiment_id'], data)
+        return True
+
+    def list_summaries(self):
+        """Return summary rows for every experiment, most recent first"""
+        rows = self.connection().execute(
+            f'''SELECT {', '.join(SUMMARY_COLUMNS)} FROM experiments
+                WHERE filename IS NOT NULL ORDER BY experiment_id DESC''').fetchall()
+        return [dict(row) for row in rows]
+
+    def query_summaries(self, cursor=None, limit=DEFAULT_PAGE_SIZE, order='desc', fields=None, **filters):
+        """
+        Return (rows, next_cursor) for one page of summary rows.
+
+        Pages are keyed on experiment_id (rows after `cursor` in the requested
+        order), so every page costs the same however long the history is.
+        Filters are the keys of SUMMARY_FILTERS; empty values are ignored.
+        """
+        columns = summary_query_columns(order, fields, filters)
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+
+        conditions = ['filename IS NOT NULL']
+        params = []
+        for key, value in filters.items():
+            if value is not None and value != '':
+                conditions.append(SUMMARY_FILTERS[key])
+                params.append(SUMMARY_FILTER_VALUES[key](value) if key in SUMMARY_FILTER_VALUES else value)
+        if cursor is not None:
+            conditions.append('experiment_id < ?' if order == 'desc' else 'experiment_id > ?')
+            params.append(int(cursor))
+
+        # Fetch one extra row to learn whether there is another page
+        rows = self.connection().execute(
+            f'''SELECT {', '.join(columns)} FROM experiments
+                WHERE {' AND '.join(conditions)}
+                ORDER BY experiment_id {order.upper()} LIMIT ?''', params + [limit + 1]).fetchall()
+        rows = [dict(row) for row in rows]
+        next_cursor = rows[limit - 1]['experiment_id'] if len(rows) > limit else None
+        return rows[:limit], next_cursor
+
+    def description_counts(self):
+        """Return (description, count) pairs sorted by usage then alphabetically"""
+        rows = self.connection().execute(
+            '''SELECT TRIM(description) AS description, COUNT(*) AS count FROM experiments
+               WHERE TRIM(COALESCE(description, '')) != ''
+               GROUP BY TRIM(description) ORDER BY count DESC, description ASC''').fetchall()
+        return [(row['description'], row['count']) for row in rows]
+
+    def claim_unfinished_scoring(self, owner, owner_alive):
+        """
+        Take over experiments whose background scoring is pending or running
+        for an owner process that is gone (owner_alive(pid) is False), record
+        owner as their new owner and return their (filename, description,
+        annotation). Claiming is one transaction, so two processes starting
+        together never both take the same experiment.
+        """
+        with self.transaction() as conn:
+            rows = conn.execute(
+                '''SELECT e.experiment_id, e.filename, e.description, e.annotation,
+                          json_extract(p.data, '$.scoring_owner') AS owner
+                   FROM experiments e JOIN experiment_payloads p USING (experiment_id)
+                   WHERE e.filename IS NOT NULL AND json_extract(p.data, '$.scoring_status') IN ('pending', 'running')
+                   ORDER BY e.experiment_id''').fetchall()
+            claimed = [row for row in rows if row['owner'] is None or not owner_alive(row['owner'])]
+            conn.executemany("UPDATE experiment_payloads SET data = json_set(data, '$.scoring_owner', ?) "
+                             "WHERE experiment_id = ?", [(owner, row['experiment_id']) for row in claimed])
+        return [(row['filename'], row['description'], row['annotation']) for row in claimed]
+
+    def gold_annotations(self, descriptions=None):
+        """Return {description: gold annotation} for the given descriptions (trimmed), or for all of them"""
+        conn = self.connection()
+        if descriptions is None:
+            rows = conn.execute('SELECT description, annotation FROM gold_annotations').fetchall()
+        else:
+            descriptions = list({(description or '').strip() for description in descriptions})
+            rows = []
+            # Stay under SQLite's bound-parameter limit
+            for start in range(0, len(descriptions), MAX_PAGE_SIZE):
+                chunk = descriptions[start:start + MAX_PAGE_SIZE]
+                rows.extend(conn.execute(
+                    f"SELECT description, annotation FROM gold_annotations "
+                    f"WHERE description IN ({', '.join('?' * len(chunk))})", chunk).fetchall())
+        return {row['description']: row['annotation'] for row in rows}
+
+    def list_gold_annotations(self):
+        rows = self.connection().execute(
+            'SELECT description, annotation, updated_at FROM gold_annotations ORDER BY description').fetchall()
+        return [dict(row) for row in rows]
+
+    def set_gold_annotation(self, description, annotation):
+        """Store the reference annotation of a description; an empty annotation removes it"""
+        description = (description or '').strip()
+        annotation = (annotation or '').strip()
+        with self.transaction() as conn:
+            if annotation:
+                conn.execute(
+                    '''INSERT INTO gold_annotations (description, annotation, updated_at) VALUES (?, ?, ?)
+                       ON CONFLICT(description) DO UPDATE SET annotation = excluded.annotation,
+                                                              updated_at = excluded.updated_at''',
+                    (description, annotation, datetime.datetime.now().isoformat()))
+            else:
+                conn.execute('DELETE FROM gold_annotations WHERE description = ?', (description,))
+
+    def compact(self, hed_vocab=None):
+        """Move inline templates and prompts of existing payloads into the blob store"""
+        compacted = 0
+        rows = self.connection().execute('SELECT experiment_id, data FROM experiment_payloads').fetchall()
+        for row in rows:
+            data = json.loads(row['data'])
+            if 'prompt_template' not in data and 'prompt' not in data:
+                continue
+            with self.transaction() as conn:
+                self._write(conn, row['experiment_id'], data, hed_vocab)
+            compacted += 1
+        return compacted
+
+    def storage_stats(self):
+        """Return byte counts for payloads and blobs"""
+        conn = self.connection()
+        payload_bytes = conn.execute('SELECT COALESCE(SUM(LENGTH(data)), 0) FROM experiment_payloads').fetchone()[0]
+        blob_count, blob_bytes = conn.execute('SELECT COUNT(*), COALESCE(SUM(LENGTH(content)), 0) FROM blobs').fetchone()
+        return {
+            'experiments': self.count(),
+            'payload_bytes': payload_bytes,
+            'blobs': blob_count,
+            'blob_bytes': blob_bytes
+        }
+
+    def has(self, filename):
+        return self.connection().execute(
+            'SELECT 1 FROM experiments WHERE filename = ?', (filename,)).fetchone() is not None
+
+    def imported(self, source_file):
+        """Whether a JSON file of this name was imported, under its own name or under a fresh ID"""
+        return self.connection().execute(
+            'SELECT 1 FROM experiments WHERE filename = ? OR source_file = ?',
+            (source_file, source_file)).fetchone() is not None
+
+    def import_json_file(self, file_path, hed_vocab=None):
+        """
+        Import one legacy experiment JSON file, keeping its ID when it is free.
+        The file's name is recorded as its source, so a file imported under a
+        fresh ID is not imported again. The checks and the insert share one
+        transaction, so processes importing the same directory at once never
+        import a file twice or race for an ID.
+        """
+        file_path = Path(file_path)
+        if self.imported(file_path.name):
+            return None
+        with open(file_path, 'r') as f:
+            data = json.load(f)
+        experiment_id = data.get('experiment_id')
+        if experiment_id is None:
+            # Extract from filename for backward compatibility
+            try:
+                experiment_id = int(file_path.stem.split('_')[1])
+            except (ValueError, IndexError):
+                experiment_id = None
+        with self.transaction() as conn:
+            if conn.execute('SELECT 1 FROM experiments WHERE filename = ? OR source_file = ?',
+                            (file_path.name, file_path.name)).fetchone():
+                return None
+            taken = experiment_id is not None and conn.execute(
+                'SELECT 1 FROM experiments WHERE experiment_id = ?', (experiment_id,)).fetchone()
+            if taken:
+                # Another record already owns this ID; give the import a fresh one
+                filename, experiment_id = self._insert(conn, data, hed_vocab=hed_vocab)
+            else:
+                filename, experiment_id = self._insert(conn, data, experiment_id, file_path.name, hed_vocab)
+            conn.execute('UPDATE experiments SET source_file = ? WHERE experiment_id = ?',
+                         (file_path.name, experiment_id))
+            return filename, experiment_id
+
+    def migrate_json_dir(self, directory=EXPERIMENTS_DIR, remove=False, hed_vocab=None):
+        """Import every experiment_*.json file in a directory; returns (imported, skipped, failed)"""
+        imported, skipped, failed = 0, 0, 0
+        for file_path in sorted(Path(directory).glob('*.json'), key=_file_sort_key):
+            try:
+                if self.import_json_file(file_path, hed_vocab) is None:
+                    skipped += 1
+                else:
+                    imported += 1
+                if remove:
+                    file_path.unlink()
+            except Exception as e:
+                failed += 1
+                print(f"Error importing experiment {file_path}: {e}")
+        return imported, skipped, failed
+
+
+class _Transaction:
+    """Context manager running a write transaction that takes the DB write lock up front"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute('BEGIN IMMEDIATE')
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute('ROLLBACK' if exc_type else 'COMMIT')
+        return False
+
+
+def read_current_vocab():
+    """Read the vocabulary file legacy prompts were most likely rendered with"""
+    try:
+        with open(HED_VOCAB_PATH, 'r') as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def _file_sort_key(file_path):
+    try:
+        return (0, int(file_path.stem.split('_')[1]), file_path.name)
+    except (ValueError, IndexError):
+        return (1, 0, file_path.name)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """Return the process-wide store, importing legacy JSON files into a new database"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            store = ExperimentStore()
+            if store.count() == 0 and any(EXPERIMENTS_DIR.glob('*.json')):
+                imported, _, _ = store.migrate_json_dir(hed_vocab=read_current_vocab())
+                print(f"Imported {imported} legacy experiment files into {store.db_path}")
+            _store = store
+        return _store
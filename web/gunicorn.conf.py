@@ -0,0 +1,40 @@
+"""Gunicorn settings for serving the app to several users: `uv run gunicorn -c web/gunicorn.conf.py`."""
+import os
+from pathlib import Path
+
+chdir = str(Path(__file__).parent)
+wsgi_app = 'wsgi:app'
+bind = os.getenv('BIND', '0.0.0.0:3000')
+
+# Requests spend most of their time waiting on the model, so one worker
+# serves them from a thread pool. Experiments, scoring results and rescore
+# checkpoints live in SQLite and on disk, but the model residency scheduler,
+# the background scoring and rescore queues (and the 409 for a second rescore
+# job), the admission limit and /metrics are per process: with more than one
+# worker each has its own, so Ollama may be asked to load several models at
+# once, job status depends on which worker answers and /metrics shows one
+# worker's counters. Raise WEB_THREADS rather than WEB_WORKERS to serve more
+# users. A starting worker takes over unfinished scoring only from processes
+# that are gone, so the old worker of a graceful reload (HUP) finishes its own.
+workers = int(os.getenv('WEB_WORKERS', '1'))
+worker_class = 'gthread'
+threads = int(os.getenv('WEB_THREADS', '16'))
+
+# Connection limits: at most workers x threads connections are served at once,
+# up to `backlog` more wait to be accepted and the rest are refused by the OS
+backlog = int(os.getenv('WEB_BACKLOG', '64'))
+keepalive = 5
+limit_request_line = 8190
+limit_request_fields = 100
+
+# A worker that stops answering the arbiter for this long is restarted. Model
+# calls are bounded separately by LLM_TIMEOUT and admission by ADMISSION_TIMEOUT.
+timeout = int(os.getenv('WEB_TIMEOUT', '360'))
+# Let in-flight experiments and queued scoring finish on restart or shutdown
+graceful_timeout = int(os.getenv('WEB_GRACEFUL_TIMEOUT', '120'))
+
+# The app starts its job queues at import, so it is loaded in each worker
+# rather than once in the arbiter before forking
+preload_app = False
+
+accesslog = os.getenv('WEB_ACCESS_LOG', '-')
@@ -0,0 +1,155 @@
+"""Fast, pure-Python pre-check of HED annotation strings against the vocabulary."""
+import hashlib
+import re
+import threading
+
+from hed_vocab import parse_vocab
+from vocab_retrieval import load_tag_descriptions
+
+# Delimiters of a HED string; everything between them is a tag
+HED_TOKEN = re.compile(r'[(),]|[^(),]+')
+
+
+class HedTag:
+    """A tag as written in an annotation, with its position in the string"""
+
+    __slots__ = ('text', 'offset')
+
+    def __init__(self, text, offset):
+        self.text = text
+        self.offset = offset
+
+    def __repr__(self):
+        return f'HedTag({self.text!r}, {self.offset})'
+
+
+def issue(tag, offset, reason):
+    return {'tag': tag, 'offset': offset, 'reason': reason}
+
+
+def parse_hed_string(hed_string):
+    """
+    Split a HED string into nested groups of HedTag.
+    Returns (groups, issues) where groups is a list whose items are HedTag or
+    lists (parenthesized groups), and issues lists structural problems:
+    unbalanced parentheses, empty tags/groups and missing commas.
+    """
+    root = []
+    stack = [(root, None)]
+    issues = []
+    # Kind of the previous token: None (start), '(', ')', ',' or 'tag'
+    previous = None
+    for match in HED_TOKEN.finditer(hed_string):
+        token, offset = match.group(), match.start()
+        if token == '(':
+            if previous in (')', 'tag'):
+                issues.append(issue('(', offset, 'missing-comma'))
+            group = []
+            stack[-1][0].append(group)
+            stack.append((group, offset))
+        elif token == ')':
+            if len(stack) == 1:
+                issues.append(issue(')', offset, 'unmatched-close-parenthesis'))
+            else:
+                if previous == '(':
+                    issues.append(issue('()', stack[-1][1], 'empty-group'))
+                elif previous == ',':
+                    issues.append(issue('', offset, 'empty-tag'))
+                stack.pop()
+        elif token == ',':
+            if previous in (None, '(', ','):
+                issues.append(issue('', offset, 'empty-tag'))
+        else:
+            text = token.strip()
+            if not text:
+                continue
+            offset += len(token) - len(token.lstrip())
+            if previous in (')', 'tag'):
+                issues.append(issue(text, offset, 'missing-comma'))
+            stack[-1][0].append(HedTag(text, offset))
+            token = 'tag'
+        previous = token
+    if previous == ',':
+        issues.append(issue('', len(hed_string), 'empty-tag'))
+    for _, offset in stack[1:]:
+        issues.append(issue('(', offset, 'unmatched-open-parenthesis'))
+    return root, issues
+
+
+def iter_tags(groups):
+    """Yield every HedTag in parsed groups, depth first"""
+    for item in groups:
+        if isinstance(item, list):
+            yield from iter_tags(item)
+        else:
+            yield item
+
+
+class HedFastChecker:
+    """
+    In-memory index of the vocabulary (tag names, parent pointers and which
+    tags take a value) that checks annotation strings without hedtools.
+    It only reports definite errors, so a string that passes may still fail
+    full schema validation but a string that fails would fail it too.
+    """
+
+    def __init__(self, hed_vocab, tag_descriptions=None):
+        self.tree = parse_vocab(hed_vocab)
+        tag_descriptions = tag_descriptions if tag_descriptions is not None else load_tag_descriptions()
+        # Schema tags missing from the edited vocab are still valid HED, just without hierarchy
+        self.schema_names = {name.lower() for name in tag_descriptions if name != '#'}
+
+    def is_known(self, name):
+        name = name.lower()
+        return name in self.tree.by_name or name in self.schema_names
+
+    def check_tag(self, tag):
+        """Return the issues of a single tag (short form, long form or Tag/value)"""
+        components = tag.text.split('/')
+        node = None
+        position = tag.offset
+        for component in components:
+            name = component.strip()
+            if not name:
+                return [issue(tag.text, position, 'empty-tag-component')]
+            if node is not None and node.takes_value:
+                # The rest of the tag is the value
+                return []
+            child = self.tree.get(name)
+            if child is None:
+                if node is None and not self.is_known(name):
+                    return [issue(tag.text, position, 'unknown-tag')]
+                if node is not None:
+                    return [issue(tag.text, position, 'tag-extended')]
+                # Known to the schema only; leave the rest to the full validator
+                return []
+            if node is not None and node not in child.ancestors():
+                return [issue(tag.text, position, 'invalid-parent')]
+            node = child
+            position += len(component) + 1
+        return []
+
+    def check(self, hed_string):
+        """Return a list of {'tag', 'offset', 'reason'} issues, empty if the string passes"""
+        groups, issues = parse_hed_string(hed_string)
+        for tag in iter_tags(groups):
+            issues.extend(self.check_tag(tag))
+        return sorted(issues, key=lambda item: item['offset'])
+
+
+_checkers = {}
+_checkers_lock = threading.Lock()
+
+
+def get_fast_checker(hed_vocab):
+    """Return the checker for this vocab text, building it once per vocab version"""
+    key = hashlib.sha256(hed_vocab.encode('utf-8')).hexdigest()
+    with _checkers_lock:
+        checker = _checkers.get(key)
+    if checker is None:
+        checker = HedFastChecker(hed_vocab)
+        with _checkers_lock:
+            # Only the current vocab version is worth keeping
+            _checkers.clear()
+            _checkers[key] = checker
+    return checker
@@ -0,0 +1,49 @@
+"""HED validation of annotation strings: the fast vocabulary check and full hedtools validation."""
+from hed import HedString
+from hed.errors import ErrorHandler
+
+from hed_checker import get_fast_checker
+from resources import resources
+from schema_cache import schema_registry
+
+
+def fast_check_hed_string(hed_string: str) -> list:
+    """
+    Check a HED string against the in-memory vocabulary index.
+    Returns a list of {'tag', 'offset', 'reason'} issues (empty if it passes).
+    """
+    return get_fast_checker(resources.vocab()).check(hed_string)
+
+
+def validate_hed_string(hed_string: str, schema_name='standard', schema_version='8.4.0', fast_check=True) -> int:
+    """
+    Validate a HED string and return the number of validation issues.
+    Returns 0 if no issues found, otherwise returns the count of issues.
+    Strings the fast check rejects return its issue count without running
+    hedtools (it reports fewer, coarser issues, so the count is a lower bound);
+    only strings that pass it get full schema validation. Pass
+    fast_check=False to always count with hedtools.
+    """
+    try:
+        if fast_check:
+            fast_issues = fast_check_hed_string(hed_string)
+            if fast_issues:
+                return len(fast_issues)
+
+        schema, validator = schema_registry.get_validator(schema_name, schema_version)
+        
+        check_for_warnings = True
+        data = hed_string
+        hedObj = HedString(data, schema)
+
+        # Validate the string
+        error_handler = ErrorHandler(check_for_warnings=check_for_warnings)
+        issues = validator.validate(hedObj, allow_placeholders=False, error_handler=error_handler)
+        
+        if issues:
+            return len(issues)
+        else:
+            return 0
+    except Exception as e:
+        print(f"HED validation error: {e}")
+        return -1  # Return -1 to indicate validation couldn't be performed
@@ -0,0 +1,100 @@
+"""Parse HED_vocab_reformatted.xml into a tag tree and render subsets of it back to XML."""
+import re
+
+# The vocab is edited by hand in the UI, so parse it leniently with a tokenizer
+# instead of a strict XML parser (e.g. a stray "</tag-" must not break prompts)
+TAG_TOKEN = re.compile(r'<tag\s+name="([^"]*)"\s*(/?)>|</tag\b[^>\n]*>?')
+
+
+class VocabNode:
+    """One <tag> element of the vocabulary"""
+
+    __slots__ = ('name', 'parent', 'children', 'order')
+
+    def __init__(self, name, parent=None, order=0):
+        self.name = name
+        self.parent = parent
+        self.children = []
+        self.order = order
+
+    @property
+    def takes_value(self):
+        """True when the tag has a '#' child, i.e. it is written as Tag/value"""
+        return any(child.name == '#' for child in self.children)
+
+    def ancestors(self):
+        node = self.parent
+        while node is not None:
+            yield node
+            node = node.parent
+
+    def path(self):
+        """Full hierarchical path, e.g. Event/Sensory-event"""
+        return '/'.join(reversed([self.name] + [a.name for a in self.ancestors()]))
+
+
+class VocabTree:
+    """The vocabulary as a forest of VocabNode with a name -> node lookup"""
+
+    def __init__(self, roots, nodes):
+        self.roots = roots
+        self.nodes = nodes
+        self.by_name = {}
+        for node in nodes:
+            if node.name != '#':
+                # First definition wins if a name is repeated
+                self.by_name.setdefault(node.name.lower(), node)
+
+    def get(self, name):
+        return self.by_name.get(name.lower())
+
+    def __len__(self):
+        return len(self.by_name)
+
+    def render(self, selected=None, indent='   '):
+        """
+        Render the vocabulary (or only the nodes in `selected`) in the
+        HED_vocab_reformatted.xml layout.
+        """
+        lines = ['<hed_tags>']
+
+        def emit(node, depth):
+            children = [c for c in node.children if selected is None or c in selected]
+            pad = indent * depth
+            if children:
+                lines.append(f'{pad}<tag name="{node.name}">')
+                for child in children:
+                    emit(child, depth + 1)
+                lines.append(f'{pad}</tag>')
+            else:
+                lines.append(f'{pad}<tag name="{node.name}"/>')
+
+        for root in self.roots:
+            if selected is None or root in selected:
+                emit(root, 1)
+        lines.append('</hed_tags>')
+        return '\n'.join(lines)
+
+
+def parse_vocab(text):
+    """Parse vocabulary XML text into a VocabTree"""
+    roots = []
+    nodes = []
+    stack = []
+    for match in TAG_TOKEN.finditer(text):
+        name, self_closing = match.group(1), match.group(2)
+        if name is None:
+            # Closing tag
+            if stack:
+                stack.pop()
+            continue
+        parent = stack[-1] if stack else None
+        node = VocabNode(name.strip(), parent, len(nodes))
+        nodes.append(node)
+        if parent is None:
+            roots.append(node)
+        else:
+            parent.children.append(node)
+        if not self_closing:
+            stack.append(node)
+    return VocabTree(roots, nodes)
@@ -0,0 +1,59 @@
+"""Background job queue for work that should not hold up an HTTP request."""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+SCORING_WORKERS = int(os.getenv('SCORING_WORKERS', '2'))
+
+
+class JobQueue:
+    """
+    Thin wrapper around a thread pool that tracks which jobs are queued or
+    running by key. Finished jobs are only counted; their results are expected
+    to be persisted by the job itself.
+    """
+
+    def __init__(self, max_workers=SCORING_WORKERS, name='jobs'):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._active = {}
+        self.completed = 0
+        self.failed = 0
+
+    def submit(self, key, fn, *args, **kwargs):
+        """Queue fn(*args, **kwargs) under key and return its future"""
+        with self._lock:
+            self._active[key] = 'queued'
+
+        def run():
+            with self._lock:
+                self._active[key] = 'running'
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                print(f"Background job {key} failed: {e}")
+                with self._lock:
+                    self._active.pop(key, None)
+                    self.failed += 1
+                raise
+            with self._lock:
+                self._active.pop(key, None)
+                self.completed += 1
+            return result
+
+        return self._executor.submit(run)
+
+    def status(self, key):
+        """Return 'queued' or 'running' for active jobs, None otherwise"""
+        with self._lock:
+            return self._active.get(key)
+
+    def stats(self):
+        with self._lock:
+            states = list(self._active.values())
+            return {
+                'queued': states.count('queued'),
+                'running': states.count('running'),
+                'completed': self.completed,
+                'failed': self.failed
+            }
@@ -0,0 +1,216 @@
+"""Lightweight stage timing spans, per-experiment traces and Prometheus-style process metrics."""
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels) + '}'
+
+
+class Counter:
+    """Monotonic counter with optional labels"""
+
+    kind = 'counter'
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1.0, **labels):
+        key = tuple((name, labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in sorted(self._values.items())]
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple((name, labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [bucket counts, sum, count]
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+            state[1] += value
+            state[2] += 1
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._values.items()):
+                for bound, bucket_count in zip(self.buckets, counts):
+                    samples.append((f'{self.name}_bucket', key + (('le', repr(bound)),), bucket_count))
+                samples.append((f'{self.name}_bucket', key + (('le', '+Inf'),), count))
+                samples.append((f'{self.name}_sum', key, total))
+                samples.append((f'{self.name}_count', key, count))
+        return samples
+
+
+class MetricsRegistry:
+    """Holds the process metrics and renders them in the Prometheus text format"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name, help, labelnames=()):
+        metric = Counter(name, help, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, help, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self, gauges=None):
+        """
+        Return the exposition text. gauges is an optional list of
+        (name, help, {labels tuple: value}) read at scrape time.
+        """
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{_format_labels(labels)} {value}')
+        for name, help, values in gauges or []:
+            lines.append(f'# HELP {name} {help}')
+            lines.append(f'# TYPE {name} gauge')
+            for labels, value in values.items():
+                lines.append(f'{name}{_format_labels(labels)} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+STAGE_SECONDS = registry.histogram('hed_stage_duration_seconds', 'Duration of pipeline stages', ['stage'])
+EXPERIMENTS = registry.counter('hed_experiments_total', 'Experiments run', ['model'])
+LLM_REQUESTS = registry.counter('hed_llm_requests_total', 'Model calls by response cache outcome', ['model', 'cache'])
+LLM_TOKENS = registry.counter('hed_llm_tokens_total', 'Tokens processed by the model', ['model', 'kind'])
+LLM_SECONDS = registry.counter('hed_llm_seconds_total',
+                               'Model-reported load, prefill (prompt eval) and eval time', ['model', 'phase'])
+
+
+class Trace:
+    """Stage durations and model usage collected while running one experiment"""
+
+    def __init__(self):
+        self.stages = {}
+        self.generations = []
+        self._lock = threading.Lock()
+
+    def add_stage(self, stage, seconds):
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def add_generation(self, usage):
+        with self._lock:
+            self.generations.append(usage)
+
+    def snapshot(self):
+        """Return (timings, token_usage) copies ready to store on an experiment"""
+        with self._lock:
+            return ({stage: round(seconds, 6) for stage, seconds in self.stages.items()},
+                    [dict(usage) for usage in self.generations])
+
+
+_local = threading.local()
+
+
+def current_trace():
+    return getattr(_local, 'trace', None)
+
+
+@contextmanager
+def activate(trace):
+    """Make trace the current trace of this thread (e.g. in a worker thread)"""
+    previous = getattr(_local, 'trace', None)
+    _local.trace = trace
+    try:
+        yield trace
+    finally:
+        _local.trace = previous
+
+
+def observe_stage(stage, seconds, trace=None):
+    """Record a stage duration measured by the caller"""
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    trace = trace or current_trace()
+    if trace is not None:
+        trace.add_stage(stage, seconds)
+
+
+@contextmanager
+def span(stage, observe=True):
+    """
+    Time a stage into the stage histogram and the current trace. With
+    observe=False the stage is only marked active (for record_generation)
+    and the caller reports its duration with observe_stage.
+    """
+    stack = getattr(_local, 'spans', None)
+    if stack is None:
+        stack = _local.spans = []
+    stack.append(stage)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stack.pop()
+        if observe:
+            observe_stage(stage, elapsed)
+
+
+def record_generation(model, prompt_tokens=None, completion_tokens=None, load_duration=None,
+                      prompt_eval_duration=None, eval_duration=None, total_duration=None, cached_prompt_tokens=None):
+    """
+    Record token counts and model-reported durations (in seconds) of one
+    generation against the innermost active span. cached_prompt_tokens are
+    prompt tokens the server reused from its cache instead of prefilling.
+    """
+    stack = getattr(_local, 'spans', None)
+    usage = {'stage': stack[-1] if stack else None, 'model': model}
+    for kind, value in (('prompt', prompt_tokens), ('completion', completion_tokens),
+                        ('cached_prompt', cached_prompt_tokens)):
+        if value is not None:
+            usage[f'{kind}_tokens'] = value
+            LLM_TOKENS.inc(value, model=model, kind=kind)
+    for phase, value in (('load', load_duration), ('prefill', prompt_eval_duration), ('eval', eval_duration)):
+        if value is not None:
+            usage[f'{phase}_duration'] = value
+            LLM_SECONDS.inc(value, model=model, phase=phase)
+    if total_duration is not None:
+        usage['total_duration'] = total_duration
+    trace = current_trace()
+    if trace is not None:
+        trace.add_generation(usage)
+    return usage
@@ -0,0 +1,349 @@
+"""Deterministic local stand-in for the Ollama and Gemini HTTP APIs, for benchmarks and offline runs."""
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from vocab_retrieval import estimate_tokens
+
+# Annotations the mock answers with; the prompt hash picks one so runs are repeatable
+MOCK_ANNOTATIONS = [
+    '(Sensory-event, Visual-presentation, (Red, Circle))',
+    '(Agent-action, (Experiment-participant, (Press, Push-button)))',
+    '(Sensory-event, Auditory-presentation, (Tone, Frequency/440 Hz))',
+    '(Foreground-view, (Item-count/3, Ingestible-object)), (Background-view, (Human, Outdoors))',
+    '(Sensory-event, Visual-presentation, (Green, Square)), (Agent-action, Move-eyes)',
+    '(Experiment-structure, Onset), (Sensory-event, Visual-presentation, Cross)',
+]
+
+GRADING_MARKER = 'Evaluate the quality of the annotation'
+BATCH_ITEM = re.compile(r'\[item (\w+)\]\n(.*?)(?=\n\n\[item |\n\n[^\[]|\Z)', re.DOTALL)
+
+
+def mock_response_text(prompt):
+    """Return the deterministic response the mock gives for a prompt"""
+    digest = int(hashlib.sha256(prompt.encode('utf-8')).hexdigest(), 16)
+    if GRADING_MARKER in prompt:
+        return (f"The annotation captures the main concepts of the description. "
+                f"Score: {digest % 7 + 3}/10")
+    annotation = MOCK_ANNOTATIONS[digest % len(MOCK_ANNOTATIONS)]
+    return ("--- REASONING PROCESS START ---\n"
+            "1. **Breakdown**: the description names a stimulus and its properties.\n"
+            "2. **Mapping**: each concept maps to the most specific vocabulary tag.\n"
+            "3. **Structuring**: related tags are grouped together.\n"
+            "--- REASONING PROCESS END ---\n\n"
+            f"--- ANNOTATION START ---\n{annotation}\n--- ANNOTATION END ---")
+
+
+def mock_structured_text(prompt, schema):
+    """Return the deterministic JSON the mock gives for a structured-output request"""
+    properties = (schema or {}).get('properties', {})
+    if 'scores' in properties:
+        scores = []
+        for item_id, block in BATCH_ITEM.findall(prompt):
+            digest = int(hashlib.sha256(block.encode('utf-8')).hexdigest(), 16)
+            scores.append({'id': item_id, 'score': digest % 7 + 3,
+                           'reason': 'The annotation captures the main concepts of the description.'})
+        return json.dumps({'scores': scores})
+    if 'annotation' in properties:
+        digest = int(hashlib.sha256(prompt.encode('utf-8')).hexdigest(), 16)
+        return json.dumps({'reasoning': 'Each concept of the description maps to the most specific vocabulary tag.',
+                           'annotation': MOCK_ANNOTATIONS[digest % len(MOCK_ANNOTATIONS)]})
+    return json.dumps({key: '' for key in properties})
+
+
+def shared_prefix_length(a, b):
+    """Length of the longest common prefix of two strings"""
+    return len(os.path.commonprefix([a, b]))
+
+
+def truncate_prompt(prompt, context_length):
+    """Keep only the last context_length tokens, the way Ollama truncates an overlong prompt"""
+    if not context_length:
+        return prompt
+    tokens = list(re.finditer(r'\w+|[^\w\s]', prompt))
+    if len(tokens) <= context_length:
+        return prompt
+    return prompt[tokens[-context_length].start():]
+
+
+class MockLLMServer:
+    """
+    Threaded HTTP server speaking enough of the Ollama (/api/chat, /api/tags,
+    /api/ps) and Gemini (generateContent, streamGenerateContent) APIs for the
+    app's clients. Each call waits `latency` seconds plus prompt tokens at
+    `prefill_rate` and response tokens at `token_rate` (0 disables a term);
+    at most `parallel` generations run at once, like a local model server.
+    Structured-output requests (Ollama `format`, Gemini `responseJsonSchema`)
+    get JSON answers; with `context_length` set, longer prompts lose their
+    beginning before they are answered. With `prompt_cache`, Ollama models
+    skip prefilling the part of a prompt shared with their previous one, the
+    way a loaded model reuses its KV cache. Gemini cached contents
+    (`cachedContents`) are always supported and reported as cached tokens.
+    With `max_loaded`, only that many Ollama models stay loaded (least
+    recently used are evicted) and loading one costs `load_latency` seconds;
+    `loads` counts them. An empty /api/generate prompt just loads the model.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.05, token_rate=200.0, prefill_rate=0.0, parallel=4,
+                 models=('qwen3:8b', 'llama3.2:latest', 'mistral:latest'), context_length=None, prompt_cache=False,
+                 max_loaded=None, load_latency=0.0):
+        self.latency = latency
+        self.context_length = context_length
+        self.prompt_cache = prompt_cache
+        self._last_prompts = {}
+        self.cached_contents = {}
+        self.max_loaded = max_loaded
+        self.load_latency = load_latency
+        self.loaded = OrderedDict()
+        self.loads = 0
+        self.token_rate = token_rate
+        self.prefill_rate = prefill_rate
+        self.models = list(models)
+        self.slots = threading.BoundedSemaphore(parallel) if parallel else None
+        self.requests = 0
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), self._handler())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name='mock-llm', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def load(self, model, keep_alive=None):
+        """Load model if needed (evicting the least recently used), or unload it for keep_alive 0; returns seconds"""
+        with self._lock:
+            if keep_alive == 0:
+                self.loaded.pop(model, None)
+                self._last_prompts.pop(model, None)
+                return 0.0
+            if model in self.loaded:
+                self.loaded.move_to_end(model)
+                return 0.0
+            self.loaded[model] = time.time()
+            self.loads += 1
+            while self.max_loaded and len(self.loaded) > self.max_loaded:
+                evicted, _ = self.loaded.popitem(last=False)
+                # Its KV cache goes with it
+                self._last_prompts.pop(evicted, None)
+        time.sleep(self.load_latency)
+        return self.load_latency
+
+    def generate(self, prompt, chunk_tokens=4, schema=None, cache_slot=None, cached_tokens=0, load_duration=0.0):
+        """
+        Yield (text_chunk, metrics) pieces of the response, sleeping to
+        simulate prefill and decoding; metrics is set on the last piece.
+        cached_tokens leading prompt tokens are not prefilled; with
+        prompt_cache, neither is the part shared with the previous prompt
+        of the same cache_slot. prompt_eval_count counts only the rest.
+        """
+        with self._lock:
+            self.requests += 1
+            prompt = truncate_prompt(prompt, self.context_length)
+            if self.prompt_cache and cache_slot is not None:
+                shared = shared_prefix_length(self._last_prompts.get(cache_slot, ''), prompt)
+                cached_tokens = max(cached_tokens, estimate_tokens(prompt[:shared]))
+                self._last_prompts[cache_slot] = prompt
+        text = mock_structured_text(prompt, schema) if schema else mock_response_text(prompt)
+        words = re.findall(r'\S+\s*|\s+', text)
+        prompt_tokens = max(0, estimate_tokens(prompt) - cached_tokens)
+        if self.slots:
+            self.slots.acquire()
+        try:
+            start = time.perf_counter()
+            prefill = self.latency + (prompt_tokens / self.prefill_rate if self.prefill_rate else 0)
+            time.sleep(prefill)
+            eval_start = time.perf_counter()
+            for i in range(0, len(words), chunk_tokens):
+                chunk = words[i:i + chunk_tokens]
+                if self.token_rate:
+                    time.sleep(len(chunk) / self.token_rate)
+                last = i + chunk_tokens >= len(words)
+                metrics = None
+                if last:
+                    end = time.perf_counter()
+                    metrics = {
+                        'total_duration': int((end - start) * 1e9),
+                        'load_duration': int(load_duration * 1e9),
+                        'prompt_eval_count': prompt_tokens,
+                        'prompt_eval_duration': int((eval_start - start) * 1e9),
+                        'eval_count': len(words),
+                        'eval_duration': int((end - eval_start) * 1e9)
+                    }
+                yield ''.join(chunk), metrics
+        finally:
+            if self.slots:
+                self.slots.release()
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def _read_json(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                return json.loads(self.rfile.read(length) or b'{}')
+
+            def _send_json(self, payload, status=200):
+                body = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _start_chunked(self, content_type):
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+
+            def _write_chunk(self, data):
+                self.wfile.write(f'{len(data):x}\r\n'.encode('ascii') + data + b'\r\n')
+                self.wfile.flush()
+
+            def _end_chunked(self):
+                self.wfile.write(b'0\r\n\r\n')
+                self.wfile.flush()
+
+            def do_GET(self):
+                if self.path == '/api/tags':
+                    self._send_json({'models': [{'name': m, 'model': m, 'size': 0} for m in server.models]})
+                elif self.path == '/api/ps':
+                    with server._lock:
+                        loaded = list(server.loaded)
+                    self._send_json({'models': [{'name': m, 'model': m, 'size': 0, 'size_vram': 0} for m in loaded]})
+                else:
+                    self._send_json({'error': 'not found'}, 404)
+
+            def do_POST(self):
+                try:
+                    if self.path == '/api/chat':
+                        self._ollama_chat(self._read_json())
+                    elif self.path == '/api/generate':
+                        self._ollama_generate(self._read_json())
+                    elif self.path.endswith('/cachedContents'):
+                        self._gemini_create_cache(self._read_json())
+                    elif ':generateContent' in self.path or ':streamGenerateContent' in self.path:
+                        self._gemini(self._read_json(), ':streamGenerateContent' in self.path)
+                    else:
+                        self._send_json({'error': 'not found'}, 404)
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client closed the stream early (e.g. a cancelled sample)
+                    pass
+
+            def _ollama_generate(self, body):
+                model = body.get('model', '')
+                if body.get('prompt'):
+                    self._send_json({'error': 'only loading (an empty prompt) is supported'}, 400)
+                    return
+                load_duration = server.load(model, body.get('keep_alive'))
+                self._send_json({'model': model, 'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                                 'response': '', 'done': True, 'done_reason': 'load',
+                                 'load_duration': int(load_duration * 1e9)})
+
+            def _ollama_chat(self, body):
+                model = body.get('model', '')
+                load_duration = server.load(model, body.get('keep_alive'))
+                prompt = '\n'.join(m.get('content', '') for m in body.get('messages', []))
+                schema = body.get('format') if isinstance(body.get('format'), dict) else None
+                created_at = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+                if body.get('stream', True):
+                    self._start_chunked('application/x-ndjson')
+                    for text, metrics in server.generate(prompt, schema=schema, cache_slot=model,
+                                                         load_duration=load_duration):
+                        part = {'model': model, 'created_at': created_at,
+                                'message': {'role': 'assistant', 'content': text}, 'done': False}
+                        self._write_chunk((json.dumps(part) + '\n').encode('utf-8'))
+                        if metrics:
+                            final = {'model': model, 'created_at': created_at,
+                                     'message': {'role': 'assistant', 'content': ''},
+                                     'done': True, 'done_reason': 'stop', **metrics}
+                            self._write_chunk((json.dumps(final) + '\n').encode('utf-8'))
+                    self._end_chunked()
+                    return
+                chunks, metrics = [], {}
+                for text, piece_metrics in server.generate(prompt, schema=schema, cache_slot=model,
+                                                           load_duration=load_duration):
+                    chunks.append(text)
+                    metrics = piece_metrics or metrics
+                self._send_json({'model': model, 'created_at': created_at,
+                                 'message': {'role': 'assistant', 'content': ''.join(chunks)},
+                                 'done': True, 'done_reason': 'stop', **metrics})
+
+            def _gemini_create_cache(self, body):
+                text = '\n'.join(part.get('text', '') for content in body.get('contents', [])
+                                 for part in content.get('parts', []))
+                name = f'cachedContents/{hashlib.sha256(text.encode("utf-8")).hexdigest()[:12]}'
+                server.cached_contents[name] = text
+                expire = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(time.time() + 3600))
+                self._send_json({'name': name, 'model': body.get('model', ''), 'expireTime': expire,
+                                 'usageMetadata': {'totalTokenCount': estimate_tokens(text)}})
+
+            def _gemini(self, body, stream):
+                prompt = '\n'.join(part.get('text', '') for content in body.get('contents', [])
+                                   for part in content.get('parts', []))
+                schema = body.get('generationConfig', {}).get('responseJsonSchema')
+                cached_text = ''
+                if body.get('cachedContent'):
+                    cached_text = server.cached_contents.get(body['cachedContent'])
+                    if cached_text is None:
+                        self._send_json({'error': {'code': 404, 'message': 'Cached content not found',
+                                                   'status': 'NOT_FOUND'}}, 404)
+                        return
+                    prompt = cached_text + prompt
+                cached_tokens = estimate_tokens(cached_text) if cached_text else 0
+
+                def payload(text, metrics):
+                    result = {'candidates': [{'content': {'role': 'model', 'parts': [{'text': text}]},
+                                              'index': 0}]}
+                    if metrics:
+                        prompt_tokens = metrics['prompt_eval_count'] + cached_tokens
+                        result['candidates'][0]['finishReason'] = 'STOP'
+                        result['usageMetadata'] = {
+                            'promptTokenCount': prompt_tokens,
+                            'candidatesTokenCount': metrics['eval_count'],
+                            'totalTokenCount': prompt_tokens + metrics['eval_count']
+                        }
+                        if cached_tokens:
+                            result['usageMetadata']['cachedContentTokenCount'] = cached_tokens
+                    return result
+
+                if stream:
+                    self._start_chunked('text/event-stream')
+                    for text, metrics in server.generate(prompt, schema=schema, cached_tokens=cached_tokens):
+                        self._write_chunk(f'data: {json.dumps(payload(text, metrics))}\r\n\r\n'.encode('utf-8'))
+                    self._end_chunked()
+                    return
+                chunks, metrics = [], {}
+                for text, piece_metrics in server.generate(prompt, schema=schema, cached_tokens=cached_tokens):
+                    chunks.append(text)
+                    metrics = piece_metrics or metrics
+                self._send_json(payload(''.join(chunks), metrics))
+
+        return Handler
@@ -0,0 +1,245 @@
+"""Ollama model residency: which models are installed and loaded, pinning, and model-grouped call scheduling."""
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+from resources import resources, LLM_TIMEOUT
+
+# How long Ollama keeps a model loaded after a request that asks to keep it (Ollama's own default is 5m)
+MODEL_KEEP_ALIVE = os.getenv('MODEL_KEEP_ALIVE', '30m')
+# Models Ollama can hold in memory at once; 1 fits a single GPU (or CPU) host
+MAX_LOADED_MODELS = int(os.getenv('OLLAMA_MAX_LOADED_MODELS', '1'))
+# Concurrent calls one loaded model serves (Ollama's OLLAMA_NUM_PARALLEL)
+MODEL_PARALLEL = int(os.getenv('OLLAMA_NUM_PARALLEL', '4'))
+# Calls a loaded model may start while calls for another model wait, before it has to make room
+MODEL_SWITCH_AFTER = int(os.getenv('MODEL_SWITCH_AFTER', '8'))
+# Seconds an idle model stays reserved for its next call, which in a pipeline follows within moments
+MODEL_SWITCH_GRACE = float(os.getenv('MODEL_SWITCH_GRACE', '0.5'))
+# Comma-separated models loaded at startup and kept loaded indefinitely
+PIN_MODELS = [model.strip() for model in os.getenv('OLLAMA_PIN_MODELS', '').split(',') if model.strip()]
+# Seconds the installed-model list is reused before asking Ollama again
+INSTALLED_CACHE_SECONDS = 10
+
+
+class ModelScheduler:
+    """
+    Admit Ollama calls so that calls for the same model run back to back.
+
+    Up to `max_loaded` models are treated as resident. A call for a resident
+    model starts at once (up to `parallel` at a time per model); a call for
+    another model waits until a resident model has been idle for `grace`
+    seconds, then takes its place, oldest waiting model first. The grace
+    period matters because work arrives one call at a time (the next cell of
+    a batch is submitted only when the previous one finishes), so an idle
+    model usually has its next call moments away. A thread moving on from a
+    model to another (generation, then grading) is not held up by the grace
+    period of the model it just used. So that a busy model cannot
+    starve the rest, a resident model stops admitting new calls once it has
+    started `switch_after` of them while another model was waiting. A call
+    that has waited `wait_timeout` seconds starts regardless.
+    """
+
+    def __init__(self, max_loaded=MAX_LOADED_MODELS, parallel=MODEL_PARALLEL, switch_after=MODEL_SWITCH_AFTER,
+                 grace=MODEL_SWITCH_GRACE, wait_timeout=LLM_TIMEOUT):
+        self.max_loaded = max(1, max_loaded)
+        self.parallel = max(1, parallel)
+        self.switch_after = max(1, switch_after)
+        self.grace = grace
+        self.wait_timeout = wait_timeout
+        self._cond = threading.Condition()
+        self._resident = OrderedDict()
+        self._idle_since = {}
+        self._released_by = {}
+        self._streak = {}
+        self._waiting = deque()
+        self.switches = 0
+        self.grouped = 0
+        self.forced = 0
+
+    def seed(self, models):
+        """Mark models Ollama already has loaded as resident (in least recently used order)"""
+        with self._cond:
+            for model in models:
+                if model not in self._resident and len(self._resident) < self.max_loaded:
+                    self._resident[model] = 0
+                    self._idle_since[model] = 0.0
+                    self._streak[model] = 0
+
+    def _others_waiting(self, model):
+        return any(waiting != model for _, waiting in self._waiting)
+
+    def _yielding(self, model):
+        return self._streak.get(model, 0) >= self.switch_after and self._others_waiting(model)
+
+    def _may_start(self, ticket, model):
+        if model in self._resident:
+            return self._resident[model] < self.parallel and not self._yielding(model)
+        # Only the oldest call waiting for a non-resident model may bring its model in
+        first = next((waiting_ticket for waiting_ticket, waiting in self._waiting if waiting not in self._resident),
+                     None)
+        if first is not ticket:
+            return False
+        return len(self._resident) < self.max_loaded or self._evictable() is not None
+
+    def _evictable(self):
+        """Least recently used idle resident model that has had its turn or is past its grace period unused"""
+        now = time.monotonic()
+        caller = threading.current_thread()
+        for resident, running in self._resident.items():
+            if running == 0 and (self._yielding(resident) or (
+                    (now - self._idle_since.get(resident, 0.0) >= self.grace
+                     or self._released_by.get(resident) == caller)
+                    and not any(waiting == resident for _, waiting in self._waiting))):
+                return resident
+        return None
+
+    def acquire(self, model):
+        ticket = object()
+        deadline = time.monotonic() + self.wait_timeout
+        with self._cond:
+            self._waiting.append((ticket, model))
+            while not self._may_start(ticket, model):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.forced += 1
+                    break
+                # Wake up at least once per grace period, when an idle model may become evictable
+                self._cond.wait(min(remaining, self.grace) if self.grace > 0 else remaining)
+            if model in self._resident:
+                self.grouped += 1
+            else:
+                # Still counted as waiting here, so a model yielding to this call is evictable
+                evicted = self._evictable() if len(self._resident) >= self.max_loaded else None
+                if evicted is not None:
+                    del self._resident[evicted]
+                self._resident[model] = 0
+                self._streak[model] = 0
+                self.switches += 1
+            self._waiting.remove((ticket, model))
+            self._resident[model] += 1
+            self._resident.move_to_end(model)
+            self._streak[model] = self._streak[model] + 1 if self._others_waiting(model) else 0
+            self._cond.notify_all()
+
+    def release(self, model):
+        with self._cond:
+            if self._resident.get(model):
+                self._resident[model] -= 1
+                if self._resident[model] == 0:
+                    self._idle_since[model] = time.monotonic()
+                    self._released_by[model] = threading.current_thread()
+            # Calls that started after a timeout may have left more models resident than fit
+            while len(self._resident) > self.max_loaded:
+                idle = next((resident for resident, running in self._resident.items() if running == 0), None)
+                if idle is None:
+                    break
+                del self._resident[idle]
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, model):
+        """Hold a call slot for model for the duration of the block"""
+        self.acquire(model)
+        try:
+            yield
+        finally:
+            self.release(model)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'resident': dict(self._resident),
+                'waiting': len(self._waiting),
+                'switches': self.switches,
+                'grouped': self.grouped,
+                'forced': self.forced
+            }
+
+
+class ModelResidency:
+    """
+    What the local Ollama has installed and loaded, models pinned in memory,
+    and the scheduler every Ollama call goes through.
+    """
+
+    def __init__(self, scheduler=None, pin_models=PIN_MODELS):
+        self.scheduler = scheduler or ModelScheduler()
+        self._lock = threading.Lock()
+        self._pinned = set(pin_models)
+        self._installed = None
+        self._installed_at = 0.0
+
+    def installed(self):
+        """Names of the models Ollama has pulled, or None when Ollama cannot be reached"""
+        with self._lock:
+            if self._installed is not None and time.monotonic() - self._installed_at < INSTALLED_CACHE_SECONDS:
+                return self._installed
+        try:
+            names = sorted(model.model for model in resources.ollama_client().list().models)
+        except Exception as e:
+            print(f"Error listing Ollama models: {e}")
+            return None
+        with self._lock:
+            self._installed, self._installed_at = names, time.monotonic()
+        return names
+
+    def loaded(self):
+        """Models Ollama currently holds in memory, with their size in VRAM and unload time"""
+        try:
+            models = resources.ollama_client().ps().models
+        except Exception as e:
+            print(f"Error listing loaded Ollama models: {e}")
+            return []
+        return [{'model': model.model, 'size_vram': model.size_vram,
+                 'expires_at': model.expires_at.isoformat() if model.expires_at else None} for model in models]
+
+    def pinned(self):
+        with self._lock:
+            return sorted(self._pinned)
+
+    def keep_alive(self, model, default=None):
+        """keep_alive to send with a call: forever for pinned models, else default (None: Ollama's)"""
+        with self._lock:
+            return -1 if model in self._pinned else default
+
+    def preload(self, model, pin=False):
+        """Load model into memory ahead of use (an empty prompt only loads it), optionally pinning it"""
+        if pin:
+            with self._lock:
+                self._pinned.add(model)
+        with self.scheduler.slot(model):
+            resources.ollama_client().generate(model=model, prompt='',
+                                               keep_alive=self.keep_alive(model, MODEL_KEEP_ALIVE))
+
+    def unpin(self, model):
+        """Stop pinning model; Ollama unloads it MODEL_KEEP_ALIVE after its last use"""
+        with self._lock:
+            self._pinned.discard(model)
+        resources.ollama_client().generate(model=model, prompt='', keep_alive=MODEL_KEEP_ALIVE)
+
+    @contextmanager
+    def slot(self, model):
+        with self.scheduler.slot(model):
+            yield
+
+    def stream(self, model, start):
+        """Yield from the stream start() opens while holding a call slot for model"""
+        with self.scheduler.slot(model):
+            yield from start()
+
+    def warm(self):
+        """Learn which models are already loaded and load the pinned ones"""
+        self.scheduler.seed(model['model'] for model in self.loaded())
+        for model in self.pinned():
+            try:
+                self.preload(model, pin=True)
+            except Exception as e:
+                print(f"Error preloading {model}: {e}")
+
+    def stats(self):
+        return dict(self.scheduler.stats(), pinned=self.pinned())
+
+
+model_residency = ModelResidency()
@@ -0,0 +1,125 @@
+"""Prefix-stable prompts: a shared vocab/instructions prefix the model server can keep cached across descriptions."""
+import hashlib
+import os
+import threading
+import time
+
+from resources import compile_template
+from vocab_retrieval import estimate_tokens, cached_estimate_tokens
+
+# Render prompts as a static prefix plus a per-description suffix (per-request `prefix_cache` overrides this)
+PREFIX_CACHE_ENABLED = os.getenv('PREFIX_CACHE', '0') == '1'
+# Lifetime of a Gemini cached-content entry; it is recreated once expired
+GEMINI_CACHE_TTL = int(os.getenv('GEMINI_CACHE_TTL', '3600'))
+# Gemini rejects cached contents below a model-specific minimum (1024 tokens for Flash)
+GEMINI_CACHE_MIN_TOKENS = int(os.getenv('GEMINI_CACHE_MIN_TOKENS', '1024'))
+
+# Rendered in place of the description to find where the per-description part of a template starts
+DESCRIPTION_SENTINEL = '\x00hed-description\x00'
+
+
+def split_prompt(prompt_template, prompt, hed_vocab):
+    """
+    Return (prefix, suffix) of a rendered prompt: the prefix is everything
+    the template renders before the description, so it is byte-identical for
+    every description rendered with the same template and vocab. A template
+    whose text before the description depends on the description (or that
+    has no description at all) gets an empty prefix.
+    """
+    rendered = compile_template(prompt_template).render(hed_vocab=hed_vocab, description=DESCRIPTION_SENTINEL)
+    position = rendered.find(DESCRIPTION_SENTINEL)
+    prefix = rendered[:position] if position > 0 else ''
+    if not prompt.startswith(prefix):
+        prefix = ''
+    return prefix, prompt[len(prefix):]
+
+
+def prefix_key(prefix, *extra):
+    """Short stable identifier of a prefix (and anything else that shapes what is cached)"""
+    digest = hashlib.sha256(prefix.encode('utf-8'))
+    for value in extra:
+        digest.update(b'\x00' + str(value).encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+class PrefillTracker:
+    """
+    Estimate prefill tokens Ollama reused from its KV cache. Ollama only
+    counts the prompt tokens it actually evaluated, so a request whose
+    prefix was cached reports far fewer than the prefix alone holds. The
+    prefix length in model tokens is learned from the largest (cold)
+    evaluation seen for it, starting from the word-count estimate.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._prefix_tokens = {}
+
+    def observe(self, model, prefix, suffix, prompt_eval_count):
+        """Return the estimated number of prefix tokens that were not evaluated again"""
+        if not prefix or prompt_eval_count is None:
+            return 0
+        suffix_tokens = estimate_tokens(suffix)
+        key = (model, prefix_key(prefix))
+        with self._lock:
+            prefix_tokens = max(self._prefix_tokens.get(key) or cached_estimate_tokens(prefix),
+                                prompt_eval_count - suffix_tokens)
+            self._prefix_tokens[key] = prefix_tokens
+        return max(0, min(prefix_tokens, prefix_tokens + suffix_tokens - prompt_eval_count))
+
+
+class GeminiContextCache:
+    """
+    Gemini cached contents holding prompt prefixes, one per (model, prefix,
+    system instruction), created on first use and recreated when expired.
+    A prefix the API refuses to cache (too short, or a model without context
+    caching) is not retried until the TTL has passed; callers then send the
+    whole prompt, which still benefits from Gemini's implicit caching.
+    """
+
+    def __init__(self, ttl=GEMINI_CACHE_TTL, min_tokens=GEMINI_CACHE_MIN_TOKENS):
+        self.ttl = ttl
+        self.min_tokens = min_tokens
+        self._lock = threading.Lock()
+        self._entries = {}
+        self.created = 0
+        self.failures = 0
+
+    def get(self, client, model, prefix, system=None):
+        """Return the cached-content name for prefix, or None to send the prompt uncached"""
+        if not prefix or cached_estimate_tokens(prefix) < self.min_tokens:
+            return None
+        key = (model, prefix_key(prefix, system))
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            # Leave a margin so a request never races the expiry
+            if entry is not None and entry[1] - 60 > now:
+                return entry[0]
+            # Created under the lock so concurrent requests for a new prefix share one entry
+            config = {'contents': [prefix], 'ttl': f'{self.ttl}s', 'display_name': f'hed-prefix-{key[1]}'}
+            if system:
+                config['system_instruction'] = system
+            try:
+                name = client.caches.create(model=model, config=config).name
+                self.created += 1
+            except Exception as e:
+                print(f"Gemini context caching unavailable for {model}: {e}")
+                name = None
+                self.failures += 1
+            self._entries[key] = (name, now + self.ttl)
+            return name
+
+    def forget(self, model, prefix, system=None):
+        """Drop an entry the API no longer accepts (e.g. deleted or expired early)"""
+        with self._lock:
+            self._entries.pop((model, prefix_key(prefix, system)), None)
+
+    def stats(self):
+        with self._lock:
+            return {'entries': sum(1 for name, _ in self._entries.values() if name),
+                    'created': self.created, 'failures': self.failures}
+
+
+prefill_tracker = PrefillTracker()
+gemini_context_cache = GeminiContextCache()
@@ -0,0 +1,244 @@
+"""Deterministic scoring of annotations against gold reference annotations, with partial credit along the tag tree."""
+import hashlib
+import threading
+from functools import lru_cache
+
+import numpy as np
+
+from hed_checker import parse_hed_string
+from hed_vocab import parse_vocab
+
+# Name recorded as the grader_model of reference-based grades
+REFERENCE_GRADER = 'reference'
+# Credit kept when two tags match except for their value (Duration/2 s vs Duration/3 s, or a value on one side only)
+VALUE_MISMATCH_CREDIT = 0.5
+# Share of the 0-10 score given by group F1 when either annotation has groups; the rest is tag F1
+GROUP_WEIGHT = 0.25
+# Pairs scored per vectorized step; pairs are sorted by size first so each step pads little
+CHUNK_SIZE = 1024
+# Distinct annotation strings kept parsed (gold annotations are scored again and again)
+PARSE_CACHE_SIZE = 8192
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def term_id(key):
+    """
+    Stable non-negative id of a canonical tag or group key. Ids are hashes
+    rather than registry entries, so memory does not grow with every new
+    annotation scored; -1 stays free for padding.
+    """
+    return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'little') >> 1
+
+
+class EncodedAnnotation:
+    """An annotation as arrays: the vocab node, term and value flag of each distinct tag, and each group's term"""
+
+    __slots__ = ('nodes', 'terms', 'valued', 'groups')
+
+    def __init__(self, nodes, terms, valued, groups):
+        self.nodes = nodes
+        self.terms = terms
+        self.valued = valued
+        self.groups = groups
+
+
+def prf(similarity, predicted, gold):
+    """
+    Soft precision, recall and F1 per pair from a [pairs, predicted, gold]
+    similarity array and the masks of real (non-padding) items: each item is
+    credited with its best match on the other side. Two empty sides agree
+    perfectly; one empty side scores 0.
+    """
+    similarity = np.where(predicted[:, :, None] & gold[:, None, :], similarity, 0.0)
+    predicted_count = predicted.sum(axis=1)
+    gold_count = gold.sum(axis=1)
+    best_for_predicted = similarity.max(axis=2, initial=0.0).sum(axis=1)
+    best_for_gold = similarity.max(axis=1, initial=0.0).sum(axis=1)
+    both_empty = (predicted_count == 0) & (gold_count == 0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        precision = np.where(both_empty, 1.0, np.where(predicted_count > 0, best_for_predicted / predicted_count, 0.0))
+        recall = np.where(both_empty, 1.0, np.where(gold_count > 0, best_for_gold / gold_count, 0.0))
+        f1 = np.where(precision + recall > 0, 2 * precision * recall / (precision + recall), 0.0)
+    return precision, recall, f1
+
+
+class ReferenceScorer:
+    """
+    Score annotations against gold annotations by tag and by group.
+
+    Every tag is resolved to its vocabulary node (short or long form, with
+    any value split off). Two tags on the same branch of the tree get the
+    depth of the shallower over the depth of the deeper as credit, so
+    Sensory-event against its parent Event earns 1/2, and tags elsewhere in
+    the tree earn nothing. Tags outside the vocabulary only match
+    themselves, with full credit when written the same way; they are counted
+    (unknown_tags) so grades resting on them can be told apart. Groups
+    (every parenthesized group, nested ones included) match when they hold
+    the same tags and subgroups, in any order.
+
+    Pairs are scored in chunks of padded integer arrays, so one call scores
+    thousands of pairs without a Python loop over tags.
+    """
+
+    def __init__(self, hed_vocab):
+        self.tree = parse_vocab(hed_vocab)
+        nodes = self.tree.nodes
+        self.depth = np.array([1 + sum(1 for _ in node.ancestors()) for node in nodes] or [1], dtype=np.int64)
+        # paths[n, d] is the ancestor of node n at depth d + 1 (n itself at its own depth), -1 below it
+        self.paths = np.full((max(1, len(nodes)), int(self.depth.max())), -1, dtype=np.int64)
+        for node in nodes:
+            for ancestor in [node, *node.ancestors()]:
+                self.paths[node.order, self.depth[ancestor.order] - 1] = ancestor.order
+        self.encode = lru_cache(maxsize=PARSE_CACHE_SIZE)(self._encode)
+        self.resolve = lru_cache(maxsize=PARSE_CACHE_SIZE)(self._resolve)
+
+    def _resolve(self, text):
+        """Return (node order or -1, canonical key, has value) of a tag such as Event/Sensory-event or Duration/2 s"""
+        node = None
+        value = []
+        for component in text.split('/'):
+            name = component.strip()
+            child = None if value or (node is not None and node.takes_value) else self.tree.get(name)
+            # A known name that is not below the previous one is a value or an extension, as is everything after it
+            if child is None or (node is not None and node not in child.ancestors()):
+                value.append(name)
+            else:
+                node = child
+        if node is None:
+            return -1, text.strip().lower(), False
+        key = node.name.lower()
+        if value:
+            key += '/' + '/'.join(value).lower()
+        return node.order, key, bool(value)
+
+    def _encode(self, annotation):
+        nodes, terms, valued = [], [], []
+        groups = set()
+
+        def walk(items):
+            """Collect the tags and groups of items, returning the order-free key of the group they form"""
+            keys = []
+            for item in items:
+                if isinstance(item, list):
+                    key = walk(item)
+                    groups.add(term_id(key))
+                else:
+                    node, key, has_value = self.resolve(item.text)
+                    term = term_id(key)
+                    # Tags are a set: a repeated tag earns its credit once
+                    if term not in terms:
+                        nodes.append(node)
+                        terms.append(term)
+                        valued.append(has_value)
+                keys.append(key)
+            return '(' + ','.join(sorted(keys)) + ')'
+
+        walk(parse_hed_string(annotation or '')[0])
+        return EncodedAnnotation(np.array(nodes, dtype=np.int64), np.array(terms, dtype=np.int64),
+                                 np.array(valued, dtype=bool), np.array(sorted(groups), dtype=np.int64))
+
+    def tag_similarity(self, a_nodes, a_terms, a_valued, b_nodes, b_terms, b_valued):
+        """Credit of each tag of a against each tag of b (broadcast arrays; -1 nodes are outside the vocab)"""
+        known = (a_nodes >= 0) & (b_nodes >= 0)
+        a = np.where(known, a_nodes, 0)
+        b = np.where(known, b_nodes, 0)
+        a_depth, b_depth = self.depth[a], self.depth[b]
+        a_shallower = a_depth <= b_depth
+        shallow = np.where(a_shallower, a, b)
+        deep = np.where(a_shallower, b, a)
+        shallow_depth = np.minimum(a_depth, b_depth)
+        related = known & (self.paths[deep, shallow_depth - 1] == shallow)
+        credit = np.where(related, shallow_depth / np.maximum(a_depth, b_depth), 0.0)
+        credit = np.where(a_valued | b_valued, credit * VALUE_MISMATCH_CREDIT, credit)
+        return np.where(a_terms == b_terms, 1.0, credit)
+
+    @staticmethod
+    def _pad(arrays, fill, dtype):
+        width = max((len(array) for array in arrays), default=0)
+        padded = np.full((len(arrays), max(1, width)), fill, dtype=dtype)
+        for row, array in enumerate(arrays):
+            padded[row, :len(array)] = array
+        return padded
+
+    def _score_chunk(self, predicted, gold):
+        pad = self._pad
+        p_terms, g_terms = pad([e.terms for e in predicted], -1, np.int64), pad([e.terms for e in gold], -1, np.int64)
+        similarity = self.tag_similarity(
+            pad([e.nodes for e in predicted], -1, np.int64)[:, :, None], p_terms[:, :, None],
+            pad([e.valued for e in predicted], False, bool)[:, :, None],
+            pad([e.nodes for e in gold], -1, np.int64)[:, None, :], g_terms[:, None, :],
+            pad([e.valued for e in gold], False, bool)[:, None, :])
+        tags = prf(similarity, p_terms >= 0, g_terms >= 0)
+        p_groups, g_groups = pad([e.groups for e in predicted], -1, np.int64), pad([e.groups for e in gold], -1, np.int64)
+        groups = prf((p_groups[:, :, None] == g_groups[:, None, :]).astype(float), p_groups >= 0, g_groups >= 0)
+        has_groups = (p_groups >= 0).any(axis=1) | (g_groups >= 0).any(axis=1)
+        return tags, groups, has_groups
+
+    def score_arrays(self, pairs):
+        """
+        Score (annotation, reference) pairs. Returns a dict of arrays, one
+        value per pair: tag_precision, tag_recall, tag_f1, group_precision,
+        group_recall, group_f1, score (0-10) and unknown_tags (distinct tags
+        of the annotation that are not in the vocabulary).
+        """
+        predicted = [self.encode(annotation or '') for annotation, _ in pairs]
+        gold = [self.encode(reference or '') for _, reference in pairs]
+        names = ['tag_precision', 'tag_recall', 'tag_f1', 'group_precision', 'group_recall', 'group_f1']
+        result = {name: np.zeros(len(pairs)) for name in names}
+        has_groups = np.zeros(len(pairs), dtype=bool)
+        sizes = np.array([max(len(p.terms), len(g.terms)) for p, g in zip(predicted, gold)], dtype=np.int64)
+        order = np.argsort(sizes, kind='stable')
+        for start in range(0, len(pairs), CHUNK_SIZE):
+            indexes = order[start:start + CHUNK_SIZE]
+            tags, groups, chunk_has_groups = self._score_chunk([predicted[i] for i in indexes],
+                                                               [gold[i] for i in indexes])
+            for name, values in zip(names, tags + groups):
+                result[name][indexes] = values
+            has_groups[indexes] = chunk_has_groups
+        group_weight = np.where(has_groups, GROUP_WEIGHT, 0.0)
+        result['score'] = 10 * ((1 - group_weight) * result['tag_f1'] + group_weight * result['group_f1'])
+        result['unknown_tags'] = np.array([int((p.nodes < 0).sum()) for p in predicted], dtype=np.int64)
+        return result
+
+    def score_many(self, pairs):
+        """Score (annotation, reference) pairs, returning one {score, tags, groups, unknown_tags} dict per pair"""
+        arrays = {name: values.tolist() for name, values in self.score_arrays(pairs).items()}
+
+        def stats(kind, index):
+            return {stat: round(arrays[f'{kind}_{stat}'][index], 4) for stat in ('precision', 'recall', 'f1')}
+
+        return [{'score': round(arrays['score'][index], 2), 'tags': stats('tag', index), 'groups': stats('group', index),
+                 'unknown_tags': arrays['unknown_tags'][index]} for index in range(len(pairs))]
+
+
+def reference_grade(result, reference):
+    """Shape a score_many result like an LLM grade, so it is stored and shown the same way"""
+    tags, groups = result['tags'], result['groups']
+    unknown = result.get('unknown_tags', 0)
+    # Tags outside the vocabulary are only compared by name, so say when the score rests on them
+    note = f"\n{unknown} tag(s) of the annotation are not in the vocabulary and only match by name." if unknown else ''
+    return dict(result, **{
+        'full_response': (f"Tag F1 {tags['f1']:.2f} (precision {tags['precision']:.2f}, recall {tags['recall']:.2f}); "
+                          f"group F1 {groups['f1']:.2f} (precision {groups['precision']:.2f}, "
+                          f"recall {groups['recall']:.2f}) against the reference:\n{reference}{note}"),
+        'grader_model': REFERENCE_GRADER,
+        'reference_annotation': reference
+    })
+
+
+_scorers = {}
+_scorers_lock = threading.Lock()
+
+
+def get_reference_scorer(hed_vocab):
+    """Return the scorer for this vocab text, building it once per vocab version"""
+    key = hashlib.sha256(hed_vocab.encode('utf-8')).hexdigest()
+    with _scorers_lock:
+        scorer = _scorers.get(key)
+    if scorer is None:
+        scorer = ReferenceScorer(hed_vocab)
+        with _scorers_lock:
+            # Only the current vocab version is worth keeping
+            _scorers.clear()
+            _scorers[key] = scorer
+    return scorer
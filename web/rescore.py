@@ -0,0 +1,283 @@
+"""Re-run validation and/or grading over stored experiments, with checkpoints so a job can resume."""
+import datetime
+import json
+import os
+import threading
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+
+from atomic_io import write_json_atomic
+from experiment_store import EXPERIMENTS_DIR, MAX_PAGE_SIZE
+from hed_validation import validate_hed_string
+from schema_cache import schema_registry
+
+CHECKPOINT_DIR = Path(os.getenv('RESCORE_CHECKPOINT_DIR', EXPERIMENTS_DIR / 'rescore_jobs'))
+VALIDATION_WORKERS = int(os.getenv('RESCORE_VALIDATION_WORKERS', str(min(4, os.cpu_count() or 1))))
+GRADING_WORKERS = int(os.getenv('RESCORE_GRADING_WORKERS', '4'))
+
+# Save the checkpoint after this many finished experiments (and always at the end)
+CHECKPOINT_EVERY = 20
+
+
+def select_filenames(store, filenames=None, **filters):
+    """Return the filenames to rescore: the given ones, or every experiment matching the listing filters"""
+    if filenames:
+        return [filename for filename in filenames if store.has(filename)]
+    selected = []
+    cursor = None
+    while True:
+        rows, cursor = store.query_summaries(cursor=cursor, limit=MAX_PAGE_SIZE, order='asc',
+                                             fields=['filename'], **filters)
+        selected.extend(row['filename'] for row in rows)
+        if cursor is None:
+            return selected
+
+
+def result_error(field, value):
+    """
+    Why a validation or grading result records a failure instead of a result, None when it is a result:
+    validate_hed_string returns -1 and the graders return {'score': None, 'full_response': 'Error: ...'}
+    when they could not run.
+    """
+    if field == 'validation_issues':
+        return 'HED validation could not be performed' if value == -1 else None
+    if not value:
+        return 'No grade returned'
+    if value.get('score') is None and str(value.get('full_response', '')).startswith('Error:'):
+        return value['full_response']
+    return None
+
+
+class RescoreJob:
+    """
+    Re-validate and/or re-grade a fixed list of experiments.
+
+    Validation and grading each run on a small thread pool in this process.
+    Validation starts with the in-memory fast check, so only annotations that
+    pass it reach hedtools; a process pool would re-import the caller's
+    __main__ (the app, or a script) in every worker. With
+    options['grading_batch_size'] > 1 and a grade_batch_fn(pairs) -> grades,
+    experiments ready for grading are graded that many per call. Each
+    experiment's new scores are written in one store update, and the job's
+    progress is checkpointed to CHECKPOINT_DIR/<job_id>.json so an
+    interrupted job resumes with the experiments it has not finished.
+    An experiment whose validation or grading errors (see result_error) is
+    recorded as failed and left as it was, so resuming the job retries it.
+    """
+
+    def __init__(self, filenames, store, grade_fn=None, validate=True, grade=True, options=None,
+                 job_id=None, done=None, validation_workers=VALIDATION_WORKERS, grading_workers=GRADING_WORKERS,
+                 checkpoint_dir=CHECKPOINT_DIR, grade_batch_fn=None):
+        self.job_id = job_id or f"rescore_{datetime.datetime.now():%Y%m%d_%H%M%S}_{uuid.uuid4().hex[:6]}"
+        self.filenames = list(filenames)
+        self.store = store
+        self.grade_fn = grade_fn
+        self.grade_batch_fn = grade_batch_fn
+        self.validate = validate
+        self.grade = grade
+        self.options = options or {}
+        self.validation_workers = validation_workers
+        self.grading_workers = grading_workers
+        self.checkpoint_path = Path(checkpoint_dir) / f'{self.job_id}.json'
+        self.done = set(done or ())
+        self.failed = {}
+        self.skipped = 0
+        self.status = 'pending'
+        self.started_at = None
+        self.finished_at = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def resume(cls, job_id, store, grade_fn=None, checkpoint_dir=CHECKPOINT_DIR, **kwargs):
+        """
+        Rebuild a job from its checkpoint; finished experiments are not redone.
+        Set grade_fn (e.g. from job.options) before running a grading job.
+        """
+        with open(Path(checkpoint_dir) / f'{job_id}.json', 'r') as f:
+            checkpoint = json.load(f)
+        job = cls(checkpoint['filenames'], store, grade_fn=grade_fn, validate=checkpoint['validate'],
+                  grade=checkpoint['grade'], options=checkpoint.get('options'), job_id=job_id,
+                  done=checkpoint['done'], checkpoint_dir=checkpoint_dir, **kwargs)
+        job.started_at = checkpoint.get('started_at')
+        return job
+
+    def progress(self):
+        with self._lock:
+            return {
+                'job_id': self.job_id,
+                'status': self.status,
+                'validate': self.validate,
+                'grade': self.grade,
+                'options': self.options,
+                'total': len(self.filenames),
+                'done': len(self.done),
+                'failed': len(self.failed),
+                'skipped': self.skipped,
+                'errors': dict(list(self.failed.items())[:20]),
+                'started_at': self.started_at,
+                'finished_at': self.finished_at
+            }
+
+    def save_checkpoint(self):
+        with self._lock:
+            checkpoint = {
+                'job_id': self.job_id,
+                'status': self.status,
+                'validate': self.validate,
+                'grade': self.grade,
+                'options': self.options,
+                'filenames': self.filenames,
+                'done': sorted(self.done),
+                'failed': self.failed,
+                'started_at': self.started_at,
+                'finished_at': self.finished_at
+            }
+        write_json_atomic(self.checkpoint_path, checkpoint)
+
+    def run(self, on_progress=None):
+        """Process every unfinished experiment; returns progress()"""
+        if self.grade and self.grade_fn is None and self.grade_batch_fn is None:
+            raise ValueError('grade_fn is required when grading')
+        with self._lock:
+            self.status = 'running'
+            self.started_at = self.started_at or datetime.datetime.now().isoformat()
+            self.failed = {}
+        self.save_checkpoint()
+
+        try:
+            self._run(on_progress)
+        except BaseException:
+            with self._lock:
+                self.status = 'interrupted'
+            self.save_checkpoint()
+            raise
+
+        with self._lock:
+            self.status = 'failed' if self.failed else 'done'
+            self.finished_at = datetime.datetime.now().isoformat()
+        self.save_checkpoint()
+        return self.progress()
+
+    def _run(self, on_progress):
+        pending = [filename for filename in self.filenames if filename not in self.done]
+        validation_pool = (ThreadPoolExecutor(self.validation_workers, thread_name_prefix='rescore-validate',
+                                              initializer=schema_registry.warm)
+                           if self.validate and pending else None)
+        grading_pool = ThreadPoolExecutor(self.grading_workers, thread_name_prefix='rescore') if self.grade else None
+        futures = {}
+        partial = {}
+        ready = []
+        since_checkpoint = 0
+        batch_size = int(self.options.get('grading_batch_size') or 1)
+        batching = self.grade_batch_fn is not None and batch_size > 1
+
+        def start_grading(filename):
+            if batching:
+                ready.append(filename)
+                return
+            record = partial[filename]
+            futures[grading_pool.submit(self.grade_fn, record['description'], record['annotation'])] = \
+                (filename, 'quality_grade')
+
+        def flush_batches():
+            # Send full batches; send a partial one only once no validation can add to it
+            validating = any(field == 'validation_issues' for _, field in futures.values())
+            while ready and (len(ready) >= batch_size or not validating):
+                batch = ready[:batch_size]
+                del ready[:batch_size]
+                pairs = [(partial[filename]['description'], partial[filename]['annotation']) for filename in batch]
+                futures[grading_pool.submit(self.grade_batch_fn, pairs)] = (batch, 'quality_grade')
+
+        try:
+            for filename in pending:
+                record = self.store.get(filename, rehydrate=False)
+                annotation = (record or {}).get('annotation')
+                if not annotation:
+                    with self._lock:
+                        self.skipped += 1
+                        self.done.add(filename)
+                    continue
+                partial[filename] = {'description': record.get('description', ''), 'annotation': annotation,
+                                     'changes': {}}
+                if self.validate:
+                    futures[validation_pool.submit(validate_hed_string, annotation)] = (filename, 'validation_issues')
+                else:
+                    start_grading(filename)
+            flush_batches()
+
+            while futures:
+                finished, _ = wait(list(futures), return_when=FIRST_COMPLETED)
+                for future in finished:
+                    filenames, field = futures.pop(future)
+                    # A batched grading future carries a list of experiments and returns one grade for each
+                    batched = isinstance(filenames, list)
+                    if not batched:
+                        filenames = [filenames]
+                    try:
+                        values = future.result() if batched else [future.result()]
+                    except Exception as e:
+                        with self._lock:
+                            for filename in filenames:
+                                self.failed[filename] = str(e)
+                        for filename in filenames:
+                            partial.pop(filename)
+                        continue
+                    for filename, value in zip(filenames, values):
+                        error = result_error(field, value)
+                        if error:
+                            # Keep the stored scores; the experiment is not done, so a resume retries it
+                            with self._lock:
+                                self.failed[filename] = error
+                            partial.pop(filename)
+                            continue
+                        partial[filename]['changes'][field] = value
+                        if field == 'validation_issues' and self.grade:
+                            start_grading(filename)
+                            continue
+                        self._finish(filename, partial.pop(filename)['changes'])
+                        since_checkpoint += 1
+                        if since_checkpoint >= CHECKPOINT_EVERY:
+                            self.save_checkpoint()
+                            since_checkpoint = 0
+                        if on_progress:
+                            on_progress(self.progress())
+                flush_batches()
+        finally:
+            for pool in (validation_pool, grading_pool):
+                if pool is not None:
+                    pool.shutdown(wait=True, cancel_futures=True)
+
+    def _finish(self, filename, changes):
+        changes['scoring_status'] = 'done'
+        changes['rescored_at'] = datetime.datetime.now().isoformat()
+        changes['rescore_job'] = self.job_id
+        try:
+            self.store.update(filename, changes)
+        except Exception as e:
+            with self._lock:
+                self.failed[filename] = str(e)
+            return
+        with self._lock:
+            self.done.add(filename)
+
+
+def list_checkpoints(checkpoint_dir=CHECKPOINT_DIR):
+    """Return the progress recorded in every checkpoint, newest first"""
+    jobs = []
+    for path in sorted(Path(checkpoint_dir).glob('rescore_*.json'), reverse=True):
+        try:
+            with open(path, 'r') as f:
+                checkpoint = json.load(f)
+        except (OSError, ValueError):
+            continue
+        jobs.append({
+            'job_id': checkpoint['job_id'],
+            'status': checkpoint.get('status'),
+            'total': len(checkpoint.get('filenames', [])),
+            'done': len(checkpoint.get('done', [])),
+            'failed': len(checkpoint.get('failed', {})),
+            'started_at': checkpoint.get('started_at'),
+            'finished_at': checkpoint.get('finished_at')
+        })
+    return jobs
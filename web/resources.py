@@ -0,0 +1,118 @@
+"""Application-level resources loaded once: HED vocab, compiled templates and model clients."""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import ollama
+from google import genai
+from jinja2 import Template
+
+from atomic_io import write_text_atomic
+
+HED_VOCAB_PATH = Path(__file__).parent.parent / 'HED_vocab_reformatted.xml'
+TEMPLATE_CACHE_SIZE = 64
+# Seconds a single model call may take before the client gives up
+LLM_TIMEOUT = float(os.getenv('LLM_TIMEOUT', '300'))
+
+_template_cache = OrderedDict()
+_template_lock = threading.Lock()
+
+
+def compile_template(prompt_template):
+    """Return a compiled Jinja template, cached by the hash of its source"""
+    key = hashlib.sha256(prompt_template.encode('utf-8')).hexdigest()
+    with _template_lock:
+        template = _template_cache.get(key)
+        if template is not None:
+            _template_cache.move_to_end(key)
+            return template
+    template = Template(prompt_template)
+    with _template_lock:
+        _template_cache[key] = template
+        while len(_template_cache) > TEMPLATE_CACHE_SIZE:
+            _template_cache.popitem(last=False)
+    return template
+
+
+class ResourceManager:
+    """
+    Holds the resources every request needs so they are paid for once:
+    the vocab text (reloaded when the file changes on disk), and one
+    Ollama and one Gemini client whose HTTP connections are kept alive.
+    """
+
+    def __init__(self, vocab_path=HED_VOCAB_PATH):
+        self.vocab_path = Path(vocab_path)
+        self._lock = threading.Lock()
+        self._vocab = None
+        self._vocab_stamp = None
+        self._ollama = None
+        self._gemini = None
+        self._gemini_key = None
+
+    def _stamp(self):
+        stat = self.vocab_path.stat()
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def vocab(self):
+        """Return the vocab text, re-reading it only when the file has changed"""
+        stamp = self._stamp()
+        with self._lock:
+            if self._vocab is not None and self._vocab_stamp == stamp:
+                return self._vocab
+        with open(self.vocab_path, 'r') as file:
+            vocab = file.read()
+        with self._lock:
+            self._vocab, self._vocab_stamp = vocab, stamp
+        return vocab
+
+    def save_vocab(self, vocab_content):
+        """Atomically replace the vocab file and make it the cached version"""
+        write_text_atomic(self.vocab_path, vocab_content)
+        with self._lock:
+            self._vocab, self._vocab_stamp = vocab_content, self._stamp()
+
+    def ollama_client(self):
+        """Shared Ollama client (honours OLLAMA_HOST), with LLM_TIMEOUT on every call"""
+        with self._lock:
+            if self._ollama is None:
+                self._ollama = ollama.Client(host=os.getenv('OLLAMA_HOST'), timeout=LLM_TIMEOUT)
+            return self._ollama
+
+    def gemini_client(self):
+        """Shared Gemini client (honours GEMINI_BASE_URL), rebuilt when GEMINI_API_KEY changes"""
+        api_key = os.getenv('GEMINI_API_KEY')
+        if not api_key:
+            raise ValueError("GEMINI_API_KEY environment variable is not set")
+        with self._lock:
+            if self._gemini is None or self._gemini_key != api_key:
+                # The Gemini client takes its timeout in milliseconds
+                http_options = {'timeout': int(LLM_TIMEOUT * 1000)}
+                base_url = os.getenv('GEMINI_BASE_URL')
+                if base_url:
+                    http_options['base_url'] = base_url
+                self._gemini = genai.Client(api_key=api_key, http_options=http_options)
+                self._gemini_key = api_key
+            return self._gemini
+
+    def reload_credentials(self):
+        """Drop clients built from environment settings so they pick up new values"""
+        with self._lock:
+            self._ollama = None
+            self._gemini = None
+            self._gemini_key = None
+
+    def warm(self):
+        """Load the vocab and create clients ahead of the first request"""
+        try:
+            self.vocab()
+            self.ollama_client()
+            if os.getenv('GEMINI_API_KEY'):
+                self.gemini_client()
+        except Exception as e:
+            print(f"Error preloading resources: {e}")
+
+
+resources = ResourceManager()
@@ -0,0 +1,127 @@
+"""Persistent cache of LLM responses keyed on (model, rendered prompt, generation params)."""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+DEFAULT_CACHE_PATH = Path(os.getenv('RESPONSE_CACHE_DB', Path(__file__).parent.parent / 'prompt_experiments' / 'response_cache.db'))
+
+# The cache is opt-in: enable it for every request with RESPONSE_CACHE=1,
+# or per request with use_cache=true
+RESPONSE_CACHE_ENABLED = os.getenv('RESPONSE_CACHE', '0') == '1'
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', '10000'))
+RESPONSE_CACHE_TTL = float(os.getenv('RESPONSE_CACHE_TTL', str(7 * 24 * 3600)))
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    model TEXT,
+    response TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses(last_access);
+'''
+
+
+def cache_key(model, prompt, params=None):
+    """Hash the model, rendered prompt and generation params into a cache key"""
+    payload = json.dumps({'model': model, 'prompt': prompt, 'params': params or {}}, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """
+    SQLite-backed response cache with TTL expiry and least-recently-used
+    eviction once more than max_entries responses are stored.
+    """
+
+    def __init__(self, db_path=DEFAULT_CACHE_PATH, max_entries=RESPONSE_CACHE_MAX_ENTRIES, ttl=RESPONSE_CACHE_TTL):
+        self.db_path = Path(db_path)
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection().executescript(SCHEMA)
+
+    def connection(self):
+        """Return this thread's connection, opening it on first use"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def get(self, model, prompt, params=None):
+        """Return the cached response, or None on a miss or expired entry"""
+        key = cache_key(model, prompt, params)
+        now = time.time()
+        conn = self.connection()
+        row = conn.execute('SELECT response, created_at FROM responses WHERE key = ?', (key,)).fetchone()
+        if row is None or (self.ttl and now - row[1] > self.ttl):
+            if row is not None:
+                conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+            with self._lock:
+                self.misses += 1
+            return None
+        conn.execute('UPDATE responses SET last_access = ? WHERE key = ?', (now, key))
+        with self._lock:
+            self.hits += 1
+        return row[0]
+
+    def put(self, model, prompt, response, params=None):
+        """Store a response, evicting the least recently used entries when full"""
+        now = time.time()
+        conn = self.connection()
+        conn.execute(
+            'INSERT OR REPLACE INTO responses (key, model, response, created_at, last_access) VALUES (?, ?, ?, ?, ?)',
+            (cache_key(model, prompt, params), model, response, now, now)
+        )
+        self.evict()
+
+    def evict(self):
+        """Drop expired entries and trim the cache down to max_entries"""
+        conn = self.connection()
+        if self.ttl:
+            conn.execute('DELETE FROM responses WHERE created_at < ?', (time.time() - self.ttl,))
+        if self.max_entries:
+            conn.execute(
+                '''DELETE FROM responses WHERE key IN (
+                       SELECT key FROM responses ORDER BY last_access DESC LIMIT -1 OFFSET ?)''',
+                (self.max_entries,)
+            )
+
+    def clear(self):
+        self.connection().execute('DELETE FROM responses')
+
+    def stats(self):
+        entries = self.connection().execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+        with self._lock:
+            return {
+                'enabled_by_default': RESPONSE_CACHE_ENABLED,
+                'entries': entries,
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """Return the process-wide response cache"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache()
+        return _cache
@@ -0,0 +1,107 @@
+"""Process-wide cache of loaded HED schemas and validators."""
+import threading
+
+from hed import load_schema_version
+from hed.validator import HedValidator
+
+DEFAULT_SCHEMAS = [('standard', '8.4.0')]
+
+
+def schema_version_string(schema_name, schema_version):
+    """Build the version string understood by load_schema_version"""
+    if schema_name != 'standard':
+        return f'{schema_name}_{schema_version}'
+    return f'{schema_version}'
+
+
+class SchemaRegistry:
+    """
+    Registry of HED schemas keyed by (schema_name, version).
+    Schemas are loaded once and shared by every thread; validators are built
+    per thread on top of the shared schema so concurrent requests never share
+    validator state.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._schemas = {}
+        self._loading = {}
+        self._generation = 0
+        self._local = threading.local()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get_schema(self, schema_name='standard', schema_version='8.4.0'):
+        """Return the cached schema, loading it on first use"""
+        key = (schema_name, schema_version)
+        with self._lock:
+            schema = self._schemas.get(key)
+            if schema is not None:
+                self.hits += 1
+                return schema
+            self.misses += 1
+            # Only one thread parses a given schema; the others wait on its lock
+            load_lock = self._loading.setdefault(key, threading.Lock())
+
+        with load_lock:
+            with self._lock:
+                schema = self._schemas.get(key)
+                generation = self._generation
+            if schema is None:
+                schema = load_schema_version(schema_version_string(schema_name, schema_version))
+                with self._lock:
+                    # An invalidate() during the load means this schema may already be stale: hand it to this
+                    # caller but leave the cache empty, so the next call loads it again
+                    if self._generation == generation:
+                        self._schemas[key] = schema
+                    self._loading.pop(key, None)
+        return schema
+
+    def get_validator(self, schema_name='standard', schema_version='8.4.0'):
+        """Return a (schema, validator) pair for the calling thread"""
+        schema = self.get_schema(schema_name, schema_version)
+        validators = getattr(self._local, 'validators', None)
+        if validators is None or self._local.generation != self._generation:
+            validators = {}
+            self._local.validators = validators
+            self._local.generation = self._generation
+        key = (schema_name, schema_version)
+        cached = validators.get(key)
+        if cached is None or cached[0] is not schema:
+            cached = (schema, HedValidator(schema))
+            validators[key] = cached
+        return cached
+
+    def warm(self, keys=None):
+        """Load the given (schema_name, version) pairs ahead of the first request"""
+        for schema_name, schema_version in keys or DEFAULT_SCHEMAS:
+            try:
+                self.get_schema(schema_name, schema_version)
+            except Exception as e:
+                print(f"Error warming HED schema {schema_name} {schema_version}: {e}")
+
+    def invalidate(self, schema_name=None, schema_version=None):
+        """Drop cached schemas matching the given name/version (all if omitted)"""
+        with self._lock:
+            for key in list(self._schemas):
+                if schema_name is not None and key[0] != schema_name:
+                    continue
+                if schema_version is not None and key[1] != schema_version:
+                    continue
+                del self._schemas[key]
+                self.invalidations += 1
+            self._generation += 1
+
+    def stats(self):
+        """Return cache counters and the currently loaded schemas"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'loaded': [f'{name}:{version}' for name, version in self._schemas]
+            }
+
+
+schema_registry = SchemaRegistry()
@@ -0,0 +1,150 @@
+"""Self-consistency sampling: draw several annotations concurrently and stop once enough of them agree."""
+import threading
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from hed_checker import HedTag, parse_hed_string
+
+DEFAULT_SAMPLES = 5
+
+
+def normalize_tag(text, tree=None):
+    """
+    Canonical form of one tag: case-folded, with a long-form path reduced to
+    its most specific vocabulary tag (Event/Sensory-event -> sensory-event)
+    and any value or extension kept after it.
+    """
+    components = [component.strip() for component in text.split('/')]
+    if tree is None:
+        return '/'.join(components).lower()
+    node = None
+    for i, component in enumerate(components):
+        if node is not None and node.takes_value:
+            return f"{node.name}/{'/'.join(components[i:])}".lower()
+        child = tree.get(component)
+        if child is None:
+            return '/'.join(([node.name] if node is not None else []) + components[i:]).lower()
+        node = child
+    return node.name.lower()
+
+
+def normalize_annotation(annotation, tree=None):
+    """
+    Canonical string of an annotation's tag set: tags are normalized and
+    groups compared as sets, so order, case, duplicates and long/short form
+    do not matter. Returns '' when the annotation has no tags.
+    """
+    def canonical(items):
+        parts = set()
+        for item in items:
+            if isinstance(item, HedTag):
+                parts.add(normalize_tag(item.text, tree))
+            else:
+                group = canonical(item)
+                if group:
+                    parts.add(f'({group})')
+        return ','.join(sorted(parts))
+
+    groups, _ = parse_hed_string(annotation or '')
+    return canonical(groups)
+
+
+class SelfConsistencyRunner:
+    """
+    Request `samples` generations concurrently and vote on their normalized
+    annotations. As soon as one annotation has `quorum` votes the samples
+    still queued are cancelled and the ones in flight are told to stop
+    through the cancel event passed to sample_fn.
+
+    sample_fn(index, cancel_event) returns the response text, or None if it
+    stopped because cancel_event was set; extract_fn(response) returns the
+    annotation found in a response ('' if none).
+    """
+
+    def __init__(self, sample_fn, extract_fn, samples=DEFAULT_SAMPLES, quorum=None, max_workers=None, tree=None):
+        self.sample_fn = sample_fn
+        self.extract_fn = extract_fn
+        self.samples = max(1, int(samples))
+        # Default to a strict majority of the requested samples
+        self.quorum = max(1, min(int(quorum or self.samples // 2 + 1), self.samples))
+        self.max_workers = max(1, min(int(max_workers or self.samples), self.samples))
+        self.tree = tree
+
+    def run(self):
+        """
+        Return a dict with the consensus 'response' and 'annotation' and the
+        agreement statistics under 'self_consistency'.
+        """
+        start_time = time.time()
+        cancel = threading.Event()
+        votes = Counter()
+        first_sample = {}
+        completed = []
+        failures = []
+        executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='sample')
+        futures = {executor.submit(self.sample_fn, index, cancel): index for index in range(self.samples)}
+        winner = None
+        try:
+            pending = set(futures)
+            while pending and winner is None:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    index = futures[future]
+                    try:
+                        response = future.result()
+                    except Exception as e:
+                        failures.append(str(e))
+                        continue
+                    if response is None:
+                        continue
+                    annotation = self.extract_fn(response)
+                    key = normalize_annotation(annotation, self.tree)
+                    completed.append({'index': index, 'annotation': annotation, 'key': key,
+                                      'time': time.time() - start_time, 'response': response})
+                    if not key:
+                        # Samples without an annotation do not vote
+                        continue
+                    votes[key] += 1
+                    first_sample.setdefault(key, completed[-1])
+                    if votes[key] >= self.quorum:
+                        winner = key
+                        break
+        finally:
+            cancel.set()
+            cancelled = sum(1 for future in futures if future.cancel())
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        if winner is None and votes:
+            # No quorum: fall back to the plurality, earliest sample breaking ties
+            winner = max(votes, key=lambda key: (votes[key], -first_sample[key]['time']))
+        if winner is not None:
+            chosen = first_sample[winner]
+        elif completed:
+            chosen = completed[0]
+        else:
+            raise RuntimeError(f"All {self.samples} samples failed: {failures[0] if failures else 'cancelled'}")
+
+        voting = sum(votes.values())
+        return {
+            'response': chosen['response'],
+            'annotation': chosen['annotation'],
+            'self_consistency': {
+                'samples_requested': self.samples,
+                'samples_completed': len(completed),
+                'samples_failed': len(failures),
+                'samples_cancelled': self.samples - len(completed) - len(failures),
+                'samples_cancelled_before_start': cancelled,
+                'quorum': self.quorum,
+                'quorum_reached': winner is not None and votes[winner] >= self.quorum,
+                'consensus_votes': votes[winner] if winner is not None else 0,
+                'agreement': round(votes[winner] / voting, 3) if winner is not None and voting else 0.0,
+                'distinct_annotations': len(votes),
+                'time_to_consensus': time.time() - start_time,
+                'variants': [
+                    {'annotation': first_sample[key]['annotation'], 'votes': count}
+                    for key, count in votes.most_common()
+                ],
+                'sample_times': [round(sample['time'], 3) for sample in completed]
+            }
+        }
@@ -0,0 +1,80 @@
+"""Admission control for the model-bound routes so concurrent users get a fast 503 instead of a pile-up."""
+import functools
+import os
+import threading
+
+from flask import jsonify, make_response
+
+# Experiments (single, streamed or batch) a worker process runs at once
+MAX_INFLIGHT = int(os.getenv('MAX_INFLIGHT_EXPERIMENTS', '8'))
+# Seconds a request may wait for a free slot before it is turned away
+ADMISSION_TIMEOUT = float(os.getenv('ADMISSION_TIMEOUT', '10'))
+
+
+class AdmissionLimiter:
+    """
+    Counting semaphore in front of expensive routes. A request waits up to
+    `timeout` seconds for one of `limit` slots and is rejected when none
+    frees up. The slot is held until the response has been fully sent, so
+    streamed responses count for as long as they are generating.
+    """
+
+    def __init__(self, limit=MAX_INFLIGHT, timeout=ADMISSION_TIMEOUT):
+        self.limit = limit
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(limit)
+        self._lock = threading.Lock()
+        self.inflight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+
+    def acquire(self):
+        with self._lock:
+            self.waiting += 1
+        acquired = self._slots.acquire(timeout=self.timeout)
+        with self._lock:
+            self.waiting -= 1
+            if acquired:
+                self.inflight += 1
+                self.admitted += 1
+            else:
+                self.rejected += 1
+        return acquired
+
+    def release(self):
+        with self._lock:
+            self.inflight -= 1
+        self._slots.release()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'limit': self.limit,
+                'inflight': self.inflight,
+                'waiting': self.waiting,
+                'admitted': self.admitted,
+                'rejected': self.rejected
+            }
+
+    def limit_route(self, view):
+        """Decorate a Flask view so it only runs while holding a slot"""
+        @functools.wraps(view)
+        def limited(*args, **kwargs):
+            if not self.acquire():
+                response = jsonify({'error': 'Server is busy running other experiments, retry shortly'})
+                response.status_code = 503
+                response.headers['Retry-After'] = str(max(1, int(self.timeout)))
+                return response
+            try:
+                response = make_response(view(*args, **kwargs))
+            except BaseException:
+                self.release()
+                raise
+            # Runs once the body (including a streamed one) has been sent or the client went away
+            response.call_on_close(self.release)
+            return response
+        return limited
+
+
+experiment_limiter = AdmissionLimiter()
@@ -2,6 +2,7 @@
 let currentExperiment = null;
 let currentExperimentData = null;
 let currentVocabContent = null;
+let descriptionMatches = [];
 
 // Default prompt template
 const DEFAULT_PROMPT_TEMPLATE = `
@@ -74,6 +75,24 @@ function setupEventListeners() {
         runExperiment();
     });
     
+    // Start loading a local model as soon as it is picked, so the first run does not wait for it
+    document.getElementById('modelSelect').addEventListener('change', function() {
+        if (this.value && !this.value.startsWith('gemini')) {
+            fetch('/api/models/preload', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ model: this.value })
+            }).catch(error => console.error('Error preloading model:', error));
+        }
+    });
+    
+    // Search the description history as the user types
+    let descriptionSearchTimer = null;
+    document.getElementById('descriptionSearch').addEventListener('input', function() {
+        clearTimeout(descriptionSearchTimer);
+        descriptionSearchTimer = setTimeout(() => loadDescriptions(this.value), 150);
+    });
+    
     // Sample descriptions
     document.getElementById('descriptionInput').addEventListener('focus', function() {
         if (this.value === '') {
@@ -95,10 +114,11 @@ async function loadModels() {
         if (models.ollama && models.ollama.length > 0) {
             const ollamaGroup = document.createElement('optgroup');
             ollamaGroup.label = 'Ollama Models';
+            const loaded = models.loaded || [];
             models.ollama.forEach(model => {
                 const option = document.createElement('option');
                 option.value = model;
-                option.textContent = model;
+                option.textContent = loaded.includes(model) ? `${model} (loaded)` : model;
                 ollamaGroup.appendChild(option);
             });
             modelSelect.appendChild(ollamaGroup);
@@ -117,8 +137,20 @@ async function loadModels() {
             modelSelect.appendChild(geminiGroup);
         }
         
-        // Select default model
+        // Select default model (or the first installed one when it is not pulled)
         modelSelect.value = 'qwen3:8b';
+        if (!modelSelect.value && models.ollama && models.ollama.length > 0) {
+            modelSelect.value = models.ollama[0];
+        }
+        
+        // Offer the same models as experiment list filters
+        const modelFilter = document.getElementById('experimentModelFilter');
+        [...(models.ollama || []), ...(models.gemini || [])].forEach(model => {
+            const option = document.createElement('option');
+            option.value = model;
+            option.textContent = model;
+            modelFilter.appendChild(option);
+        });
         
     } catch (error) {
         console.error('Error loading models:', error);
@@ -126,20 +158,11 @@ async function loadModels() {
     }
 }
 
-// Load experiments list
-async function loadExperiments() {
-    try {
-        const response = await fetch('/api/experiments');
-        const experiments = await response.json();
-        
-        const container = document.getElementById('recentExperiments');
-        
-        if (experiments.length === 0) {
-            container.innerHTML = '<p class="text-muted">No experiments found.</p>';
-            return;
-        }
-        
-        container.innerHTML = experiments.map(exp => `
+// Load experiments list, one page at a time
+let experimentsCursor = null;
+
+function experimentItemHtml(exp) {
+    return `
             <div class="experiment-item" onclick="viewExperiment('${exp.filename}')">
                 <div class="d-flex justify-content-between align-items-start">
                     <div class="flex-grow-1">
@@ -150,14 +173,48 @@ async function loadExperiments() {
                         <div class="experiment-model">
                             <i class="fas fa-robot"></i> ${exp.model}
                             ${exp.inference_time ? `<span class="badge bg-info ms-2">${formatInferenceTime(exp.inference_time)}</span>` : ''}
-                            ${exp.validation_issues !== undefined ? `<span class="badge bg-secondary ms-2">${exp.validation_issues} issues</span>` : ''}
+                            ${exp.validation_issues !== undefined && exp.validation_issues !== null ? `<span class="badge bg-secondary ms-2">${exp.validation_issues} issues</span>` : ''}
+                            ${exp.validation_issues === null ? `<span class="badge bg-light text-dark ms-2">scoring...</span>` : ''}
                             ${exp.quality_score !== undefined && exp.quality_score !== null ? `<span class="badge bg-secondary ms-2">${exp.quality_score}/10</span>` : ''}
                         </div>
                     </div>
                     <div class="experiment-timestamp">${formatTimestamp(exp.timestamp)}</div>
                 </div>
             </div>
-        `).join('');
+        `;
+}
+
+async function loadExperiments(append = false) {
+    try {
+        const params = new URLSearchParams({
+            limit: 50,
+            fields: 'experiment_id,filename,model,timestamp,inference_time,experiment_name,validation_issues,quality_score'
+        });
+        const modelFilter = document.getElementById('experimentModelFilter').value;
+        const nameFilter = document.getElementById('experimentNameFilter').value.trim();
+        if (modelFilter) params.set('model', modelFilter);
+        if (nameFilter) params.set('name', nameFilter);
+        if (append && experimentsCursor !== null) params.set('cursor', experimentsCursor);
+        
+        const response = await fetch(`/api/experiments?${params}`);
+        const page = await response.json();
+        
+        const container = document.getElementById('recentExperiments');
+        const moreButton = document.getElementById('loadMoreExperiments');
+        experimentsCursor = page.next_cursor;
+        moreButton.classList.toggle('d-none', !page.has_more);
+        
+        if (!append && page.experiments.length === 0) {
+            container.innerHTML = '<p class="text-muted">No experiments found.</p>';
+            return;
+        }
+        
+        const html = page.experiments.map(experimentItemHtml).join('');
+        if (append) {
+            container.insertAdjacentHTML('beforeend', html);
+        } else {
+            container.innerHTML = html;
+        }
         
     } catch (error) {
         console.error('Error loading experiments:', error);
@@ -166,24 +223,41 @@ async function loadExperiments() {
     }
 }
 
+// Reload the experiments list when a filter changes (debounced for typing)
+let experimentFilterTimer = null;
+function filterExperiments() {
+    clearTimeout(experimentFilterTimer);
+    experimentFilterTimer = setTimeout(() => loadExperiments(), 250);
+}
+
 // Load description history
-async function loadDescriptions() {
+async function loadDescriptions(query = document.getElementById('descriptionSearch').value) {
     try {
-        const response = await fetch('/api/descriptions');
-        const descriptions = await response.json();
+        // Matches first (best match kind, then most used), then descriptions similar to the query
+        const params = new URLSearchParams({ q: query, limit: 30, k: query.trim() ? 5 : 0 });
+        const response = await fetch(`/api/descriptions/search?${params}`);
+        const result = await response.json();
         
         const dropdown = document.getElementById('descriptionHistory');
+        descriptionMatches = result.matches.concat(result.similar).map(item => item.description);
         
-        if (descriptions.length === 0) {
-            dropdown.innerHTML = '<li><a class="dropdown-item text-muted">No previous descriptions</a></li>';
+        if (descriptionMatches.length === 0) {
+            const message = query.trim() ? 'No matching descriptions' : 'No previous descriptions';
+            dropdown.innerHTML = `<li><a class="dropdown-item text-muted">${message}</a></li>`;
             return;
         }
         
-        dropdown.innerHTML = descriptions.map(item => {
-            const truncated = truncateText(item.description, 60);
+        const itemHtml = (item, index) => {
+            const truncated = escapeHtml(truncateText(item.description, 60));
             const countBadge = item.count > 1 ? `<span class="badge bg-secondary ms-1">${item.count}</span>` : '';
-            return `<li><a class="dropdown-item" href="#" onclick="selectDescription('${escapeHtml(item.description)}')">${truncated}${countBadge}</a></li>`;
-        }).join('');
+            return `<li><a class="dropdown-item" href="#" title="${escapeHtml(item.description)}" onclick="selectDescription(descriptionMatches[${index}]); return false;">${truncated}${countBadge}</a></li>`;
+        };
+        let html = result.matches.map(itemHtml).join('');
+        if (result.similar.length > 0) {
+            html += '<li><h6 class="dropdown-header">Similar descriptions</h6></li>';
+            html += result.similar.map((item, index) => itemHtml(item, result.matches.length + index)).join('');
+        }
+        dropdown.innerHTML = html;
         
     } catch (error) {
         console.error('Error loading descriptions:', error);
@@ -192,7 +266,6 @@ async function loadDescriptions() {
     }
 }
 
-// Select description from history
 function selectDescription(description) {
     document.getElementById('descriptionInput').value = description;
     // Close dropdown
@@ -254,6 +327,10 @@ async function viewExperiment(filename) {
                         <summary class="text-muted" style="cursor: pointer;">View grader response</summary>
                         <pre class="mt-2 text-dark" style="font-size: 0.8em;">${experiment.quality_grade.full_response}</pre>
                     </details>
+                    ${experiment.quality_grade.second_opinion ? `
+                    <small class="text-muted">LLM second opinion: ${experiment.quality_grade.second_opinion.score ?? 'n/a'}/10
+                        (${experiment.quality_grade.second_opinion.grader_model})</small>
+                    ` : ''}
                 </div>
                 ` : ''}
                 
@@ -319,6 +396,40 @@ function downloadExperiment() {
     window.open(`/api/download_experiment/${currentExperiment}`, '_blank');
 }
 
+// Store the annotation of the experiment being viewed as the gold annotation of its description
+async function saveGoldAnnotation() {
+    if (!currentExperimentData || !currentExperimentData.annotation) {
+        showAlert('This experiment has no annotation to use as gold.', 'warning');
+        return;
+    }
+    
+    try {
+        const response = await fetch('/api/gold_annotations', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({
+                description: currentExperimentData.description,
+                annotation: currentExperimentData.annotation
+            })
+        });
+        
+        const result = await response.json();
+        
+        if (result.error) {
+            showAlert(result.error, 'danger');
+            return;
+        }
+        
+        showAlert('Gold annotation saved. New runs of this description are scored against it.', 'success');
+        
+    } catch (error) {
+        console.error('Error saving gold annotation:', error);
+        showAlert('Error saving gold annotation. Please try again.', 'danger');
+    }
+}
+
 // Run experiment
 async function runExperiment() {
     const model = document.getElementById('modelSelect').value;
@@ -349,6 +460,16 @@ async function runExperiment() {
         }
     }
     
+    const samples = parseInt(document.getElementById('selfConsistencySamples').value, 10) || 1;
+    const outputMode = document.getElementById('outputMode').value;
+    const structuredOutput = outputMode === 'markers' ? null : { constrain_tags: outputMode === 'json_tags' };
+    
+    // Self-consistency votes over whole samples and JSON output is parsed whole, so both use the non-streaming endpoint
+    if (document.getElementById('streamResponse').checked && samples <= 1 && !structuredOutput) {
+        await runExperimentStream(model, description, promptTemplate, experimentName);
+        return;
+    }
+    
     // Show loading modal
     const loadingModal = new bootstrap.Modal(document.getElementById('loadingModal'));
     loadingModal.show();
@@ -363,7 +484,11 @@ async function runExperiment() {
                 model: model,
                 description: description,
                 prompt_template: promptTemplate,
-                experiment_name: experimentName
+                experiment_name: experimentName,
+                vocab_retrieval: document.getElementById('vocabRetrieval').checked,
+                self_consistency: samples > 1 ? { samples: samples } : null,
+                structured_output: structuredOutput,
+                prefix_cache: document.getElementById('prefixCache').checked
             })
         });
         
@@ -375,38 +500,165 @@ async function runExperiment() {
         }
         
         // Display results
-        displayResults(result, experimentName);
-        
-        // Store current experiment data for potential manual operations
-        currentExperimentData = {
-            model: model,
-            description: description,
-            prompt_template: promptTemplate,
-            experiment_name: experimentName,
-            experiment_id: result.experiment_id,
-            model_response: result.response,
-            annotations: result.annotations,
-            inference_time: result.inference_time,
-            full_prompt: result.prompt,
-            filename: result.filename
-        };
+        finishExperimentRun(result, model, description, promptTemplate, experimentName);
         
-        // Show success message with auto-save info
-        if (result.auto_saved && result.filename) {
-            showAlert(`Experiment completed and automatically saved as ${result.filename}!`, 'success');
+    } catch (error) {
+        console.error('Error running experiment:', error);
+        showAlert('Error running experiment. Please try again.', 'danger');
+    } finally {
+        loadingModal.hide();
+    }
+}
+
+// Run experiment with streamed tokens (server-sent events over a POST response)
+async function runExperimentStream(model, description, promptTemplate, experimentName) {
+    // Show the results section right away and fill it in as tokens arrive
+    hideResults();
+    const responseEl = document.getElementById('modelResponse');
+    responseEl.textContent = '';
+    document.getElementById('fullPrompt').textContent = '';
+    document.getElementById('inferenceTime').textContent = 'Generating...';
+    document.getElementById('resultModel').textContent = model;
+    document.getElementById('resultsSection').style.display = 'block';
+    
+    try {
+        const response = await fetch('/api/run_experiment_stream', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({
+                model: model,
+                description: description,
+                prompt_template: promptTemplate,
+                experiment_name: experimentName,
+                vocab_retrieval: document.getElementById('vocabRetrieval').checked,
+                prefix_cache: document.getElementById('prefixCache').checked
+            })
+        });
+        
+        if (!response.ok) {
+            const error = await response.json();
+            showAlert(error.error || 'Error running experiment.', 'danger');
+            return;
+        }
+        
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
             
-            // Reload experiments list and descriptions to show the new experiment
-            loadExperiments();
-            loadDescriptions();
-        } else {
-            showAlert('Experiment completed successfully!', 'success');
+            // Events are separated by a blank line
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const rawEvent = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+                
+                const eventName = (rawEvent.match(/^event: (.*)$/m) || [])[1];
+                const dataLine = (rawEvent.match(/^data: (.*)$/m) || [])[1];
+                if (!eventName || !dataLine) continue;
+                const payload = JSON.parse(dataLine);
+                
+                if (eventName === 'prompt') {
+                    document.getElementById('fullPrompt').textContent = payload.prompt;
+                } else if (eventName === 'token') {
+                    responseEl.textContent += payload.text;
+                    responseEl.scrollTop = responseEl.scrollHeight;
+                } else if (eventName === 'annotation') {
+                    document.getElementById('inferenceTime').textContent =
+                        `Annotation after ${formatInferenceTime(payload.time_to_annotation)}...`;
+                } else if (eventName === 'result') {
+                    finishExperimentRun(payload, model, description, promptTemplate, experimentName);
+                } else if (eventName === 'error') {
+                    showAlert(payload.error, 'danger');
+                }
+            }
         }
         
     } catch (error) {
         console.error('Error running experiment:', error);
         showAlert('Error running experiment. Please try again.', 'danger');
-    } finally {
-        loadingModal.hide();
+    }
+}
+
+// Display a finished experiment and refresh the history panels
+function finishExperimentRun(result, model, description, promptTemplate, experimentName) {
+    displayResults(result, experimentName);
+    
+    if (result.time_to_first_token !== undefined && result.time_to_first_token !== null) {
+        document.getElementById('inferenceTime').textContent =
+            `${formatInferenceTime(result.inference_time)} (first token ${formatInferenceTime(result.time_to_first_token)})`;
+    }
+    if (result.prefix_cache) {
+        document.getElementById('inferenceTime').textContent +=
+            `, ${result.prefix_cache.prefill_tokens_saved} prefill tokens reused`;
+    }
+    
+    // Store current experiment data for potential manual operations
+    currentExperimentData = {
+        model: model,
+        description: description,
+        prompt_template: promptTemplate,
+        experiment_name: experimentName,
+        experiment_id: result.experiment_id,
+        model_response: result.response,
+        annotations: result.annotations,
+        inference_time: result.inference_time,
+        full_prompt: result.prompt,
+        filename: result.filename
+    };
+    
+    // Validation and grading finish in the background; poll for their results
+    if (result.scoring_status === 'pending' && result.filename) {
+        pollScoring(result.filename);
+    }
+    
+    // Show success message with auto-save info
+    if (result.auto_saved && result.filename) {
+        showAlert(`Experiment completed and automatically saved as ${result.filename}!`, 'success');
+        
+        // Reload experiments list and descriptions to show the new experiment
+        loadExperiments();
+        loadDescriptions();
+    } else {
+        showAlert('Experiment completed successfully!', 'success');
+    }
+}
+
+// Poll the background scoring job of an experiment until it finishes
+async function pollScoring(filename, intervalMs = 1500) {
+    while (true) {
+        await new Promise(resolve => setTimeout(resolve, intervalMs));
+        
+        // Stop if another experiment has replaced this one in the results panel
+        if (!currentExperimentData || currentExperimentData.filename !== filename) return;
+        
+        try {
+            const response = await fetch(`/api/experiment/${filename}/scoring`);
+            const scoring = await response.json();
+            
+            if (scoring.error) return;
+            if (scoring.scoring_status !== 'done' && scoring.scoring_status !== 'error') continue;
+            
+            document.getElementById('validationIssues').textContent =
+                scoring.validation_issues !== null && scoring.validation_issues !== undefined ? scoring.validation_issues : '-';
+            const qualityScore = scoring.quality_grade && scoring.quality_grade.score;
+            document.getElementById('qualityScore').textContent =
+                qualityScore !== null && qualityScore !== undefined ? `${qualityScore}/10` : '-';
+            
+            if (scoring.scoring_status === 'error') {
+                showAlert(`Scoring failed: ${scoring.scoring_error}`, 'warning');
+            }
+            loadExperiments();
+            return;
+        } catch (error) {
+            console.error('Error polling scoring status:', error);
+            return;
+        }
     }
 }
 
@@ -430,6 +682,11 @@ function displayResults(result, experimentName = '') {
         const header = document.createElement('div');
         header.className = 'fw-bold mb-1';
         header.innerHTML = `<i class="fas fa-tag"></i> Generated Annotation:`;
+        if (result.self_consistency) {
+            const stats = result.self_consistency;
+            header.innerHTML += ` <span class="badge bg-info ms-1">${stats.consensus_votes}/${stats.samples_completed} agree` +
+                `${stats.samples_cancelled ? `, ${stats.samples_cancelled} cancelled` : ''}</span>`;
+        }
         
         const content = document.createElement('pre');
         content.className = 'mb-0 text-dark';
@@ -451,8 +708,8 @@ function displayResults(result, experimentName = '') {
     // Display experiment ID (static, not editable)
     document.getElementById('experimentId').textContent = result.experiment_id || '-';
     
-    // Display validation issues
-    const validationIssues = result.validation_issues || 0;
+    // Display validation issues (still pending while the background scoring job runs)
+    const validationIssues = result.scoring_status === 'pending' ? 'scoring...' : (result.validation_issues || 0);
     const validationBadge = document.getElementById('validationIssues');
     validationBadge.textContent = validationIssues;
     
@@ -463,7 +720,10 @@ function displayResults(result, experimentName = '') {
     const qualityScore = result.quality_grade && result.quality_grade.score;
     const qualityBadge = document.getElementById('qualityScore');
     
-    if (qualityScore !== null && qualityScore !== undefined) {
+    if (result.scoring_status === 'pending') {
+        qualityBadge.textContent = 'scoring...';
+        qualityBadge.className = 'badge bg-secondary ms-2';
+    } else if (qualityScore !== null && qualityScore !== undefined) {
         qualityBadge.textContent = `${qualityScore}/10`;
         
         // Set badge color to neutral (remove conditional coloring)
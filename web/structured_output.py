@@ -0,0 +1,88 @@
+"""JSON-schema constrained responses: {reasoning, annotation}, optionally limited to vocabulary tag names."""
+import functools
+import hashlib
+import json
+import os
+import re
+
+# Sent as the system message so the rendered prompt (and its stored reference) stays unchanged
+STRUCTURED_OUTPUT_INSTRUCTIONS = (
+    'Answer with a JSON object instead of the marked sections: put your step-by-step reasoning in "reasoning" and '
+    'only the final HED annotation string in "annotation".'
+)
+
+ANNOTATION_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'reasoning': {'type': 'string'},
+        'annotation': {'type': 'string'}
+    },
+    'required': ['reasoning', 'annotation']
+}
+
+# Vocabulary names that can be dropped into a regular expression unescaped
+SAFE_TAG_NAME = re.compile(r'[A-Za-z0-9-]+')
+# Any tag-shaped name, optionally with /value: used instead of the vocabulary when the enumerated pattern is too long
+TAG_SHAPE = r'[A-Za-z0-9-]+(?:/[^,()]+)?'
+# Longest enumerated tag pattern each backend is sent. Ollama compiles it into a grammar (about 27k characters for
+# the default vocabulary); Gemini rejects patterns that large, so it only gets the tag shape.
+MAX_TAG_PATTERN_LENGTH = {
+    'ollama': int(os.getenv('MAX_TAG_PATTERN_LENGTH', '65536')),
+    'gemini': 0
+}
+
+
+def annotation_pattern(tag):
+    """Comma-separated items matching tag, each wrapped in any parentheses"""
+    item = rf'(?:\(\s*)*{tag}(?:\s*\))*'
+    return rf'^\s*{item}(?:\s*,\s*{item})*\s*$'
+
+
+@functools.lru_cache(maxsize=4)
+def tag_pattern(tree):
+    """
+    Regular expression for an annotation string built only from vocabulary
+    tags: plain names, and for tags that take a value the bare name or
+    Name/value, separated by commas and wrapped in any parentheses.
+    Parentheses are not balanced by the pattern; the fast checker reports
+    unbalanced groups.
+    """
+    nodes = [node for node in tree.by_name.values() if SAFE_TAG_NAME.fullmatch(node.name)]
+    # Longer names first so no alternative is a prefix of an earlier one
+    nodes.sort(key=lambda node: (-len(node.name), node.name))
+    alternatives = [f'{node.name}(?:/[^,()]+)?' if node.takes_value else node.name for node in nodes]
+    return annotation_pattern(f"(?:{'|'.join(alternatives)})")
+
+
+def annotation_schema(tree=None, max_pattern_length=None):
+    """
+    The response schema, with the annotation constrained to tree's tags when
+    a tree is given. If that pattern is longer than max_pattern_length, the
+    annotation is only held to the tag shape.
+    """
+    if tree is None:
+        return ANNOTATION_SCHEMA
+    pattern = tag_pattern(tree)
+    if max_pattern_length is not None and len(pattern) > max_pattern_length:
+        pattern = annotation_pattern(TAG_SHAPE)
+    schema = json.loads(json.dumps(ANNOTATION_SCHEMA))
+    schema['properties']['annotation']['pattern'] = pattern
+    return schema
+
+
+def schema_key(schema):
+    """Short stable identifier of a schema, used to key cached structured responses"""
+    return hashlib.sha256(json.dumps(schema, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+
+def parse_structured_response(text):
+    """Return {'reasoning', 'annotation'} from a structured response, or None if text is not one"""
+    if not text or not text.lstrip().startswith('{'):
+        return None
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return None
+    if not isinstance(data, dict) or not isinstance(data.get('annotation'), str):
+        return None
+    return {'reasoning': str(data.get('reasoning', '')), 'annotation': data['annotation']}
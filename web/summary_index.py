@@ -0,0 +1,237 @@
+"""In-memory index of experiment summaries and description counts, kept current incrementally."""
+import bisect
+import heapq
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+from description_search import DescriptionIndex, DEFAULT_SEARCH_LIMIT, DEFAULT_SIMILAR_K
+from experiment_store import (DEFAULT_PAGE_SIZE, EXPERIMENTS_DIR, MAX_PAGE_SIZE, SUMMARY_COLUMNS, SUMMARY_FILTERS,
+                              get_store, read_current_vocab, summary_query_columns)
+
+# Seconds between checks of the experiments folder for dropped-in JSON files (0 disables)
+SCAN_INTERVAL = float(os.getenv('SUMMARY_SCAN_INTERVAL', '2'))
+
+
+def _at_least(column):
+    return lambda row, value: row[column] is not None and row[column] >= value
+
+
+def _at_most(column):
+    return lambda row, value: row[column] is not None and row[column] <= value
+
+
+# Listing filter -> predicate with the same meaning as its SQL condition in SUMMARY_FILTERS
+SUMMARY_PREDICATES = {
+    'model': lambda row, value: row['model'] == value,
+    'name': lambda row, value: value.lower() in (row['experiment_name'] or '').lower(),
+    'since': _at_least('timestamp'),
+    'until': _at_most('timestamp'),
+    'min_score': _at_least('quality_score'),
+    'max_score': _at_most('quality_score'),
+    'validation_issues': lambda row, value: row['validation_issues'] == value,
+    'max_issues': _at_most('validation_issues')
+}
+assert SUMMARY_PREDICATES.keys() == SUMMARY_FILTERS.keys()
+
+
+def description_key(description):
+    return (description or '').strip()
+
+
+class SummaryIndex:
+    """
+    Summary rows and description usage counts held in memory.
+
+    The index is loaded once, then kept current from the store's revision
+    column: `PRAGMA data_version` on the index's own connection changes
+    whenever any other connection (another thread, worker or CLI process)
+    commits, and only rows with a newer revision are read. Until something is
+    written, queries touch no disk at all. JSON experiment files dropped into
+    the experiments folder are imported on a throttled mtime check.
+    """
+
+    def __init__(self, store, watch_dir=EXPERIMENTS_DIR, scan_interval=SCAN_INTERVAL):
+        self.store = store
+        self.watch_dir = watch_dir
+        self.scan_interval = scan_interval
+        self._conn = sqlite3.connect(store.db_path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        self._scan_lock = threading.Lock()
+        self._rows = {}
+        self._ids = []
+        self._ids_by_model = {}
+        self._descriptions = Counter()
+        self._sorted_descriptions = None
+        self._description_index = DescriptionIndex()
+        self._revision = 0
+        self._data_version = None
+        # The first scan looks at every file, so drops made while the server was down are imported too
+        # (import_json_file skips files already in the store)
+        self._last_scan = 0.0
+        self._scanned_since = 0.0
+        self._dir_mtime = None
+        self.refreshes = 0
+        self.rows_read = 0
+        self.files_imported = 0
+        self.refresh()
+
+    def _watch_dir_mtime(self):
+        try:
+            return os.stat(self.watch_dir).st_mtime_ns
+        except OSError:
+            return None
+
+    def _scan_watch_dir(self):
+        """Import JSON files created in the watched folder since the last scan"""
+        now = time.time()
+        if not self.scan_interval or now - self._last_scan < self.scan_interval:
+            return
+        if not self._scan_lock.acquire(blocking=False):
+            return
+        try:
+            self._last_scan = now
+            mtime = self._watch_dir_mtime()
+            if mtime is None or mtime == self._dir_mtime:
+                return
+            self._dir_mtime = mtime
+            # ctime cannot be preserved by a copy, so it tells new drops from files imported long ago
+            since, self._scanned_since = self._scanned_since, now
+            hed_vocab = None
+            for file_path in self.watch_dir.glob('*.json'):
+                try:
+                    if file_path.stat().st_ctime < since:
+                        continue
+                    hed_vocab = hed_vocab or read_current_vocab()
+                    if self.store.import_json_file(file_path, hed_vocab) is not None:
+                        self.files_imported += 1
+                except Exception as e:
+                    print(f"Error importing experiment {file_path}: {e}")
+        finally:
+            self._scan_lock.release()
+
+    def refresh(self):
+        """Apply every summary change committed since the last refresh"""
+        self._scan_watch_dir()
+        with self._lock:
+            version = self._conn.execute('PRAGMA data_version').fetchone()[0]
+            if version == self._data_version:
+                return
+            # Read the version first: a commit landing during the read is picked up next time
+            self._data_version = version
+            rows = self._conn.execute(
+                f'''SELECT {', '.join(SUMMARY_COLUMNS)}, revision FROM experiments
+                    WHERE filename IS NOT NULL AND revision > ? ORDER BY revision''', (self._revision,)).fetchall()
+            for row in rows:
+                self._apply(dict(row))
+            self.refreshes += 1
+            self.rows_read += len(rows)
+
+    def _apply(self, row):
+        experiment_id = row['experiment_id']
+        self._revision = max(self._revision, row.pop('revision'))
+        old = self._rows.get(experiment_id)
+        if old is None:
+            bisect.insort(self._ids, experiment_id)
+        else:
+            if old['model'] != row['model']:
+                model_ids = self._ids_by_model[old['model']]
+                del model_ids[bisect.bisect_left(model_ids, experiment_id)]
+            self._count_description(old['description'], -1)
+        if old is None or old['model'] != row['model']:
+            bisect.insort(self._ids_by_model.setdefault(row['model'], []), experiment_id)
+        self._count_description(row['description'], 1)
+        self._rows[experiment_id] = row
+
+    def _count_description(self, description, delta):
+        key = description_key(description)
+        if not key:
+            return
+        self._descriptions[key] += delta
+        if self._descriptions[key] <= 0:
+            del self._descriptions[key]
+            self._description_index.remove(key)
+        elif self._descriptions[key] == delta:
+            self._description_index.add(key)
+        self._sorted_descriptions = None
+
+    def query_summaries(self, cursor=None, limit=DEFAULT_PAGE_SIZE, order='desc', fields=None, **filters):
+        """Same contract as ExperimentStore.query_summaries, answered from memory"""
+        columns = summary_query_columns(order, fields, filters)
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        active = [(SUMMARY_PREDICATES[key], value) for key, value in filters.items()
+                  if value is not None and value != '' and key != 'model']
+        model = filters.get('model')
+        self.refresh()
+
+        page = []
+        with self._lock:
+            ids = self._ids_by_model.get(model, []) if model else self._ids
+            if order == 'desc':
+                start = bisect.bisect_left(ids, int(cursor)) if cursor is not None else len(ids)
+                candidates = (ids[i] for i in range(start - 1, -1, -1))
+            else:
+                start = bisect.bisect_right(ids, int(cursor)) if cursor is not None else 0
+                candidates = (ids[i] for i in range(start, len(ids)))
+            # Stop after one extra match to learn whether there is another page
+            for experiment_id in candidates:
+                row = self._rows[experiment_id]
+                if all(predicate(row, value) for predicate, value in active):
+                    page.append({column: row[column] for column in columns})
+                    if len(page) > limit:
+                        break
+        next_cursor = page[limit - 1]['experiment_id'] if len(page) > limit else None
+        return page[:limit], next_cursor
+
+    def description_counts(self):
+        """Return (description, count) pairs sorted by usage then alphabetically"""
+        self.refresh()
+        with self._lock:
+            if self._sorted_descriptions is None:
+                self._sorted_descriptions = sorted(self._descriptions.items(), key=lambda item: (-item[1], item[0]))
+            return self._sorted_descriptions
+
+    def search_descriptions(self, query, limit=DEFAULT_SEARCH_LIMIT, fuzzy=True):
+        """Descriptions matching query (see DescriptionIndex.search); an empty query lists the most used"""
+        if not (query or '').strip():
+            self.refresh()
+            with self._lock:
+                top = heapq.nsmallest(limit, self._descriptions.items(), key=lambda item: (-item[1], item[0]))
+            return [{'description': description, 'count': count, 'match': 'all', 'score': 1.0}
+                    for description, count in top]
+        self.refresh()
+        with self._lock:
+            return self._description_index.search(query, self._descriptions, limit, fuzzy)
+
+    def similar_descriptions(self, text, k=DEFAULT_SIMILAR_K):
+        """The k descriptions most similar to text (other than text itself)"""
+        self.refresh()
+        with self._lock:
+            return self._description_index.similar(text, self._descriptions, k)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'experiments': len(self._rows),
+                'descriptions': len(self._descriptions),
+                'revision': self._revision,
+                'refreshes': self.refreshes,
+                'rows_read': self.rows_read,
+                'files_imported': self.files_imported
+            }
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_summary_index():
+    """Return the process-wide summary index over get_store(), building it on first use"""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = SummaryIndex(get_store())
+        return _index
@@ -0,0 +1,162 @@
+"""Select the parts of the HED vocabulary relevant to a description so prompts stay small."""
+import hashlib
+import json
+import math
+import re
+import threading
+from collections import OrderedDict, defaultdict
+from pathlib import Path
+
+from hed_vocab import parse_vocab
+
+HED_SCHEMA_PATH = Path(__file__).parent.parent / 'hed_schema.json'
+
+DEFAULT_TOP_K = 40
+DEFAULT_SUBTREE_DEPTH = 1
+
+# Recurring large texts (the vocabulary, prompt prefixes) whose token estimate is kept
+TOKEN_ESTIMATE_CACHE_SIZE = 32
+
+# Name tokens say much more about a tag than words in its description
+NAME_WEIGHT = 3.0
+DESCRIPTION_WEIGHT = 1.0
+
+STOPWORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'has', 'in', 'is', 'it', 'its', 'of', 'on',
+    'or', 'that', 'the', 'this', 'to', 'was', 'which', 'with', 'such', 'may', 'can', 'not', 'other', 'something',
+    'used', 'usually', 'typically', 'e', 'g', 'i', 'also', 'into', 'their', 'there', 'these', 'those', 'who'
+}
+
+
+def tokenize(text):
+    """Lowercase word tokens with stopwords removed and light suffix stripping"""
+    tokens = []
+    for word in re.findall(r'[a-z0-9]+', text.lower()):
+        if word in STOPWORDS:
+            continue
+        for suffix in ('ing', 'ed', 'es', 's'):
+            if len(word) > len(suffix) + 3 and word.endswith(suffix):
+                word = word[:-len(suffix)]
+                break
+        tokens.append(word)
+    return tokens
+
+
+def estimate_tokens(text):
+    """Rough token count (words and punctuation) used to compare prompt sizes"""
+    return len(re.findall(r'\w+|[^\w\s]', text))
+
+
+_token_estimates = OrderedDict()
+_token_estimates_lock = threading.Lock()
+
+
+def cached_estimate_tokens(text):
+    """estimate_tokens of a text sent again and again, such as the vocabulary: counted once per version of it"""
+    key = hashlib.sha256(text.encode('utf-8')).hexdigest()
+    with _token_estimates_lock:
+        count = _token_estimates.get(key)
+        if count is not None:
+            _token_estimates.move_to_end(key)
+            return count
+    count = estimate_tokens(text)
+    with _token_estimates_lock:
+        _token_estimates[key] = count
+        while len(_token_estimates) > TOKEN_ESTIMATE_CACHE_SIZE:
+            _token_estimates.popitem(last=False)
+    return count
+
+
+def load_tag_descriptions(path=HED_SCHEMA_PATH):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+class VocabIndex:
+    """
+    Lexical index over tag names and their hed_schema.json descriptions.
+    Scores tags with an IDF-weighted overlap against the description and
+    renders the selected tags, their ancestors and a shallow slice of their
+    subtrees back into vocabulary XML.
+    """
+
+    def __init__(self, hed_vocab, tag_descriptions=None):
+        self.tree = parse_vocab(hed_vocab)
+        tag_descriptions = tag_descriptions if tag_descriptions is not None else load_tag_descriptions()
+
+        self.postings = defaultdict(list)
+        self.name_tokens = {}
+        for node in self.tree.by_name.values():
+            weights = defaultdict(float)
+            name_tokens = tokenize(node.name)
+            self.name_tokens[node] = set(name_tokens)
+            for token in name_tokens:
+                weights[token] += NAME_WEIGHT
+            for token in tokenize(tag_descriptions.get(node.name) or ''):
+                weights[token] += DESCRIPTION_WEIGHT
+            for token, weight in weights.items():
+                self.postings[token].append((node, weight))
+
+        total = max(1, len(self.tree))
+        self.idf = {token: math.log(1 + total / len(nodes)) for token, nodes in self.postings.items()}
+
+    def score(self, description):
+        """Return (node, score) pairs for tags sharing terms with the description, best first"""
+        query = set(tokenize(description))
+        scores = defaultdict(float)
+        for token in query:
+            for node, weight in self.postings.get(token, ()):
+                scores[node] += weight * self.idf[token]
+        for node in list(scores):
+            # Multi-word tag names fully present in the description (e.g. "computer screen")
+            name_tokens = self.name_tokens[node]
+            if len(name_tokens) > 1 and name_tokens <= query:
+                scores[node] *= 2
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0].order))
+
+    def select(self, description, top_k=DEFAULT_TOP_K, subtree_depth=DEFAULT_SUBTREE_DEPTH):
+        """Return the set of nodes to render for a description"""
+        selected = set()
+        for node, _ in self.score(description)[:top_k]:
+            selected.add(node)
+            selected.update(node.ancestors())
+            frontier = [node]
+            for _ in range(subtree_depth):
+                frontier = [child for parent in frontier for child in parent.children]
+                selected.update(frontier)
+            # Value placeholders are part of how a tag is used, always keep them
+            selected.update(child for child in node.children if child.name == '#')
+        return selected
+
+    def render_for(self, description, top_k=DEFAULT_TOP_K, subtree_depth=DEFAULT_SUBTREE_DEPTH):
+        """Render the pruned vocabulary for a description; returns (xml, tag_count)"""
+        selected = self.select(description, top_k, subtree_depth)
+        if not selected:
+            return self.tree.render(), len(self.tree)
+        return self.tree.render(selected), sum(1 for node in selected if node.name != '#')
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_vocab_index(hed_vocab):
+    """Return the index for this vocab text, building it once per vocab version"""
+    key = hashlib.sha256(hed_vocab.encode('utf-8')).hexdigest()
+    with _indexes_lock:
+        index = _indexes.get(key)
+    if index is None:
+        index = VocabIndex(hed_vocab)
+        with _indexes_lock:
+            # Only the current vocab version is worth keeping
+            _indexes.clear()
+            _indexes[key] = index
+    return index
+
+
+def prune_vocab(hed_vocab, description, top_k=DEFAULT_TOP_K, subtree_depth=DEFAULT_SUBTREE_DEPTH):
+    """Return (pruned_vocab_xml, tag_count) for a description"""
+    return get_vocab_index(hed_vocab).render_for(description, top_k, subtree_depth)
@@ -0,0 +1,11 @@
+"""WSGI entry point for production servers, e.g. `gunicorn -c web/gunicorn.conf.py`."""
+import sys
+from pathlib import Path
+
+# The app modules import each other by name
+sys.path.insert(0, str(Path(__file__).parent))
+
+from app import app, requeue_unfinished_scoring  # noqa: E402
+
+# The scoring queue lives in memory, so jobs queued before a restart are picked up again from the store
+requeue_unfinished_scoring()